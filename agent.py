@@ -1,31 +1,119 @@
+import asyncio
 import os
 import random
 import json
+import re
+import sys
+import threading
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from prompt import PROMPT
+from mastery import LETTER_INDEX, MasteryModel, difficulty_for
+from phonics_scoring import PronunciationMatch, PronunciationScorer
+from prompt import PromptCompiler
 from livekit import agents
 from livekit.agents import AgentSession, Agent
-from livekit.plugins.turn_detector import EOUPlugin
-from livekit.plugins import openai
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
-import asyncio
-import threading
-import logging
-from typing import Optional
 
 
 load_dotenv()
-plugin = EOUPlugin()
-plugin.download_files()
+
+_turn_detector = None
+_turn_detector_lock = threading.Lock()
+
+
+def get_turn_detector():
+    """End-of-utterance plugin with its model files in place, created on first use.
+
+    Importing this module no longer downloads anything; the agent worker
+    calls this when a session starts, and `python agent.py warmup` runs it
+    ahead of time (e.g. while building an image).
+    """
+    global _turn_detector
+    if _turn_detector is None:
+        with _turn_detector_lock:
+            if _turn_detector is None:
+                from livekit.plugins.turn_detector import EOUPlugin
+
+                plugin = EOUPlugin()
+                plugin.download_files()
+                _turn_detector = plugin
+    return _turn_detector
+
+
+class EntityExtractor:
+    """Precompiled, single-pass extraction of names, letters and difficulty cues
+
+    Rules are phrases of one or more words, stored in a word trie. A scan
+    tokenizes the text once with a precompiled pattern and walks the trie
+    from each token, so the cost per turn depends on the length of the
+    text, not on how many rules are registered.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+    DEFAULT_RULES = [
+        # (phrase, kind, capture)  capture: word after the phrase that becomes the value
+        ("my name is", 'name', 'word'),
+        ("i am", 'name', 'word'),
+        ("i'm", 'name', 'word'),
+        ("call me", 'name', 'word'),
+        ("letter", 'letter', 'letter'),
+        ("hard", 'harder', None),
+        ("difficult", 'harder', None),
+        ("tough", 'harder', None),
+        ("easy", 'easier', None),
+        ("simple", 'easier', None),
+        ("more", 'easier', None),
+    ]
+
+    def __init__(self, rules: Optional[List[tuple]] = None):
+        self._trie: Dict[str, Any] = {}
+        for phrase, kind, capture in (rules if rules is not None else self.DEFAULT_RULES):
+            self.add_rule(phrase, kind, capture)
+
+    def add_rule(self, phrase: str, kind: str, capture: Optional[str] = None):
+        """Register a phrase; capture is None, 'word' or 'letter'"""
+        node = self._trie
+        for token in self.TOKEN_PATTERN.findall(phrase.lower()):
+            node = node.setdefault(token, {})
+        node.setdefault(None, []).append((kind, capture))
+
+    def scan(self, text: str) -> List[tuple]:
+        """Return (kind, value) matches in the order they appear in text"""
+        tokens = self.TOKEN_PATTERN.findall(text)
+        matches = []
+        trie = self._trie
+        for start in range(len(tokens)):
+            node = trie.get(tokens[start])
+            end = start + 1
+            while node is not None:
+                for kind, capture in node.get(None, ()):
+                    if capture is None:
+                        matches.append((kind, tokens[start]))
+                    elif end < len(tokens):
+                        value = tokens[end]
+                        if capture == 'word' or (capture == 'letter' and len(value) == 1 and value.isalpha()):
+                            matches.append((kind, value))
+                if end >= len(tokens):
+                    break
+                node = node.get(tokens[end])
+                end += 1
+        return matches
+
+
+ENTITY_EXTRACTOR = EntityExtractor()
+
+MEMORY_HEADER = "\n=== RECENT CONVERSATION MEMORY ===\n"
+EXCHANGE_HEADERS = [""] + [f"Exchange {i}:\n" for i in range(1, 10)]
+
 
 class MemoryManager:
     """Manages short-term memory for the last 3 user/assistant exchanges"""
     
-    def __init__(self, max_exchanges=3):
+    def __init__(self, max_exchanges=3, store=None, child_id: Optional[str] = None):
         self.max_exchanges = max_exchanges
+        self.store = store  # optional ProgressStore for durable history
+        self.child_id = child_id
         self.exchanges: List[Dict[str, Any]] = []
         self.derived_settings = {
             'child_name': '',
@@ -33,6 +121,45 @@ class MemoryManager:
             'difficulty': 'easy',
             'phonics_progress': []
         }
+        self._rendered: Dict[int, tuple] = {}  # id(exchange) -> ((user, assistant), text)
+        self._settings_block = (None, "")
+        self._progress_by_letter: Dict[str, Dict[str, Any]] = {}
+        self.mastery = MasteryModel()
+
+    def load_history(self):
+        """Seed memory and letter progress for a returning child from the store"""
+        if not self.store or not self.child_id:
+            return
+        history = self.store.load_child(self.child_id, recent=self.max_exchanges)
+        if history.get('mastery'):
+            self.mastery = MasteryModel.from_bytes(history['mastery'])
+        for exchange in history['exchanges']:
+            self.exchanges.append(exchange)
+            self._update_derived_settings(exchange)
+        for letter, totals in sorted(history['letters'].items()):
+            entry = {'letter': letter, 'attempts': totals['attempts'], 'correct': totals['correct']}
+            if letter in LETTER_INDEX:
+                entry['mastery'] = round(self.mastery.probability(letter), 3)
+            self._progress_by_letter[letter] = entry
+            self.derived_settings['phonics_progress'].append(entry)
+
+    def record_attempt(self, letter: str, correct: bool):
+        """Count one graded attempt at a letter and update its mastery estimate"""
+        letter = letter.upper()
+        entry = self._progress_by_letter.get(letter)
+        if entry is None:
+            entry = self._progress_by_letter[letter] = {'letter': letter, 'attempts': 0, 'correct': 0}
+            self.derived_settings['phonics_progress'].append(entry)
+        entry['attempts'] += 1
+        entry['correct'] += int(bool(correct))
+        if letter in LETTER_INDEX:
+            known = self.mastery.update(letter, correct)
+            entry['mastery'] = round(known, 3)
+            self.derived_settings['difficulty'] = difficulty_for(known)
+        if self.store and self.child_id:
+            self.store.record_attempt(self.child_id, letter, correct)
+            if letter in LETTER_INDEX:
+                self.store.record_mastery(self.child_id, self.mastery.to_bytes())
     
     def add_exchange(self, user_input: str, assistant_response: str = ""):
         """Add a new user/assistant exchange"""
@@ -43,68 +170,96 @@ class MemoryManager:
         }
         
         self.exchanges.append(exchange)
+        if self.store and self.child_id:
+            self.store.record_exchange(self.child_id, exchange['user'], exchange['assistant'], exchange['timestamp'])
         
         # Keep only the last N exchanges
         if len(self.exchanges) > self.max_exchanges:
+            for dropped in self.exchanges[:-self.max_exchanges]:
+                self._rendered.pop(id(dropped), None)
             self.exchanges = self.exchanges[-self.max_exchanges:]
-        self._update_derived_settings()
+        self._update_derived_settings(exchange)
     
-    def _update_derived_settings(self):
-        """Extract personalized settings from conversation history"""
-        recent_text = " ".join([
-            f"{ex['user']} {ex['assistant']}" for ex in self.exchanges[-3:]
-        ]).lower()
-        
-        # Extract child's name (simple pattern matching)
-        import re
-        name_patterns = [
-            r"my name is (\w+)",
-            r"i am (\w+)",
-            r"i'm (\w+)",
-            r"call me (\w+)"
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, recent_text)
-            if match:
-                self.derived_settings['child_name'] = match.group(1).title()
-                break
-        
-        # Detect focus letter
-        letter_mentions = re.findall(r'\bletter ([a-z])\b', recent_text)
-        if letter_mentions:
-            self.derived_settings['focus_letter'] = letter_mentions[-1].upper()
-        
-        # Assess difficulty based on responses
-        if any(word in recent_text for word in ['hard', 'difficult', 'tough']):
+    def _update_derived_settings(self, exchange: Dict[str, Any]):
+        """Update personalized settings from the newly added exchange only"""
+        text = f"{exchange['user']} {exchange['assistant']}".lower()
+
+        name = None
+        letter = None
+        harder = easier = False
+        for kind, value in ENTITY_EXTRACTOR.scan(text):
+            if kind == 'name':
+                name = name or value
+            elif kind == 'letter':
+                letter = value
+            elif kind == 'harder':
+                harder = True
+            elif kind == 'easier':
+                easier = True
+
+        # Extract child's name
+        if name:
+            self.derived_settings['child_name'] = name.title()
+
+        # Detect focus letter (the most recent mention wins); start at its mastery level
+        if letter:
+            self.derived_settings['focus_letter'] = letter.upper()
+            if letter.upper() in LETTER_INDEX:
+                self.derived_settings['difficulty'] = difficulty_for(self.mastery.probability(letter))
+
+        # The child's own words override the estimate
+        if harder:
             self.derived_settings['difficulty'] = 'easy'
-        elif any(word in recent_text for word in ['easy', 'simple', 'more']):
+        elif easier:
             self.derived_settings['difficulty'] = 'medium'
-    
-    def get_context_prompt(self) -> str:
-        """Generate context prompt based on memory"""
-        if not self.exchanges:
-            return ""
-        
-        context = "\n=== RECENT CONVERSATION MEMORY ===\n"
-        for i, exchange in enumerate(self.exchanges[-3:], 1):
-            context += f"Exchange {i}:\n"
-            context += f"Child: {exchange['user']}\n"
-            if exchange['assistant']:
-                context += f"You: {exchange['assistant']}\n"
-            context += "\n"
-        
-       
+
+    def _render_exchange(self, exchange: Dict[str, Any]) -> str:
+        """Render one exchange body, reusing the cached text while it is unchanged"""
+        key = (exchange['user'], exchange['assistant'])
+        cached = self._rendered.get(id(exchange))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        text = f"Child: {exchange['user']}\n"
+        if exchange['assistant']:
+            text += f"You: {exchange['assistant']}\n"
+        text += "\n"
+        self._rendered[id(exchange)] = (key, text)
+        return text
+
+    def _render_settings(self) -> str:
+        """Render the personalization block, cached until a setting changes"""
         settings = self.derived_settings
-        context += "=== PERSONALIZATION SETTINGS ===\n"
+        key = (settings['child_name'], settings['focus_letter'], settings['difficulty'])
+        if self._settings_block[0] == key:
+            return self._settings_block[1]
+        text = "=== PERSONALIZATION SETTINGS ===\n"
         if settings['child_name']:
-            context += f"Child's name: {settings['child_name']}\n"
+            text += f"Child's name: {settings['child_name']}\n"
         if settings['focus_letter']:
-            context += f"Current focus letter: {settings['focus_letter']}\n"
-        context += f"Difficulty level: {settings['difficulty']}\n"
-        context += "====================================\n\n"
-        
-        return context
+            text += f"Current focus letter: {settings['focus_letter']}\n"
+        text += f"Difficulty level: {settings['difficulty']}\n"
+        text += "====================================\n\n"
+        self._settings_block = (key, text)
+        return text
+
+    def get_context_sections(self, max_exchanges: Optional[int] = None) -> List[str]:
+        """Memory context as separately cached sections, newest max_exchanges only"""
+        if not self.exchanges:
+            return []
+        recent = self.exchanges[-3:]
+        if max_exchanges is not None:
+            recent = recent[max(0, len(recent) - max_exchanges):] if max_exchanges else []
+
+        sections = [MEMORY_HEADER]
+        for i, exchange in enumerate(recent, 1):
+            sections.append(EXCHANGE_HEADERS[i] if i < len(EXCHANGE_HEADERS) else f"Exchange {i}:\n")
+            sections.append(self._render_exchange(exchange))
+        sections.append(self._render_settings())
+        return sections
+
+    def get_context_prompt(self) -> str:
+        """Generate context prompt based on memory"""
+        return "".join(self.get_context_sections())
 
 class PhonicsHelper:
     """Helper class for phonics-focused feedback and assessment"""
@@ -167,24 +322,61 @@ class PhonicsHelper:
         'Z': ['zebra', 'zip', 'zoo', 'zero', 'zigzag', 'zucchini']
     }
 
-    
+    # Reply templates; fixed_utterances() expands them for the pre-rendered audio bank
+    FEEDBACK_CORRECT = "Great job! You said the letter {letter} perfectly!"
+    FEEDBACK_RETRY = "Good try! The letter {letter} makes the sound '{sound}'. Can you try again?"
+    FEEDBACK_PRACTICE = "Let's practice the letter {letter} together!"
+    ACTIVITY_EASY = "Let's practice the letter {letter}! Can you say the letter name first? Then we'll practice its sound!"
+    ACTIVITY_MEDIUM = "Great! Now let's try a word that starts with {letter}. Can you say '{word}'?"
+    ACTIVITY_HARD = "Excellent! Can you tell me which word starts with {letter}: '{word}' or 'zebra'?"
+    ACTIVITY_FALLBACK = "Let's work on the letter {letter}!"
+    LETTER_REPLY = ("Excellent! You said the letter {letter}! That letter makes the sound /{lower}/. "
+                    "Can you say the sound /{lower}/ with me?")
+    LETTER_REPLY_LETTERS = ['A', 'B', 'C', 'D', 'E']
+
+    # Minimum edit-distance confidence for an attempt to count as correct
+    MATCH_THRESHOLD = float(os.environ.get("PHONICS_MATCH_THRESHOLD", "0.75"))
+
+    _scorer: Optional[PronunciationScorer] = None
+
+    @classmethod
+    def get_scorer(cls) -> PronunciationScorer:
+        """Scorer over every letter sound and phonics word, built on first use"""
+        if cls._scorer is None:
+            cls._scorer = PronunciationScorer.from_phonics(cls.LETTER_SOUNDS, cls.PHONICS_WORDS)
+        return cls._scorer
+
+    @classmethod
+    def check_pronunciation(cls, letter: str, user_pronunciation: str) -> Optional[bool]:
+        """Whether the attempt is the letter's name or one of its sounds (None for unknown letters)"""
+        letter = letter.upper()
+        if letter not in cls.LETTER_SOUNDS:
+            return None
+        if user_pronunciation.strip().upper() == letter:
+            # The letter's own name, e.g. "A", is a direct match even though it is not one of its sounds
+            return True
+        return cls.get_scorer().letter_confidence(letter, user_pronunciation) >= cls.MATCH_THRESHOLD
+
+    @classmethod
+    def rank_pronunciation(cls, transcript: str, top_k: int = 5) -> List[PronunciationMatch]:
+        """Closest letter sounds and phonics words to what the child said"""
+        return cls.get_scorer().rank(transcript, top_k)
+
     @classmethod
     def get_letter_feedback(cls, letter: str, user_pronunciation: str) -> str:
         """Provide feedback on letter pronunciation"""
         letter = letter.upper()
-        user_pronunciation = user_pronunciation.lower().strip()
-        if letter in cls.LETTER_SOUNDS:
+        is_correct = cls.check_pronunciation(letter, user_pronunciation)
+        if is_correct is not None:
             correct_sounds = cls.LETTER_SOUNDS[letter]
-            # Simple pronunciation check
-            is_correct = any(sound in user_pronunciation for sound in correct_sounds)
 
             if is_correct:
-                return f"Great job! You said the letter {letter} perfectly!"
+                return cls.FEEDBACK_CORRECT.format(letter=letter)
             else:
                 primary_sound = correct_sounds[0]
-                return f"Good try! The letter {letter} makes the sound '{primary_sound}'. Can you try again?"
+                return cls.FEEDBACK_RETRY.format(letter=letter, sound=primary_sound)
         
-        return f"Let's practice the letter {letter} together!"
+        return cls.FEEDBACK_PRACTICE.format(letter=letter)
     
     @classmethod
     def get_phonics_activity(cls, letter: str, difficulty: str = 'easy') -> str:
@@ -192,72 +384,77 @@ class PhonicsHelper:
         letter = letter.upper()
         
         if difficulty == 'easy':
-            return f"Let's practice the letter {letter}! Can you say the letter name first? Then we'll practice its sound!"
+            return cls.ACTIVITY_EASY.format(letter=letter)
         elif difficulty == 'medium':
             words = cls.PHONICS_WORDS.get(letter, [f"{letter.lower()}word"])
             word = random.choice(words[:2])
-            return f"Great! Now let's try a word that starts with {letter}. Can you say '{word}'?"
+            return cls.ACTIVITY_MEDIUM.format(letter=letter, word=word)
         else:  # hard
             words = cls.PHONICS_WORDS.get(letter, [])
             if len(words) >= 2:
                 word1, word2 = random.sample(words, 2)
-                return f"Excellent! Can you tell me which word starts with {letter}: '{word1}' or 'zebra'?"
+                return cls.ACTIVITY_HARD.format(letter=letter, word=word1)
         
-        return f"Let's work on the letter {letter}!"
+        return cls.ACTIVITY_FALLBACK.format(letter=letter)
+
+    @classmethod
+    def get_letter_reply(cls, letter: str) -> Optional[str]:
+        """Tutor reply when the child says one of the practice letters on its own"""
+        letter = letter.strip().upper()
+        if letter not in cls.LETTER_REPLY_LETTERS:
+            return None
+        return cls.LETTER_REPLY.format(letter=letter, lower=letter.lower())
+
+    @classmethod
+    def fixed_utterances(cls) -> List[str]:
+        """Every reply the templates above can produce, for pre-rendering"""
+        utterances = []
+        for letter in cls.LETTER_SOUNDS:
+            words = cls.PHONICS_WORDS.get(letter, [])
+            utterances.append(cls.FEEDBACK_CORRECT.format(letter=letter))
+            utterances.append(cls.FEEDBACK_RETRY.format(letter=letter, sound=cls.LETTER_SOUNDS[letter][0]))
+            utterances.append(cls.ACTIVITY_EASY.format(letter=letter))
+            utterances.extend(cls.ACTIVITY_MEDIUM.format(letter=letter, word=word) for word in words[:2])
+            if len(words) >= 2:
+                utterances.extend(cls.ACTIVITY_HARD.format(letter=letter, word=word) for word in words)
+            else:
+                utterances.append(cls.ACTIVITY_FALLBACK.format(letter=letter))
+        for letter in cls.LETTER_REPLY_LETTERS:
+            utterances.append(cls.get_letter_reply(letter))
+        return list(dict.fromkeys(utterances))
 
 class Assistant(Agent):
-    def __init__(self, child: Dict[str, Any]):
+    def __init__(self, child: Dict[str, Any], progress_store=None):
         self.child_name = child.get('name', 'friend')
-        self.memory = MemoryManager()
+        self.child_id = str(child.get('id') or self.child_name)
+        self.memory = MemoryManager(store=progress_store, child_id=self.child_id)
+        self.memory.load_history()
         self.phonics_helper = PhonicsHelper()
         self.current_activity = None
         self.awaiting_pronunciation = False
         
-        # Enhanced prompt for spicific child
-        intro = f"""
-You are Youssef, a friendly and encouraging phonics tutor for young children. 
-You're working with {self.child_name} today to help them learn letters, sounds, and words.
-
-PHONICS TEACHING GUIDELINES:
-1. Always emphasize both letter NAMES and letter SOUNDS
-2. Provide gentle pronunciation feedback and correction
-3. Use simple, age-appropriate language
-4. Be encouraging and celebrate small wins
-5. Ask the child to repeat sounds and words
-6. Connect letters to familiar words and objects
-7. Adapt difficulty based on the child's responses
-
-INTERACTION STYLE:
-- Speak warmly and enthusiastically
-- Use the child's name when you know it
-- Give specific praise for good attempts
-- Offer gentle corrections with encouragement
-- Keep sessions engaging with variety
-
-Remember: You have access to recent conversation memory to personalize your teaching.
-"""
-        
-        full_prompt = intro + "\n\n" + PROMPT
-        super().__init__(instructions=full_prompt)
+        # Enhanced prompt for spicific child: shared static prefix + child line
+        self.prompt_compiler = PromptCompiler(self.child_name)
+        super().__init__(instructions=self.prompt_compiler.instructions)
 
     def _generate_personalized_prompt(self) -> str:
         """Generate a personalized prompt with memory context"""
-        base_prompt = self.instructions
-        memory_context = self.memory.get_context_prompt()
+        return self.prompt_compiler.compile(self.memory, self.current_activity)
 
-        if self.current_activity:
-            activity_context = f"\nCURRENT ACTIVITY: {self.current_activity}\n"
-            return base_prompt + memory_context + activity_context
-        return base_prompt + memory_context
+    def _grade_letter(self, letter: str, user_input: str) -> str:
+        """Record a graded letter attempt and return the spoken feedback"""
+        is_correct = self.phonics_helper.check_pronunciation(letter, user_input)
+        if is_correct is not None:
+            self.memory.record_attempt(letter, is_correct)
+        return self.phonics_helper.get_letter_feedback(letter, user_input)
 
     async def _analyze_phonics_response(self, user_input: str) -> Optional[str]:
         """Analyze user input for phonics-specific feedback"""
         user_input_lower = user_input.lower().strip()
-        import re
         single_letter = re.match(r'^([a-z])$', user_input_lower)
         if single_letter:
             letter = single_letter.group(1)
-            return self.phonics_helper.get_letter_feedback(letter, user_input_lower)
+            return self._grade_letter(letter, user_input_lower)
         
         # Pattern for letter sounds (phonetic attempts)
         sound_patterns = [
@@ -269,7 +466,7 @@ Remember: You have access to recent conversation memory to personalize your teac
             match = re.search(pattern, user_input_lower)
             if match and self.awaiting_pronunciation:
                 letter = match.group(1).upper()
-                return self.phonics_helper.get_letter_feedback(letter, user_input_lower)
+                return self._grade_letter(letter, user_input_lower)
         
         return None
 
@@ -320,12 +517,18 @@ Remember: You have access to recent conversation memory to personalize your teac
         return {
             'exchanges': self.memory.exchanges[-3:],  # Last 3 exchanges
             'settings': self.memory.derived_settings,
+            'next_letters': self.memory.mastery.next_letters(),
             'current_activity': self.current_activity,
-            'total_exchanges': len(self.memory.exchanges)
+            'total_exchanges': len(self.memory.exchanges),
+            'prompt_tokens': self.prompt_compiler.last_report
         }
 
 async def run_session(child):
+    from livekit.plugins import openai
+
     print(f"Running phonics session for: {child['name']}")
+    # The first call loads (and may download) the model; keep that off the job's event loop
+    await asyncio.to_thread(get_turn_detector)
     assistant = Assistant(child)
     session = AgentSession(
         llm=openai.realtime.RealtimeModel.with_azure(
@@ -352,7 +555,16 @@ async def entrypoint(ctx: agents.JobContext):
     await run_session(child)
 
 if __name__ == '__main__':
-        agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
+    if sys.argv[1:2] == ['warmup']:
+        # Fetch and verify the turn-detector model files, then exit
+        get_turn_detector()
+        print("Turn detector model files are ready")
+    else:
+        # Every room runs as a job in its own process; keep one warm per core so all cores take rooms
+        agents.cli.run_app(agents.WorkerOptions(
+            entrypoint_fnc=entrypoint,
+            num_idle_processes=int(os.environ.get("AGENT_IDLE_PROCESSES", "0")) or os.cpu_count() or 1,
+        ))
 
 
 
@@ -0,0 +1,232 @@
+"""
+ASGI mode for the session control API.
+
+The same routes as server.py, served by FastAPI on uvicorn's event loop.
+LiveKit rooms, TTS streams and playout run as tasks on that loop, so a
+control request awaits the session coroutine directly instead of
+parking a thread on BackgroundLoop, and an idle /events subscriber is
+an asyncio waiter rather than a thread.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 1
+
+Run one worker per uvicorn process. Sessions live in the process that
+started them, and uvicorn's own --workers would spread a session's
+requests across processes that do not hold it. For more cores, run
+supervisor.py: it starts one such process per core and routes every
+request for a session to the same one. The TTS disk cache, the progress
+database and the audio bank are safe to share between them.
+"""
+import asyncio
+import contextlib
+import os
+from typing import Any, Dict, Optional, Set
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from jinja2 import Environment, FileSystemLoader
+
+from metrics import CONTENT_TYPE, REGISTRY
+from transcript import MAX_MESSAGES_PAGE
+from server import (CONTROL_TIMEOUT, DEFAULT_SESSION_ID, LIVEKIT_URL, SAMPLE_CHILD_DATA, session_manager,
+                    student_identity, token_participants, token_response, unknown_rooms, unknown_session)
+
+
+templates = Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))), autoescape=True)
+# Starts and stops that outlived CONTROL_TIMEOUT keep running here; held so they are not collected
+pending_starts: Set[asyncio.Task] = set()
+pending_stops: Set[asyncio.Task] = set()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Starting LiveKit Session Control Server (ASGI)...")
+    yield
+    for task in list(pending_starts):
+        task.cancel()
+    # A stop cut short would leave its room joined
+    await asyncio.gather(*pending_stops, return_exceptions=True)
+    try:
+        await session_manager.shutdown()
+    except Exception as e:
+        print(f"Error during shutdown: {str(e)}")
+
+
+app = FastAPI(title="Phonics Tutor Session Control", lifespan=lifespan)
+
+
+async def _request_body(request: Request) -> Dict[str, Any]:
+    """The JSON body, or {} when there is none"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def _session_id(request: Request, body: Dict[str, Any]) -> str:
+    """Read the session id from the JSON body or query string"""
+    return str(body.get('session_id') or request.query_params.get('session_id') or DEFAULT_SESSION_ID)
+
+
+@app.get('/', response_class=HTMLResponse)
+async def index():
+    """Main page with control buttons"""
+    session = session_manager.get(DEFAULT_SESSION_ID)
+    return templates.get_template('index.html').render(session_active=bool(session and session.active),
+                                                       child_name=SAMPLE_CHILD_DATA['name'])
+
+
+@app.post('/start_session')
+async def start_session(request: Request):
+    """Start the voice tutoring session"""
+    try:
+        body = await _request_body(request)
+        session_id = _session_id(request, body)
+        child_data = {**SAMPLE_CHILD_DATA, **(body.get('child') or {})}
+        task = asyncio.ensure_future(session_manager.start_session(session_id, child_data))
+        try:
+            # shield: a slow room connect keeps going after the response; the client can poll /status
+            success = await asyncio.wait_for(asyncio.shield(task), CONTROL_TIMEOUT)
+        except asyncio.TimeoutError:
+            pending_starts.add(task)
+            task.add_done_callback(pending_starts.discard)
+            return JSONResponse({'status': 'pending', 'session_id': session_id,
+                                 'message': 'Session is still starting, check /status'}, status_code=202)
+        if success:
+            return {'status': 'success', 'session_id': session_id,
+                    'message': f'Session started for {child_data["name"]}'}
+        return JSONResponse({'status': 'error', 'session_id': session_id, 'message': 'Failed to start session'},
+                            status_code=500)
+    except Exception as e:
+        print(f"Error in start_session route: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Error starting session: {str(e)}'}, status_code=500)
+
+
+@app.post('/stop_session')
+async def stop_session(request: Request):
+    """Stop the voice tutoring session"""
+    try:
+        session_id = _session_id(request, await _request_body(request))
+        if session_manager.get(session_id) is None:
+            return JSONResponse(await asyncio.to_thread(unknown_session, session_id), status_code=404)
+        task = asyncio.ensure_future(session_manager.stop_session(session_id))
+        try:
+            # shield: a timed-out stop must still finish, or the room stays joined
+            success = await asyncio.wait_for(asyncio.shield(task), CONTROL_TIMEOUT)
+        except asyncio.TimeoutError:
+            pending_stops.add(task)
+            task.add_done_callback(pending_stops.discard)
+            return JSONResponse({'status': 'pending', 'session_id': session_id,
+                                 'message': 'Session is still stopping, check /status'}, status_code=202)
+        if success:
+            return {'status': 'success', 'session_id': session_id, 'message': 'Session stopped successfully'}
+        return JSONResponse({'status': 'error', 'session_id': session_id, 'message': 'Failed to stop session'},
+                            status_code=500)
+    except Exception as e:
+        print(f"Error in stop_session route: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Error stopping session: {str(e)}'}, status_code=500)
+
+
+@app.post('/get_token')
+async def get_token(request: Request):
+    """Token for the browser to join a session's LiveKit room"""
+    body = await _request_body(request)
+    try:
+        identity = student_identity(body)
+    except ValueError as e:
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=400)
+    room = _session_id(request, body)
+    # Only rooms with a running session, as for /get_tokens
+    if await asyncio.to_thread(unknown_rooms, [(identity, room, None)]):
+        return JSONResponse({'status': 'error', 'message': f'No active session: {room}'},
+                            status_code=404)
+    try:
+        issued = session_manager.tokens.issue(identity, room, name=body.get('name'))
+        return {'status': 'success', 'ws_url': LIVEKIT_URL, **token_response(issued)}
+    except Exception as e:
+        print(f"Error in get_token route: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Error creating token: {str(e)}'}, status_code=500)
+
+
+@app.post('/get_tokens')
+async def get_tokens(request: Request):
+    """Tokens for a whole classroom in one request"""
+    body = await _request_body(request)
+    try:
+        participants = token_participants(body, _session_id(request, body))
+    except ValueError as e:
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=400)
+    # Only rooms with a running session, so the route cannot mint tokens for arbitrary rooms
+    unknown = await asyncio.to_thread(unknown_rooms, participants)
+    if unknown:
+        return JSONResponse({'status': 'error', 'message': f'No active session: {", ".join(unknown)}'},
+                            status_code=404)
+    try:
+        # Signing a classroom's worth of fresh tokens takes tens of ms; keep it off the event loop
+        issued = await asyncio.to_thread(session_manager.tokens.issue_many, participants)
+        return {'status': 'success', 'ws_url': LIVEKIT_URL, 'tokens': [token_response(t) for t in issued]}
+    except Exception as e:
+        print(f"Error in get_tokens route: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Error creating tokens: {str(e)}'}, status_code=500)
+
+
+@app.get('/status')
+async def status(request: Request):
+    """Get current session status"""
+    session_id = _session_id(request, {})
+    session = session_manager.get(session_id)
+    if session is None:
+        # A SQLite read; keep it off the event loop
+        shared = await asyncio.to_thread(session_manager.shared_status, session_id)
+        if shared is not None:
+            # Held by another worker: answer from the shared directory
+            return {'session_id': session_id, 'active': shared['active'], 'room_name': session_id,
+                    'worker': shared['worker'], 'recent_messages': [], 'playout': None}
+    return {
+        'session_id': session_id,
+        'active': bool(session and session.active),
+        'room_name': session_id,
+        'recent_messages': session.transcript.recent(5) if session else [],
+        'playout': session.playout.get_stats() if session and session.playout else None
+    }
+
+
+@app.get('/messages')
+async def get_messages(request: Request, after: Optional[int] = None, limit: int = MAX_MESSAGES_PAGE):
+    """Recent agent messages, or only those after ?after=<cursor>"""
+    try:
+        return session_manager.get_messages(_session_id(request, {}), after, limit)
+    except Exception as e:
+        print(f"Error in messages route: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Error reading messages: {str(e)}'}, status_code=500)
+
+
+@app.get('/sessions')
+async def list_sessions():
+    """List every session held by this worker"""
+    return session_manager.list_sessions()
+
+
+@app.get('/events')
+async def events(request: Request):
+    """Server-Sent Events stream of one session's status, messages and memory"""
+    session_id = _session_id(request, {})
+    stream = session_manager.events.stream_async(session_id, request.headers.get('last-event-id'))
+    if stream is None:
+        return JSONResponse({'status': 'error', 'message': 'Too many event subscribers, poll /status instead'},
+                            status_code=503)
+    return StreamingResponse(stream, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get('/metrics')
+async def metrics():
+    """Turn latency histograms and TTS counters in Prometheus text format"""
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.environ.get("PORT", "8000")),
+                workers=int(os.environ.get("WEB_WORKERS", "1")))
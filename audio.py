@@ -0,0 +1,315 @@
+import asyncio
+import io
+import struct
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from livekit import rtc
+
+
+SAMPLE_RATE = 16000
+NUM_CHANNELS = 1
+SAMPLE_WIDTH = 2  # bytes per PCM16 sample
+
+
+class PCMStreamDecoder:
+    """Turns an arbitrary byte stream of PCM16 into sample-aligned blocks
+
+    Network chunks can end in the middle of a sample and are often tiny.
+    feed() carries the leftover bytes over to the next call and only
+    returns audio once at least min_ms of it is buffered, so every block
+    handed to the audio source is whole samples of a useful size.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, num_channels: int = NUM_CHANNELS, min_ms: int = 10):
+        self.frame_bytes = SAMPLE_WIDTH * num_channels
+        self.min_bytes = max(self.frame_bytes, sample_rate * min_ms // 1000 * self.frame_bytes)
+        self._pending = bytearray()
+
+    def feed(self, chunk: bytes) -> Optional[bytes]:
+        """Add bytes from the stream; return aligned PCM once enough is buffered"""
+        self._pending += chunk
+        if len(self._pending) < self.min_bytes:
+            return None
+        usable = len(self._pending) - len(self._pending) % self.frame_bytes
+        block = bytes(self._pending[:usable])
+        del self._pending[:usable]
+        return block
+
+    def flush(self) -> Optional[bytes]:
+        """Return whatever whole samples remain at the end of the stream"""
+        usable = len(self._pending) - len(self._pending) % self.frame_bytes
+        block = bytes(self._pending[:usable]) if usable else None
+        self._pending.clear()
+        return block
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def detect_format(data) -> str:
+    """Guess the container from the first bytes: 'wav', 'mp3', 'ogg', 'flac' or 'unknown'"""
+    head = bytes(data[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:3] == b'ID3' or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:4] == b'fLaC':
+        return 'flac'
+    return 'unknown'
+
+
+def parse_wav(data):
+    """Parse a RIFF/WAVE buffer in-process.
+
+    Returns (samples, sample_rate, num_channels) where samples is a NumPy
+    view over the data chunk (no copy) with one column per channel
+    interleaved. Streamed WAVs with a zero or 0xFFFFFFFF data size use the
+    rest of the buffer.
+    """
+    view = memoryview(data).cast('B')
+    if len(view) < 12 or bytes(view[:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError("not a RIFF/WAVE buffer")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        (chunk_size,) = struct.unpack_from('<I', view, offset + 4)
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            format_tag, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', view, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                (format_tag,) = struct.unpack_from('<H', view, body + 24)
+            fmt = (format_tag, channels, rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(len(view), body + chunk_size)
+            format_tag, channels, rate, bits = fmt
+            if format_tag == WAVE_FORMAT_PCM and bits == 16:
+                dtype = np.dtype('<i2')
+            elif format_tag == WAVE_FORMAT_PCM and bits == 8:
+                dtype = np.dtype('u1')
+            elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+                dtype = np.dtype('<i4')
+            elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                dtype = np.dtype('<f4')
+            else:
+                raise ValueError(f"unsupported WAV encoding (format {format_tag}, {bits} bits)")
+            usable = (end - body) - (end - body) % (dtype.itemsize * channels)
+            samples = np.frombuffer(view[body:body + usable], dtype=dtype)
+            return samples, rate, channels
+        offset = body + chunk_size + (chunk_size & 1)  # chunks are word aligned
+    raise ValueError("WAV buffer has no data chunk")
+
+
+def to_int16_mono(samples: np.ndarray, num_channels: int) -> np.ndarray:
+    """Mix interleaved samples down to mono and convert to int16, copying only when needed"""
+    scale = _full_scale_for(samples.dtype)
+    if num_channels > 1:
+        mixed = samples.reshape(-1, num_channels).mean(axis=1, dtype=np.float32)
+        return _float_to_int16(mixed, scale=scale)
+    if samples.dtype == np.dtype('<i2'):
+        return samples
+    return _float_to_int16(samples.astype(np.float32), scale=scale)
+
+
+def _full_scale_for(dtype) -> float:
+    """Factor that maps a sample type onto int16 full scale"""
+    if dtype == np.dtype('u1'):
+        return 256.0
+    if dtype == np.dtype('<i4'):
+        return 1.0 / 65536.0
+    if dtype == np.dtype('<f4'):
+        return 32767.0
+    return 1.0
+
+
+def _float_to_int16(samples: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    if scale == 256.0:  # unsigned 8-bit is centered on 128
+        samples = samples - 128.0
+    if scale != 1.0:
+        samples = samples * scale
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def resample_linear(samples: np.ndarray, src_rate: int, dst_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Vectorized linear-interpolation resampling of mono int16 audio"""
+    if src_rate == dst_rate or samples.size == 0:
+        return samples
+    out_len = int(round(samples.size * dst_rate / src_rate))
+    positions = np.arange(out_len, dtype=np.float64) * (src_rate / dst_rate)
+    resampled = np.interp(positions, np.arange(samples.size, dtype=np.float64), samples)
+    return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+
+def _decode_with_ffmpeg(data, fmt: str, sample_rate: int) -> np.ndarray:
+    """Fallback for compressed formats: pydub spawns ffmpeg for these"""
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(bytes(data)), format=fmt if fmt != 'unknown' else None)
+    audio = audio.set_frame_rate(sample_rate).set_channels(1).set_sample_width(SAMPLE_WIDTH)
+    return np.frombuffer(audio.raw_data, dtype=np.int16)
+
+
+def decode_to_pcm16(data, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode WAV/MP3/OGG/FLAC bytes to mono int16 samples at sample_rate.
+
+    WAV is parsed in-process; only compressed formats go through ffmpeg.
+    """
+    fmt = detect_format(data)
+    if fmt == 'wav':
+        samples, rate, channels = parse_wav(data)
+        return resample_linear(to_int16_mono(samples, channels), rate, sample_rate)
+    return _decode_with_ffmpeg(data, fmt, sample_rate)
+
+
+def pcm_bytes(samples: np.ndarray) -> memoryview:
+    """Byte view over int16 samples, suitable for rtc.AudioFrame without a copy"""
+    return memoryview(np.ascontiguousarray(samples)).cast('B')
+
+
+class PlayoutScheduler:
+    """Real-time paced playout of PCM16 through an rtc.AudioSource
+
+    Audio is cut into fixed frame_ms frames and held in a small bounded
+    queue. A single consumer task hands frames to the source on a
+    wall-clock schedule, staying at most lead_ms ahead, so memory stays
+    flat for long utterances and flush() silences the tutor at frame
+    granularity.
+    """
+
+    def __init__(self, source, sample_rate: int = SAMPLE_RATE, num_channels: int = NUM_CHANNELS,
+                 frame_ms: int = 20, max_buffer_ms: int = 200, lead_ms: int = 60):
+        self.source = source
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.frame_ms = frame_ms
+        self.samples_per_frame = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.samples_per_frame * num_channels * SAMPLE_WIDTH
+        self.frame_duration = frame_ms / 1000
+        self.lead = lead_ms / 1000
+        # Items are (frame, on_sent): on_sent is called once the frame reaches the source
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=max(1, max_buffer_ms // frame_ms))
+        self._task: Optional[asyncio.Task] = None
+        self._open_utterances = 0
+        self._sent_in_utterance = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.underruns = 0
+
+    def start(self):
+        """Start the consumer task on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def begin_utterance(self):
+        """Mark that a producer is about to feed audio; gaps after this count as underruns"""
+        self._open_utterances += 1
+
+    def end_utterance(self):
+        """Mark the end of one producer's audio"""
+        self._open_utterances = max(0, self._open_utterances - 1)
+        if not self._open_utterances:
+            self._sent_in_utterance = False
+
+    def _make_frame(self, data) -> rtc.AudioFrame:
+        return rtc.AudioFrame(
+            data=data,
+            sample_rate=self.sample_rate,
+            num_channels=self.num_channels,
+            samples_per_channel=self.samples_per_frame,
+        )
+
+    async def feed(self, pcm, on_first_frame: Optional[Callable[[], None]] = None):
+        """Queue PCM16 for playout, waiting whenever the buffer is full.
+
+        on_first_frame is called when the first frame of this block has
+        actually been handed to the source.
+        """
+        view = memoryview(pcm).cast('B')
+        whole = len(view) - len(view) % self.frame_bytes
+        for offset in range(0, whole, self.frame_bytes):
+            await self._queue.put((self._make_frame(view[offset:offset + self.frame_bytes]), on_first_frame))
+            on_first_frame = None
+        if whole < len(view):
+            # Pad the trailing partial frame with silence so every frame has the same length
+            tail = bytearray(self.frame_bytes)
+            tail[:len(view) - whole] = view[whole:]
+            await self._queue.put((self._make_frame(tail), on_first_frame))
+
+    def flush(self) -> int:
+        """Drop every queued frame, e.g. when the student interrupts"""
+        dropped = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            self._queue.task_done()
+            dropped += 1
+        self.frames_dropped += dropped
+        clear_queue = getattr(self.source, "clear_queue", None)
+        if clear_queue is not None:
+            clear_queue()  # and whatever the source already buffered for the room
+        return dropped
+
+    async def drain(self):
+        """Wait until every queued frame has been handed to the source"""
+        await self._queue.join()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_deadline = None
+        while True:
+            if self._queue.empty() and self._open_utterances and self._sent_in_utterance:
+                self.underruns += 1
+            frame, on_sent = await self._queue.get()
+            try:
+                now = loop.time()
+                if next_deadline is None or now > next_deadline:
+                    # Idle or starved: restart the clock instead of bursting to catch up
+                    next_deadline = now
+                ahead = next_deadline - now - self.lead
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+                await self.source.capture_frame(frame)
+                self.frames_sent += 1
+                if on_sent is not None:
+                    on_sent()
+                self._sent_in_utterance = bool(self._open_utterances)
+                next_deadline += self.frame_duration
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error capturing audio frame: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        """Stop the consumer and discard pending audio"""
+        self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and counters for status reporting"""
+        return {
+            'frame_ms': self.frame_ms,
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'underruns': self.underruns,
+        }
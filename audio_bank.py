@@ -0,0 +1,206 @@
+"""
+Pre-rendered audio for the tutor's fixed phrases.
+
+Every reply that comes from a template (letter feedback, phonics
+activities, the canned replies to recognized speech) is rendered once,
+offline, into a single pack file:
+
+    python audio_bank.py build              # render into tutor_audio.bank
+    python audio_bank.py info               # show what a pack holds
+
+At runtime the pack is memory-mapped read-only. Opening it reads only the
+header, lookups binary-search a sorted index of cache keys, and the PCM
+is handed to playout as a zero-copy view. Every worker process maps the
+same file, so the audio sits in the page cache once per host.
+
+Pack layout (little endian):
+    header   magic "TUTORBNK", version u32, entry count u32, index offset u64
+    data     PCM16 16 kHz mono blobs, each starting on a 16-byte boundary
+    index    count x (key: 32-byte SHA-256, offset u64, length u64), sorted by key
+"""
+import argparse
+import asyncio
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+MAGIC = b"TUTORBNK"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+INDEX_DTYPE = np.dtype([('key', 'S32'), ('offset', '<u8'), ('length', '<u8')])
+ALIGNMENT = 16
+DEFAULT_PATH = "tutor_audio.bank"
+
+
+def write_pack(path: str, entries: Dict[str, bytes]):
+    """Write {cache key (hex): PCM} to path atomically"""
+    keys = sorted(entries)
+    index = np.zeros(len(keys), dtype=INDEX_DTYPE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), 0))
+        for i, key in enumerate(keys):
+            pad = -f.tell() % ALIGNMENT
+            if pad:
+                f.write(bytes(pad))
+            pcm = entries[key]
+            index[i] = (bytes.fromhex(key), f.tell(), len(pcm))
+            f.write(pcm)
+        f.write(bytes(-f.tell() % ALIGNMENT))
+        index_offset = f.tell()
+        f.write(index.tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), index_offset))
+    # Replacing (not rewriting) the file keeps packs mapped by running workers valid
+    os.replace(tmp_path, path)
+
+
+class AudioBank:
+    """Read-only, memory-mapped pack of pre-rendered PCM keyed like the TTS cache"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} audio bank")
+        self._view = memoryview(self._map)
+        self._index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+        self._keys = self._index['key']
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["AudioBank"]:
+        """Open AUDIO_BANK_PATH (default tutor_audio.bank) if it exists; empty disables the bank"""
+        path = os.environ.get("AUDIO_BANK_PATH", DEFAULT_PATH)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            bank = cls(path)
+            print(f"Audio bank loaded: {len(bank)} phrases from {path}")
+            return bank
+        except (OSError, ValueError) as e:
+            print(f"Error loading audio bank: {str(e)}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str) -> Optional[memoryview]:
+        """PCM for a TTS cache key, as a view into the mapped file"""
+        digest = bytes.fromhex(key)
+        i = int(np.searchsorted(self._keys, digest))
+        if i < len(self._keys) and self._keys[i] == digest:
+            self.stats['hits'] += 1
+            offset, length = int(self._index[i]['offset']), int(self._index[i]['length'])
+            return self._view[offset:offset + length]
+        self.stats['misses'] += 1
+        return None
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            **self.stats,
+            'entries': len(self),
+            'bytes': int(self._index['length'].sum()) if len(self) else 0,
+            'path': self.path,
+        }
+
+
+def fixed_phrases() -> List[str]:
+    """Every tutor reply that does not depend on the child or the conversation"""
+    from agent import PhonicsHelper
+    from server import DEFAULT_STUDENT_REPLY, STUDENT_REPLIES
+
+    phrases = PhonicsHelper.fixed_utterances()
+    phrases += [reply for _, reply in STUDENT_REPLIES] + [DEFAULT_STUDENT_REPLY]
+    return list(dict.fromkeys(phrases))
+
+
+async def render_phrases(phrases: List[str], concurrency: int) -> Dict[str, bytes]:
+    """Cache key -> PCM for every phrase, from the TTS cache or ElevenLabs"""
+    import httpx
+    from tts import (ELEVENLABS_API_URL, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT,
+                     ELEVENLABS_VOICE_ID, ELEVENLABS_VOICE_SETTINGS)
+    from tts_cache import TTSCache
+
+    cache = TTSCache.from_env()
+    api_key = os.environ.get("ELEVEN_API_KEY")
+    url = f"{ELEVENLABS_API_URL}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}/stream"
+    gate = asyncio.Semaphore(concurrency)
+    rendered: Dict[str, bytes] = {}
+    counts = {'cached': 0, 'rendered': 0, 'failed': 0}
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0)) as client:
+        async def render(text: str):
+            key = cache.make_key(text, ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_VOICE_SETTINGS)
+            pcm = await cache.get(key)
+            if pcm is not None:
+                rendered[key] = pcm
+                counts['cached'] += 1
+                return
+            if not api_key:
+                counts['failed'] += 1
+                return
+            async with gate:
+                try:
+                    response = await client.post(
+                        url,
+                        params={"output_format": ELEVENLABS_OUTPUT_FORMAT},
+                        headers={"Content-Type": "application/json", "xi-api-key": api_key},
+                        json={"text": text, "model_id": ELEVENLABS_MODEL_ID,
+                              "voice_settings": ELEVENLABS_VOICE_SETTINGS},
+                    )
+                except httpx.HTTPError as e:
+                    print(f"Error rendering {text!r}: {str(e)}")
+                    counts['failed'] += 1
+                    return
+            if response.status_code != 200 or not response.content:
+                print(f"ElevenLabs API error for {text!r}: {response.status_code}")
+                counts['failed'] += 1
+                return
+            pcm = response.content[:len(response.content) // 2 * 2]
+            rendered[key] = pcm
+            await cache.put(key, pcm)
+            counts['rendered'] += 1
+
+        await asyncio.gather(*(render(text) for text in phrases))
+
+    print(f"{counts['rendered']} rendered, {counts['cached']} from the TTS cache, {counts['failed']} failed")
+    if not api_key and counts['failed']:
+        print("ELEVEN_API_KEY is not set, so only cached phrases could be packed")
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the pre-rendered audio bank")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--path", default=os.environ.get("AUDIO_BANK_PATH") or DEFAULT_PATH,
+                        help="pack file (default AUDIO_BANK_PATH or tutor_audio.bank)")
+    parser.add_argument("--concurrency", type=int, default=4, help="TTS requests in flight while building")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        phrases = fixed_phrases()
+        print(f"Rendering {len(phrases)} fixed phrases...")
+        entries = asyncio.run(render_phrases(phrases, args.concurrency))
+        write_pack(args.path, entries)
+        seconds = sum(len(pcm) for pcm in entries.values()) / 2 / 16000
+        print(f"Wrote {len(entries)} phrases ({seconds:.0f} s of audio) to {args.path} "
+              f"in {time.perf_counter() - t0:.1f} s")
+    else:
+        bank = AudioBank(args.path)
+        stats = bank.get_stats()
+        print(f"{args.path}: {stats['entries']} phrases, {stats['bytes'] / 1024 / 1024:.1f} MiB, "
+              f"{stats['bytes'] / 2 / 16000:.0f} s of audio")
+
+
+if __name__ == '__main__':
+    main()
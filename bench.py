@@ -0,0 +1,408 @@
+"""
+Micro-benchmarks for the tutor's per-turn code paths.
+
+    python bench.py                              # run everything
+    python bench.py extraction scoring           # run some benchmarks
+    python bench.py --json results.json          # save results
+    python bench.py --save-baseline              # store results as the baseline
+    python bench.py --threshold 0.25             # fail if a case is >25% slower than the baseline
+    python bench.py --no-baseline                # only measure and check BUDGETS
+
+Every benchmark reports the fastest seconds per call of several timed
+runs, the one least disturbed by other load on the machine, with the GC
+paused and random seeded so runs are repeatable. A benchmark with a case
+over the threshold is re-run (--retries, default 2) and each case keeps
+its fastest time, so only a slowdown that persists fails. The audio
+benchmarks decode fixtures/tutor_phrase.wav (1.5 s, 24 kHz mono), which
+takes the same resample path as a fallback-provider clip.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+SAMPLE_TURNS = [
+    ("Hi, my name is Emma", "Hello Emma! Let's practice the letter A."),
+    ("buh buh", "Great try! The letter B makes the sound buh."),
+    ("this is hard", "That's okay, let's go slowly with the letter C."),
+    ("can we do more", "Sure! Let's try the letter D next."),
+    ("I'm ready", "Wonderful! Say the letter E with me."),
+]
+
+
+def time_per_call(fn: Callable[[], None], repeat: int = 9, number: int = 2000) -> float:
+    """Fastest seconds per call over `repeat` runs of `number` calls, with the GC paused as timeit does"""
+    runs = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            runs.append((time.perf_counter() - t0) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(runs)
+
+
+def drive(coro):
+    """Run a coroutine that never suspends, without event loop overhead"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("benchmarked coroutine suspended")
+
+
+def filled_memory():
+    """MemoryManager holding the sample conversation"""
+    from agent import MemoryManager
+
+    memory = MemoryManager()
+    for user, assistant in SAMPLE_TURNS:
+        memory.add_exchange(user, assistant)
+    return memory
+
+
+def bench_extraction() -> Dict[str, float]:
+    """Per-turn MemoryManager.add_exchange cost as the extraction rule set grows"""
+    import agent
+    from agent import EntityExtractor, MemoryManager
+
+    results = {}
+    default_extractor = agent.ENTITY_EXTRACTOR
+    try:
+        for extra_rules in (0, 100, 1000, 10000):
+            extractor = EntityExtractor()
+            for i in range(extra_rules):
+                extractor.add_rule(f"cue{i} word{i % 7}", 'custom', None)
+            agent.ENTITY_EXTRACTOR = extractor
+
+            memory = MemoryManager()
+            turns = iter(SAMPLE_TURNS * 1000000)
+
+            def one_turn():
+                user, assistant = next(turns)
+                memory.add_exchange(user, assistant)
+
+            rule_count = len(EntityExtractor.DEFAULT_RULES) + extra_rules
+            results[f"add_exchange[{rule_count}_rules]"] = time_per_call(one_turn)
+    finally:
+        agent.ENTITY_EXTRACTOR = default_extractor
+    return results
+
+
+SAMPLE_TRANSCRIPTS = ["buh", "zeebra", "I said kuh", "I want the elefant please"]
+
+
+def bench_scoring() -> Dict[str, float]:
+    """PronunciationScorer.rank cost on the real inventory and a 100x synthetic one"""
+    from agent import PhonicsHelper
+    from phonics_scoring import PronunciationScorer, _pair_confidence
+
+    base = PronunciationScorer.from_phonics(PhonicsHelper.LETTER_SOUNDS, PhonicsHelper.PHONICS_WORDS)
+    entries = list(zip(base.letters, base.texts, base.kinds))
+    suffixes = [''] + [chr(97 + i % 26) + chr(97 + i // 26 % 26) for i in range(99)]
+    large = PronunciationScorer([(letter, text + suffix, kind)
+                                 for suffix in suffixes for letter, text, kind in entries])
+
+    results = {}
+    for scorer in (base, large):
+        for transcript in SAMPLE_TRANSCRIPTS:
+            results[f"rank[{scorer.size}]{transcript!r}"] = time_per_call(
+                lambda: scorer.rank(transcript), number=500)
+            # A transcript never heard before: no cached shortlist or distances
+            results[f"rank_cold[{scorer.size}]{transcript!r}"] = time_per_call(
+                lambda: (scorer._scored.clear(), _pair_confidence.cache_clear(), scorer.rank(transcript)),
+                number=200)
+    results[f"letter_confidence[{base.size}]"] = time_per_call(
+        lambda: base.letter_confidence('B', "buh buh"))
+    return results
+
+
+def bench_mastery() -> Dict[str, float]:
+    """MasteryModel.update per attempt and next-letter ranking for a whole school"""
+    import numpy as np
+    from mastery import NUM_LETTERS, MasteryModel, rank_next_letters
+
+    model = MasteryModel()
+    attempts = itertools.cycle([('B', True), ('E', False), ('Q', True), ('B', False)])
+
+    def update():
+        letter, correct = next(attempts)
+        model.update(letter, correct)
+
+    school = np.random.default_rng(0).random((10000, NUM_LETTERS), dtype=np.float32)
+    return {
+        'update': time_per_call(update, number=20000),
+        'rank[10000]': time_per_call(lambda: rank_next_letters(school), number=20),
+    }
+
+
+def bench_memory() -> Dict[str, float]:
+    """MemoryManager.add_exchange and get_context_prompt"""
+    memory = filled_memory()
+    turns = iter(SAMPLE_TURNS * 1000000)
+
+    def one_turn():
+        user, assistant = next(turns)
+        memory.add_exchange(user, assistant)
+
+    return {
+        'add_exchange': time_per_call(one_turn),
+        'get_context_prompt': time_per_call(memory.get_context_prompt),
+    }
+
+
+def bench_analysis() -> Dict[str, float]:
+    """Assistant._analyze_phonics_response on letter, sound and chat turns"""
+    from agent import Assistant
+
+    assistant = Assistant({'name': 'Emma'})
+    assistant.awaiting_pronunciation = True
+    results = {}
+    for user_input in ("b", "buh buh", "can we do more"):
+        results[f"analyze[{user_input!r}]"] = time_per_call(
+            lambda: drive(assistant._analyze_phonics_response(user_input)))
+    return results
+
+
+def bench_prompt() -> Dict[str, float]:
+    """Assistant._generate_personalized_prompt, unchanged and after a new exchange"""
+    from agent import Assistant
+
+    assistant = Assistant({'name': 'Emma'})
+    assistant.memory = filled_memory()
+    assistant.current_activity = "Let's practice the letter B! Can you say the letter name first?"
+    turns = iter(SAMPLE_TURNS * 1000000)
+
+    def new_turn():
+        user, assistant_text = next(turns)
+        assistant.memory.add_exchange(user, assistant_text)
+        assistant._generate_personalized_prompt()
+
+    return {
+        'compile[unchanged]': time_per_call(assistant._generate_personalized_prompt),
+        'compile[new_exchange]': time_per_call(new_turn),
+    }
+
+
+def bench_phonics() -> Dict[str, float]:
+    """PhonicsHelper.get_letter_feedback and get_phonics_activity"""
+    from agent import PhonicsHelper
+
+    results = {}
+    for letter, attempt in (('B', "buh"), ('E', "buh"), ('Q', "kwuh kwuh")):
+        results[f"feedback[{letter}:{attempt!r}]"] = time_per_call(
+            lambda: PhonicsHelper.get_letter_feedback(letter, attempt))
+    for difficulty in ('easy', 'medium', 'hard'):
+        results[f"activity[{difficulty}]"] = time_per_call(
+            lambda: PhonicsHelper.get_phonics_activity('B', difficulty))
+    return results
+
+
+def bench_audio() -> Dict[str, float]:
+    """Fixture decode and the decode + framing path of TutorSession._publish_audio_data"""
+    from audio import PlayoutScheduler, decode_to_pcm16, pcm_bytes
+    from loadtest import StubRoom, stub_audio_factory
+    from server import SessionManager, TutorSession
+    from tts_cache import TTSCache
+
+    with open(os.path.join(FIXTURE_DIR, "tutor_phrase.wav"), 'rb') as f:
+        fixture = f.read()
+
+    # Transcripts in memory only, and no cache files: the benchmark writes nothing to disk
+    os.environ.setdefault("TRANSCRIPT_DB_PATH", "")
+    manager = SessionManager(room_factory=StubRoom, audio_factory=stub_audio_factory,
+                             tts_cache=TTSCache(max_memory_bytes=0, disk_dir=None))
+    # No consumer task runs and the queue never fills, so feed() never suspends
+    session = TutorSession("bench", manager)
+    session.audio_source = object()
+    session.playout = PlayoutScheduler(session.audio_source, max_buffer_ms=60 * 60 * 1000)
+
+    def publish():
+        drive(session._publish_audio_data(fixture))
+        session.playout.flush()
+
+    return {
+        'decode[wav_24k_1.5s]': time_per_call(lambda: pcm_bytes(decode_to_pcm16(fixture)), number=200),
+        'publish_audio_data[wav_24k_1.5s]': time_per_call(publish, number=200),
+    }
+
+
+def bench_startup() -> Dict[str, float]:
+    """Cold start of each entry point: a fresh interpreter importing agent.py or server.py"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in ('agent', 'server'):
+        def cold_import():
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=repo_dir, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        results[f"import_{module}"] = time_per_call(cold_import, number=1)
+    results["interpreter"] = time_per_call(
+        lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), number=1)
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, float]]] = {
+    'extraction': bench_extraction,
+    'scoring': bench_scoring,
+    'mastery': bench_mastery,
+    'memory': bench_memory,
+    'analysis': bench_analysis,
+    'prompt': bench_prompt,
+    'phonics': bench_phonics,
+    'audio': bench_audio,
+    'startup': bench_startup,
+}
+
+
+def environment() -> Dict[str, Any]:
+    """Where the numbers came from, saved next to them"""
+    import numpy
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+# Absolute targets (seconds per call) for cases matching a prefix, checked on every run.
+# A transcript never heard before must still score in under a millisecond at 100x the inventory.
+BUDGETS: Dict[str, float] = {
+    'scoring/rank_cold[19700]': 1e-3,
+}
+
+
+def over_budget(results: Dict[str, float]) -> List[str]:
+    """Print and return the cases slower than their target in BUDGETS"""
+    slow = []
+    for key, seconds in results.items():
+        budget = next((b for prefix, b in BUDGETS.items() if key.startswith(prefix)), None)
+        if budget is not None and seconds > budget:
+            print(f"{key:<52} {seconds * 1e6:10.2f} us, over its {budget * 1e6:.0f} us budget")
+            slow.append(key)
+    return slow
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Print current vs baseline per case; return the cases slower than 1 + threshold"""
+    regressions = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = seconds / base
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<52} {base * 1e6:10.2f} -> {seconds * 1e6:10.2f} us  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def run_benchmarks(names: List[str]) -> Dict[str, float]:
+    """{"name/case": seconds} for the named benchmarks, printing each case"""
+    results: Dict[str, float] = {}
+    for name in names:
+        random.seed(0)
+        for case, seconds in BENCHMARKS[name]().items():
+            results[f"{name}/{case}"] = seconds
+            print(f"{name:<12} {case:<40} {seconds * 1e6:10.2f} us")
+    return results
+
+
+def write_report(path: str, results: Dict[str, float]):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Tutor hot-path micro-benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="baseline JSON to compare against (default bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="only measure; skip the baseline comparison")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown vs the baseline before failing (0.25 = 25%%)")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="times to re-run a benchmark with a regressed case before failing")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(args.names or list(BENCHMARKS))
+    if args.json_path:
+        write_report(args.json_path, results)
+    if args.save_baseline:
+        baseline: Dict[str, Any] = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        # Keep cases from benchmarks that were not run this time
+        baseline['environment'] = environment()
+        baseline['results'] = {**baseline.get('results', {}), **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = None
+    if not args.no_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"\nERROR: no baseline at {args.baseline}, so nothing was compared. Record one with "
+                  f"--save-baseline, or pass --no-baseline to only measure.", file=sys.stderr)
+            return 2
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('results', {})
+
+    def check() -> List[str]:
+        failed = over_budget(results)
+        if baseline is not None:
+            print(f"\nCompared with {args.baseline} (threshold +{args.threshold:.0%}):")
+            failed += [key for key in compare(results, baseline, args.threshold) if key not in failed]
+        return failed
+
+    failed = check()
+    for _ in range(args.retries):
+        if not failed:
+            break
+        # A busy moment on a shared machine slows a whole run; a real regression survives a re-run
+        names = list(dict.fromkeys(key.split('/', 1)[0] for key in failed))
+        print(f"\nRe-running {', '.join(names)} to confirm:")
+        for key, seconds in run_benchmarks(names).items():
+            results[key] = min(results[key], seconds)
+        if args.json_path:
+            write_report(args.json_path, results)
+        failed = check()
+    if failed:
+        print(f"{len(failed)} case(s) regressed or over budget: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
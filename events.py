@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+EVENT_BACKLOG = int(os.environ.get("EVENT_BACKLOG", "64"))  # events kept per session for slow readers
+EVENT_KEEPALIVE = float(os.environ.get("EVENT_KEEPALIVE", "15"))  # seconds between idle heartbeats
+MAX_EVENT_SUBSCRIBERS = int(os.environ.get("MAX_EVENT_SUBSCRIBERS", "5000"))
+# Flask streams each hold a server thread for as long as the tab is open
+MAX_THREADED_EVENT_SUBSCRIBERS = int(os.environ.get("MAX_THREADED_EVENT_SUBSCRIBERS", "200"))
+
+
+class EventChannel:
+    """Recent events for one session, read by any number of subscribers
+
+    Publishing appends to a bounded ring and wakes the waiting readers;
+    it never blocks on a subscriber and costs the same with one reader or
+    thousands. Each subscriber only holds a cursor (the last sequence
+    number it sent). A reader that falls further behind than the ring
+    is resynchronized with the latest value of every event type instead
+    of the full backlog, which is the per-client backpressure: a slow
+    tab sees fewer intermediate updates but never grows server memory.
+    """
+
+    def __init__(self, backlog: int = EVENT_BACKLOG):
+        self._events: "deque[Tuple[int, str, str]]" = deque(maxlen=backlog)
+        self._latest: Dict[str, Tuple[int, str]] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()  # (loop, asyncio.Event) of readers parked in read_async
+        self.subscribers = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, event: str, data: Any):
+        # Encoded once here rather than once per subscriber
+        payload = json.dumps(data, default=str)
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, payload))
+            self._latest[event] = (self._seq, payload)
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def snapshot(self) -> List[Tuple[int, str, str]]:
+        """Latest value of every event type, oldest first"""
+        with self._cond:
+            return sorted((seq, event, data) for event, (seq, data) in self._latest.items())
+
+    def read(self, after: int, timeout: Optional[float] = None) -> List[Tuple[int, str, str]]:
+        """(seq, event, JSON payload) newer than `after`, waiting up to timeout for one to arrive"""
+        with self._cond:
+            if self._seq <= after:
+                self._cond.wait_for(lambda: self._seq > after, timeout=timeout)
+            if self._seq <= after:
+                return []
+            oldest = self._events[0][0]
+            if after < oldest - 1:
+                # Missed events already fell off the ring: resync from the latest values
+                return sorted((seq, event, data) for event, (seq, data) in self._latest.items() if seq > after)
+            return [item for item in self._events if item[0] > after]
+
+    async def read_async(self, after: int, timeout: Optional[float] = None) -> List[Tuple[int, str, str]]:
+        """read() for asyncio servers: an idle reader is an asyncio.Event, not a thread"""
+        items = self.read(after, timeout=0)
+        if items:
+            return items
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._async_waiters.add(waiter)
+        try:
+            if self._seq <= after:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        return self.read(after, timeout=0)
+
+
+class EventBroadcaster:
+    """Per-session event channels for the /events stream
+
+    A session's channel exists while the session is live (it publishes)
+    or while someone is subscribed. A client can subscribe before the
+    session starts, but that channel is dropped when its last subscriber
+    leaves, so ids that never become sessions cost nothing once their
+    streams close, and at most one channel per open stream meanwhile.
+    """
+
+    def __init__(self, max_subscribers: int = MAX_EVENT_SUBSCRIBERS,
+                 max_threaded_subscribers: int = MAX_THREADED_EVENT_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.max_threaded_subscribers = max_threaded_subscribers
+        self._channels: Dict[str, EventChannel] = {}
+        self._live = set()  # session ids that have published since they last stopped
+        self._lock = threading.Lock()
+        self.subscribers = 0
+        self.threaded_subscribers = 0
+
+    def channel(self, session_id: str) -> EventChannel:
+        """The live session's channel, created on its first event"""
+        channel = self._channels.get(session_id)
+        if channel is None or session_id not in self._live:
+            with self._lock:
+                channel = self._channels.setdefault(session_id, EventChannel())
+                self._live.add(session_id)
+        return channel
+
+    def publish(self, session_id: str, event: str, data: Any):
+        """Safe to call from any thread, including the event loop"""
+        self.channel(session_id).publish(event, data)
+
+    def discard(self, session_id: str):
+        """Forget a finished session's channel; the last subscriber drops it if any are left"""
+        with self._lock:
+            self._live.discard(session_id)
+            channel = self._channels.get(session_id)
+            if channel is not None and not channel.subscribers:
+                del self._channels[session_id]
+
+    def _open(self, session_id: str, threaded: bool) -> Optional[Tuple[EventChannel, Callable[[], None]]]:
+        """Reserve a subscriber slot; returns (channel, release) or None when full"""
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                return None
+            if threaded and self.threaded_subscribers >= self.max_threaded_subscribers:
+                return None
+            channel = self._channels.setdefault(session_id, EventChannel())
+            self.subscribers += 1
+            self.threaded_subscribers += threaded
+            channel.subscribers += 1
+        released = False
+
+        def release():
+            nonlocal released
+            with self._lock:
+                if released:
+                    return
+                released = True
+                self.subscribers -= 1
+                self.threaded_subscribers -= threaded
+                channel.subscribers -= 1
+                if (not channel.subscribers and session_id not in self._live
+                        and self._channels.get(session_id) is channel):
+                    del self._channels[session_id]
+
+        return channel, release
+
+    @staticmethod
+    def _start(channel: EventChannel, last_event_id: Optional[str]):
+        """Initial (pending events, cursor): resume after Last-Event-ID, or the current state"""
+        if last_event_id and last_event_id.isdigit() and int(last_event_id) <= channel.last_seq:
+            return [], int(last_event_id)
+        return channel.snapshot(), channel.last_seq
+
+    @staticmethod
+    def _format(seq: int, event: str, payload: str) -> str:
+        return f"id: {seq}\nevent: {event}\ndata: {payload}\n\n"
+
+    def stream(self, session_id: str, last_event_id: Optional[str] = None, keepalive: float = EVENT_KEEPALIVE):
+        """Generator of Server-Sent Events text for one subscriber.
+
+        A fresh subscriber starts from the session's current state; a
+        reconnecting one (Last-Event-ID) resumes where it left off.
+        Returns None when the subscriber limit is reached.
+
+        Each open stream parks one server thread in EventChannel.read, so
+        under Flask the number of streams is also capped by
+        MAX_THREADED_EVENT_SUBSCRIBERS; serve asgi.py (stream_async) for
+        many viewers.
+        """
+        opened = self._open(session_id, threaded=True)
+        if opened is None:
+            return None
+        channel, release = opened
+
+        def generate():
+            try:
+                yield f"retry: {int(keepalive * 1000)}\n\n"
+                pending, cursor = self._start(channel, last_event_id)
+                while True:
+                    for seq, event, payload in pending:
+                        yield self._format(seq, event, payload)
+                        cursor = max(cursor, seq)
+                    pending = channel.read(cursor, timeout=keepalive)
+                    if not pending:
+                        yield ": keepalive\n\n"  # also how a closed client is noticed
+            finally:
+                release()
+
+        stream = generate()
+        # A generator closed before its first step never runs its finally
+        weakref.finalize(stream, release)
+        return stream
+
+    def stream_async(self, session_id: str, last_event_id: Optional[str] = None,
+                     keepalive: float = EVENT_KEEPALIVE):
+        """Async generator version of stream() for ASGI servers"""
+        opened = self._open(session_id, threaded=False)
+        if opened is None:
+            return None
+        channel, release = opened
+
+        async def generate():
+            try:
+                yield f"retry: {int(keepalive * 1000)}\n\n"
+                pending, cursor = self._start(channel, last_event_id)
+                while True:
+                    for seq, event, payload in pending:
+                        yield self._format(seq, event, payload)
+                        cursor = max(cursor, seq)
+                    pending = await channel.read_async(cursor, timeout=keepalive)
+                    if not pending:
+                        yield ": keepalive\n\n"
+            finally:
+                release()
+
+        stream = generate()
+        weakref.finalize(stream, release)
+        return stream
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'channels': len(self._channels), 'subscribers': self.subscribers,
+                'threaded_subscribers': self.threaded_subscribers}
@@ -0,0 +1,299 @@
+"""
+Load test for the multi-session SessionManager.
+
+Starts many synthetic children inside one process against an in-memory
+stand-in for the LiveKit room and audio track. Tutor speech goes to a
+local fake TTS server (a separate process) with configurable latency and
+payload size. Each child takes turns at a think-time pace, and every
+concurrency level reports turns/sec, time-to-first-audio percentiles,
+CPU and RSS.
+
+    python loadtest.py --sessions 10,50,100 --duration 30
+    python loadtest.py --sessions 200 --tts-latency-ms 300 --audio-ms-per-char 40
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+CHILD_UTTERANCES = ["Hello", "A", "B", "What's that?", "Can you help me?", "I want to learn", "buh", "C"]
+
+
+class StubParticipant:
+    """Local participant that accepts any track"""
+
+    def __init__(self):
+        self.tracks = []
+
+    async def publish_track(self, track):
+        self.tracks.append(track)
+
+
+class StubRoom:
+    """Minimal stand-in for rtc.Room: event registration, connect, disconnect"""
+
+    def __init__(self):
+        self.handlers: Dict[str, List] = {}
+        self.local_participant = StubParticipant()
+        self.connected = False
+
+    def on(self, event: str):
+        def register(fn):
+            self.handlers.setdefault(event, []).append(fn)
+            return fn
+        return register
+
+    def emit(self, event: str, *args):
+        for fn in self.handlers.get(event, []):
+            fn(*args)
+
+    async def connect(self, url: str, token: str):
+        await asyncio.sleep(0)
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+
+class StubAudioSource:
+    """Counts the frames the tutor would have sent"""
+
+    def __init__(self, sample_rate: int = 16000, num_channels: int = 1):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.frames = 0
+        self.first_frame_at: Optional[float] = None  # reset by the child before each turn
+
+    async def capture_frame(self, frame):
+        self.frames += 1
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+
+
+def stub_audio_factory(sample_rate: int = 16000, num_channels: int = 1):
+    return StubAudioSource(sample_rate, num_channels), object()
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeTTSHandler(BaseHTTPRequestHandler):
+    """Answers ElevenLabs-style stream requests with silent PCM16"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    latency = 0.15  # seconds before the first byte
+    jitter = 0.05
+    audio_ms_per_char = 20
+    chunk_ms = 100
+    realtime_factor = 4.0  # audio is produced this many times faster than it plays
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            text = json.loads(body or b"{}").get("text", "")
+        except ValueError:
+            text = ""
+        audio_ms = max(self.chunk_ms, len(text) * self.audio_ms_per_char)
+        chunk = bytes(16 * self.chunk_ms * 2)  # 16 kHz mono PCM16
+        chunks = max(1, audio_ms // self.chunk_ms)
+
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/pcm")
+        self.send_header("Content-Length", str(len(chunk) * chunks))
+        self.end_headers()
+        try:
+            for _ in range(chunks):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                time.sleep(self.chunk_ms / 1000 / self.realtime_factor)
+        except ConnectionError:
+            pass  # the tutor dropped the request, e.g. a hedge that lost the race
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fake_tts(ready, latency_ms: float, jitter_ms: float, audio_ms_per_char: int, realtime_factor: float):
+    """Process entry point: run the fake TTS server and report its port"""
+    FakeTTSHandler.latency = latency_ms / 1000
+    FakeTTSHandler.jitter = jitter_ms / 1000
+    FakeTTSHandler.audio_ms_per_char = audio_ms_per_char
+    FakeTTSHandler.realtime_factor = realtime_factor
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTTSHandler)
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fake_tts(args) -> Tuple[multiprocessing.Process, str]:
+    """Start the fake TTS server in its own process so its CPU is not counted"""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve_fake_tts,
+        args=(ready, args.tts_latency_ms, args.tts_jitter_ms, args.audio_ms_per_char, args.tts_realtime_factor),
+        daemon=True,
+    )
+    process.start()
+    port = ready.get(timeout=10)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def synthetic_child(session, stop_at: float, think: float, ttfa: List[float], turns: List[int]):
+    """Take turns with one tutor session until stop_at, recording time to first audio"""
+    source = session.audio_source
+    # Let the greeting finish before the first turn
+    await asyncio.gather(*list(session.tasks), return_exceptions=True)
+    await session.playout.drain()
+    while True:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+        if time.perf_counter() >= stop_at:
+            return
+        source.first_frame_at = None
+        t0 = time.perf_counter()
+        await session._respond_to_student(random.choice(CHILD_UTTERANCES))
+        await session.playout.drain()
+        if source.first_frame_at is not None:
+            ttfa.append(source.first_frame_at - t0)
+        turns[0] += 1
+
+
+async def run_level(num_sessions: int, args) -> Dict[str, float]:
+    """Bring up num_sessions children, run turns for args.duration, tear down"""
+    from server import SessionManager
+    from tts_cache import TTSCache
+
+    # A cache would answer the tutor's fixed replies after the first turn
+    tts_cache = None if args.tts_cache else TTSCache(max_memory_bytes=0, disk_dir=None)
+    manager = SessionManager(max_sessions=num_sessions,
+                             room_factory=StubRoom,
+                             audio_factory=stub_audio_factory,
+                             tts_cache=tts_cache)
+    gate = asyncio.Semaphore(args.concurrency)
+    start_latencies: List[float] = []
+
+    async def start_one(i: int):
+        async with gate:
+            t0 = time.perf_counter()
+            ok = await manager.start_session(f"loadtest-{i}", {'name': f'Child{i}'})
+            if ok:
+                start_latencies.append(time.perf_counter() - t0)
+
+    rss_before = rss_mb()
+    await asyncio.gather(*(start_one(i) for i in range(num_sessions)))
+    active = manager.active_count
+
+    ttfa: List[float] = []
+    turns = [0]
+    cpu0, t0 = cpu_seconds(), time.perf_counter()
+    stop_at = t0 + args.duration
+    await asyncio.gather(*(synthetic_child(session, stop_at, args.think, ttfa, turns)
+                           for session in list(manager.sessions.values())))
+    elapsed = time.perf_counter() - t0
+    cpu = cpu_seconds() - cpu0
+    rss_after = rss_mb()
+
+    await manager.shutdown()
+    return {
+        'sessions': num_sessions,
+        'active': active,
+        'start_p95_ms': percentile(start_latencies, 95) * 1000,
+        'turns': turns[0],
+        'turns_per_sec': turns[0] / elapsed,
+        'ttfa_p50_ms': percentile(ttfa, 50) * 1000,
+        'ttfa_p95_ms': percentile(ttfa, 95) * 1000,
+        'ttfa_p99_ms': percentile(ttfa, 99) * 1000,
+        'cpu_pct': cpu / elapsed * 100,
+        'rss_mb': rss_after,
+        'rss_per_session_kb': (rss_after - rss_before) * 1024 / max(active, 1),
+    }
+
+
+async def run(levels: List[int], args) -> bool:
+    os.environ.setdefault("LIVEKIT_API_KEY", "loadtest")
+    os.environ.setdefault("LIVEKIT_API_SECRET", "loadtest-secret-loadtest-secret-0")
+    scratch = tempfile.mkdtemp()
+    os.environ.setdefault("PROGRESS_DB_PATH", os.path.join(scratch, "loadtest.db"))
+    os.environ.setdefault("TRANSCRIPT_DB_PATH", os.path.join(scratch, "transcripts.db"))
+    os.environ["ELEVEN_API_KEY"] = "loadtest"
+    os.environ["ELEVENLABS_API_URL"] = args.tts_url
+    os.environ["TTS_PROVIDERS"] = "elevenlabs"  # only the fake server
+    if not args.tts_cache:
+        os.environ["AUDIO_BANK_PATH"] = ""  # the pre-rendered bank would also skip TTS
+
+    print(f"{'sessions':>8} {'active':>6} {'turns':>6} {'turns/s':>8} "
+          f"{'ttfa p50':>9} {'p95':>7} {'p99':>7} {'cpu %':>6} {'rss MiB':>8} {'KiB/sess':>9}")
+    ok = True
+    for num_sessions in levels:
+        output = sys.stdout if args.verbose else open(os.devnull, 'w')
+        with contextlib.redirect_stdout(output):
+            result = await run_level(num_sessions, args)
+        if output is not sys.stdout:
+            output.close()
+        print(f"{result['sessions']:>8} {result['active']:>6} {result['turns']:>6} {result['turns_per_sec']:>8.1f} "
+              f"{result['ttfa_p50_ms']:>7.0f}ms {result['ttfa_p95_ms']:>5.0f}ms {result['ttfa_p99_ms']:>5.0f}ms "
+              f"{result['cpu_pct']:>6.1f} {result['rss_mb']:>8.1f} {result['rss_per_session_kb']:>9.1f}")
+        ok = ok and result['active'] == num_sessions
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-child load test")
+    parser.add_argument("--sessions", default="10,50,100",
+                        help="comma-separated concurrency levels (rooms per level)")
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions starting at once")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of turns per level")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds a child waits between turns")
+    parser.add_argument("--tts-url", default=None, help="use this TTS endpoint instead of the local fake")
+    parser.add_argument("--tts-latency-ms", type=float, default=150, help="fake TTS time to first byte")
+    parser.add_argument("--tts-jitter-ms", type=float, default=50, help="fake TTS latency standard deviation")
+    parser.add_argument("--audio-ms-per-char", type=int, default=20, help="fake TTS audio length per character")
+    parser.add_argument("--tts-realtime-factor", type=float, default=4.0,
+                        help="how much faster than real time the fake TTS streams")
+    parser.add_argument("--tts-cache", action="store_true", help="keep the TTS cache and audio bank enabled")
+    parser.add_argument("--verbose", action="store_true", help="show the tutor's own logging")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.sessions.split(",") if level.strip()]
+    tts_process = None
+    if not args.tts_url:
+        tts_process, args.tts_url = start_fake_tts(args)
+    try:
+        ok = asyncio.run(run(levels, args))
+    finally:
+        if tts_process is not None:
+            tts_process.terminate()
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
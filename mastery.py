@@ -0,0 +1,118 @@
+import os
+import string
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+LETTERS = string.ascii_uppercase
+LETTER_INDEX = {letter: i for i, letter in enumerate(LETTERS)}
+NUM_LETTERS = len(LETTERS)
+
+# Knowledge-tracing parameters, shared by every letter
+P_INIT = float(os.environ.get("MASTERY_P_INIT", "0.2"))  # chance a letter is already known
+P_LEARN = float(os.environ.get("MASTERY_P_LEARN", "0.15"))  # chance one attempt teaches it
+P_SLIP = float(os.environ.get("MASTERY_P_SLIP", "0.1"))  # wrong although known
+P_GUESS = float(os.environ.get("MASTERY_P_GUESS", "0.25"))  # right although not known
+MASTERY_THRESHOLD = float(os.environ.get("MASTERY_THRESHOLD", "0.95"))
+
+DTYPE = np.float32  # 104 bytes of state per child
+
+
+def difficulty_for(p_known: float) -> str:
+    """Activity difficulty for a letter known with probability p_known"""
+    if p_known < 0.5:
+        return 'easy'
+    if p_known < 0.8:
+        return 'medium'
+    return 'hard'
+
+
+class MasteryModel:
+    """Probability that a child knows each letter, updated by Bayesian knowledge tracing
+
+    The state is one fixed float32 array of 26 probabilities. A graded
+    attempt updates a single entry with scalar arithmetic, so a turn costs
+    the same no matter how long the child has practised and allocates no
+    arrays. Stack many children's arrays with `stack` and score them all
+    at once with `score_next_letters` / `rank_next_letters`.
+    """
+
+    __slots__ = ('p',)
+
+    def __init__(self, p: Optional[np.ndarray] = None):
+        self.p = np.full(NUM_LETTERS, P_INIT, dtype=DTYPE) if p is None else np.asarray(p, dtype=DTYPE).copy()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MasteryModel":
+        return cls(np.frombuffer(data, dtype=DTYPE))
+
+    def to_bytes(self) -> bytes:
+        return self.p.tobytes()
+
+    def update(self, letter: str, correct: bool) -> float:
+        """Fold one graded attempt into the letter's probability; returns the new value"""
+        i = LETTER_INDEX[letter.upper()]
+        known = self.p.item(i)
+        if correct:
+            evidence = known * (1.0 - P_SLIP)
+            posterior = evidence / (evidence + (1.0 - known) * P_GUESS)
+        else:
+            evidence = known * P_SLIP
+            posterior = evidence / (evidence + (1.0 - known) * (1.0 - P_GUESS))
+        known = posterior + (1.0 - posterior) * P_LEARN
+        self.p[i] = known
+        return known
+
+    def probability(self, letter: str) -> float:
+        return self.p.item(LETTER_INDEX[letter.upper()])
+
+    def mastered(self, letter: str) -> bool:
+        return self.probability(letter) >= MASTERY_THRESHOLD
+
+    def next_letters(self, top_k: int = 3) -> List[str]:
+        """Letters this child should practise next, best first"""
+        return [LETTERS[i] for i in rank_next_letters(self.p[np.newaxis], top_k)[0]]
+
+    @staticmethod
+    def stack(models: Iterable["MasteryModel"]) -> np.ndarray:
+        """One (children, 26) matrix from many models, for the batch functions"""
+        rows = [model.p for model in models]
+        return np.stack(rows) if rows else np.empty((0, NUM_LETTERS), dtype=DTYPE)
+
+
+def score_next_letters(p: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Practice priority of every letter for every child, from a (children, 26) matrix
+
+    An unmastered letter scores p * (1 - p), the uncertainty of the
+    estimate: a letter the child is halfway through learning comes before
+    one never tried, and both before one nearly mastered. A mastered
+    letter scores -p, so it only comes up for review once every letter is
+    mastered, weakest first.
+    """
+    p = np.asarray(p, dtype=DTYPE)
+    if out is None:
+        out = np.empty_like(p)
+    np.subtract(1, p, out=out)
+    out *= p
+    np.copyto(out, -p, where=p >= MASTERY_THRESHOLD)
+    return out
+
+
+def rank_next_letters(p: np.ndarray, top_k: int = 3) -> np.ndarray:
+    """Letter indices (children, top_k) to practise next, best first; ties go alphabetically"""
+    top_k = max(1, min(top_k, NUM_LETTERS))
+    scores = score_next_letters(p)
+    np.negative(scores, out=scores)
+    # Rows are only 26 wide, so a full stable sort costs little more than argpartition and keeps ties a-z
+    return np.argsort(scores, axis=1, kind='stable')[:, :top_k]
+
+
+def next_letter_report(child_ids: List[str], p: np.ndarray, top_k: int = 3) -> Dict[str, List[Tuple[str, float]]]:
+    """{child_id: [(letter, p_known), ...]} for the nightly report"""
+    ranked = rank_next_letters(p, top_k)
+    known = np.take_along_axis(np.asarray(p, dtype=DTYPE), ranked, axis=1)
+    return {
+        child_id: [(LETTERS[i], round(float(k), 3)) for i, k in zip(row, known_row)]
+        for child_id, row, known_row in zip(child_ids, ranked.tolist(), known.tolist())
+    }
@@ -0,0 +1,238 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; 1.2 is the first-audio SLO so it gets its own bucket edge
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.2, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the (unlabelled) value from function on every scrape"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram, one series per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics one process exposes, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TURNS = REGISTRY.counter("tutor_turns_total", "Tutor utterances started", ["kind"])
+TURN_STAGE_SECONDS = REGISTRY.histogram(
+    "tutor_turn_stage_seconds", "Duration of each stage of a tutor turn", ["stage"])
+FIRST_AUDIO_SECONDS = REGISTRY.histogram(
+    "tutor_first_audio_seconds", "From student audio (or utterance start) to the first frame sent", ["kind"])
+TTS_FIRST_BYTE_SECONDS = REGISTRY.histogram(
+    "tutor_tts_first_byte_seconds", "From TTS request to the first audio byte", ["provider"])
+TTS_ERRORS = REGISTRY.counter("tutor_tts_errors_total", "Failed TTS requests", ["provider"])
+TTS_HEDGES = REGISTRY.counter(
+    "tutor_tts_hedges_total", "Backup TTS requests sent because the first provider was slow", ["provider"])
+TTS_BREAKER_OPEN = REGISTRY.gauge(
+    "tutor_tts_breaker_open", "1 while a TTS provider's circuit breaker is open", ["provider"])
+TTS_CACHE_LOOKUPS = REGISTRY.counter("tutor_tts_cache_lookups_total", "TTS cache lookups", ["result"])
+UTTERANCES_CANCELLED = REGISTRY.counter(
+    "tutor_utterances_cancelled_total", "Tutor utterances cut off or dropped because the student spoke",
+    ["state"])
+ACTIVE_SESSIONS = REGISTRY.gauge("tutor_active_sessions", "Tutoring sessions currently active")
+
+
+class TurnTrace:
+    """Timing spans for one tutor turn, from the student's audio to the first frame sent
+
+    Stages are timed with span() and land in tutor_turn_stage_seconds;
+    first_frame() closes the turn's time-to-first-audio. Every mark is
+    also kept on the trace so a turn can be printed or inspected.
+    """
+
+    def __init__(self, session_id: str, kind: str = "turn", started_at: Optional[float] = None):
+        self.session_id = session_id
+        self.kind = kind
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        TURNS.inc(kind=kind)
+
+    def mark(self, name: str):
+        """Record the first time this point in the turn is reached"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started_at
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time a stage of the turn"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            TURN_STAGE_SECONDS.observe(end - t0, stage=stage)
+            self.marks.setdefault(f"{stage}_done", end - self.started_at)
+
+    def first_frame(self):
+        """Called by the playout scheduler when the turn's first frame is sent"""
+        if "first_frame" in self.marks:
+            return
+        self.mark("first_frame")
+        FIRST_AUDIO_SECONDS.observe(self.marks["first_frame"], kind=self.kind)
+
+    def summary(self) -> Dict[str, float]:
+        """Milliseconds from the start of the turn to each mark"""
+        return {name: round(offset * 1000, 1) for name, offset in self.marks.items()}
@@ -0,0 +1,221 @@
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class PronunciationMatch(NamedTuple):
+    letter: str
+    text: str
+    kind: str  # 'sound' or 'word'
+    confidence: float
+
+
+_WORD = re.compile(r"[a-z]+")
+_MAX_TOKENS = 6  # transcript words scored per utterance
+# Below this many DP cells the NumPy batch costs more in call overhead than
+# it saves, so small jobs (a letter's two or three sounds) run in Python
+_PYTHON_DP_CELLS = 256
+_SCORE_CACHE = 4096  # distinct utterances whose shortlist scores are kept
+
+
+def _encode(text: str) -> List[int]:
+    """Map characters to small ints; 0 is reserved for padding"""
+    return [ord(ch) - 96 if 'a' <= ch <= 'z' else 27 for ch in text]
+
+
+def _bigrams(text: str) -> List[str]:
+    padded = f"^{text}$"
+    return [padded[i:i + 2] for i in range(len(padded) - 1)]
+
+
+@lru_cache(maxsize=65536)
+def _pair_confidence(a: str, b: str) -> float:
+    """1 - Levenshtein distance / length, for jobs too small for the batched version"""
+    previous = list(range(len(b) + 1))
+    for i, ch in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch != other)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+
+class PronunciationScorer:
+    """Ranks a transcript against every letter sound and phonics word at once
+
+    The inventory is indexed once: candidates are encoded into a padded
+    int array, and a bigram inverted index maps each character pair to the
+    candidates containing it. Scoring a transcript counts shared bigrams
+    for all candidates with one np.bincount, keeps a shortlist, and then
+    computes exact edit distances for the whole shortlist in a single
+    batched NumPy dynamic program. The cost is driven by the shortlist
+    size, so it stays flat as the inventory grows. The scored shortlist is
+    kept per utterance, since children repeat the same few attempts, and
+    jobs of a few hundred DP cells (one letter's sounds) skip NumPy for a
+    memoized pure-Python distance.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, str]], shortlist: int = 32):
+        """entries: (letter, text, kind) triples"""
+        self.shortlist = shortlist
+        self.letters: List[str] = []
+        self.texts: List[str] = []
+        self.kinds: List[str] = []
+        for letter, text, kind in entries:
+            text = text.lower()
+            self.letters.append(letter.upper())
+            self.texts.append(text)
+            self.kinds.append(kind)
+
+        self.size = len(self.texts)
+        self.lengths = np.array([len(t) for t in self.texts], dtype=np.int32)
+        width = int(self.lengths.max()) if self.size else 1
+        self.codes = np.zeros((self.size, width), dtype=np.int16)
+        for i, text in enumerate(self.texts):
+            self.codes[i, :len(text)] = _encode(text)
+
+        postings: Dict[str, List[int]] = {}
+        bigram_counts = np.zeros(self.size, dtype=np.float32)
+        for i, text in enumerate(self.texts):
+            grams = set(_bigrams(text))
+            bigram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.bigram_counts = bigram_counts
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        # Candidate ids per letter, and per (letter, kind)
+        groups: Dict[object, List[int]] = {}
+        for i, (letter, kind) in enumerate(zip(self.letters, self.kinds)):
+            groups.setdefault(letter, []).append(i)
+            groups.setdefault((letter, kind), []).append(i)
+        self.groups = {key: np.array(ids, dtype=np.int32) for key, ids in groups.items()}
+        self.group_texts = {key: [self.texts[i] for i in ids] for key, ids in groups.items()}
+        # Shortlist and its confidences per distinct token list, most recent last
+        self._scored: "OrderedDict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_phonics(cls, letter_sounds: Dict[str, List[str]], phonics_words: Dict[str, List[str]],
+                     **kwargs) -> "PronunciationScorer":
+        """Index every LETTER_SOUNDS and PHONICS_WORDS entry"""
+        entries = [(letter, sound, 'sound') for letter, sounds in letter_sounds.items() for sound in sounds]
+        entries += [(letter, word, 'word') for letter, words in phonics_words.items() for word in words]
+        return cls(entries, **kwargs)
+
+    @staticmethod
+    def _tokens(transcript: str) -> List[str]:
+        """Distinct transcript words, shortest first, capped at _MAX_TOKENS"""
+        words = list(dict.fromkeys(_WORD.findall(transcript.lower())))[:_MAX_TOKENS]
+        return sorted(words, key=len)
+
+    def _edit_confidence(self, tokens: List[str], candidates: np.ndarray) -> np.ndarray:
+        """Best 1 - distance/length over tokens for each candidate, batched over all pairs"""
+        if not tokens or candidates.size == 0:
+            return np.zeros(candidates.size, dtype=np.float32)
+
+        count = candidates.size
+        num_tokens = len(tokens)
+        token_len = [len(t) for t in tokens]
+        if sum(token_len) * int(self.lengths[candidates].max()) * count <= _PYTHON_DP_CELLS:
+            return np.array([max(_pair_confidence(token, self.texts[c]) for token in tokens)
+                             for c in candidates.tolist()], dtype=np.float32)
+        token_codes = np.zeros((num_tokens, token_len[-1]), dtype=np.int16)
+        for i, token in enumerate(tokens):
+            token_codes[i, :len(token)] = _encode(token)
+
+        # One row per (token, candidate) pair; tokens are sorted by length so
+        # the rows that finish at step i form one contiguous block
+        a = np.repeat(token_codes, count, axis=0)
+        lengths = self.lengths[candidates]
+        b = np.tile(self.codes[candidates, :int(lengths.max())], (num_tokens, 1))
+        b_len = np.tile(lengths, num_tokens)
+        pair_index = np.arange(b.shape[0])
+
+        columns = np.arange(b.shape[1] + 1, dtype=np.int32)
+        row = np.broadcast_to(columns, (b.shape[0], b.shape[1] + 1)).copy()
+        distance = np.empty(b.shape[0], dtype=np.int32)
+        first = 0
+        for i in range(token_len[-1]):
+            live = slice(first * count, None)
+            substitution = row[live, :-1] + (b[live] != a[live, i:i + 1])
+            best = row[live] + 1
+            np.minimum(best[:, 1:], substitution, out=best[:, 1:])
+            best[:, 0] = i + 1
+            # Insertions chain along the row: new[j] = min_k(best[k] + j - k)
+            row[live] = np.minimum.accumulate(best - columns, axis=1) + columns
+            while first < num_tokens and token_len[first] == i + 1:
+                block = slice(first * count, (first + 1) * count)
+                distance[block] = row[pair_index[block], b_len[block]]
+                first += 1
+
+        a_len = np.repeat(np.array(token_len, dtype=np.int32), count)
+        longest = np.maximum(a_len, b_len).astype(np.float32)
+        confidence = 1.0 - distance / longest
+        return confidence.reshape(num_tokens, count).max(axis=0)
+
+    def _shortlist(self, tokens: List[str]) -> np.ndarray:
+        """Candidates sharing the most bigrams (Dice coefficient) with any token"""
+        if self.size <= self.shortlist:
+            return np.arange(self.size, dtype=np.int32)
+        # Shared bigram counts for every (token, candidate) pair from one bincount
+        hits, gram_counts = [], []
+        for t, token in enumerate(tokens):
+            grams = set(_bigrams(token))
+            hits += [self.postings[g] + t * self.size for g in grams if g in self.postings]
+            gram_counts.append(len(grams))
+        if not hits:
+            # Nothing shares a bigram with the transcript; the first entries would be arbitrary guesses
+            return np.empty(0, dtype=np.int32)
+        shared = np.bincount(np.concatenate(hits), minlength=len(tokens) * self.size).astype(np.float32)
+        shared = shared.reshape(len(tokens), self.size)
+        shared /= self.bigram_counts + np.array(gram_counts, dtype=np.float32)[:, np.newaxis]
+        best = shared.max(axis=0)
+        # Negate and select from the front: most of `best` is tied at zero,
+        # which argpartition handles far better with a small positive kth
+        np.negative(best, out=best)
+        return np.sort(np.argpartition(best, self.shortlist - 1)[:self.shortlist]).astype(np.int32)
+
+    def _score(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(shortlist, confidence per shortlisted candidate), cached per token list"""
+        key = tuple(tokens)
+        with self._lock:
+            cached = self._scored.get(key)
+            if cached is not None:
+                self._scored.move_to_end(key)
+                return cached
+        candidates = self._shortlist(tokens)
+        scored = (candidates, self._edit_confidence(tokens, candidates))
+        with self._lock:
+            self._scored[key] = scored
+            if len(self._scored) > _SCORE_CACHE:
+                self._scored.popitem(last=False)
+        return scored
+
+    def rank(self, transcript: str, top_k: int = 5) -> List[PronunciationMatch]:
+        """Best matching sounds/words for a transcript, highest confidence first"""
+        tokens = self._tokens(transcript)
+        if not tokens or not self.size:
+            return []
+        candidates, confidence = self._score(tokens)
+        order = np.argsort(-confidence, kind='stable')[:top_k]
+        return [
+            PronunciationMatch(self.letters[c], self.texts[c], self.kinds[c], round(float(confidence[o]), 4))
+            for o, c in ((o, int(candidates[o])) for o in order)
+        ]
+
+    def letter_confidence(self, letter: str, transcript: str, kind: Optional[str] = 'sound') -> float:
+        """Best confidence that the transcript is one of this letter's sounds (or words)"""
+        letter = letter.upper()
+        key = (letter, kind) if kind is not None else letter
+        texts = self.group_texts.get(key)
+        tokens = self._tokens(transcript)
+        if not texts or not tokens:
+            return 0.0
+        if sum(map(len, tokens)) * max(map(len, texts)) * len(texts) <= _PYTHON_DP_CELLS:
+            return max(_pair_confidence(token, text) for token in tokens for text in texts)
+        return float(self._edit_confidence(tokens, self.groups[key]).max())
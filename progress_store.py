@@ -0,0 +1,274 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    child_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    user TEXT NOT NULL,
+    assistant TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exchanges_by_child ON exchanges (child_id, id);
+
+CREATE TABLE IF NOT EXISTS letter_progress (
+    child_id TEXT NOT NULL,
+    letter TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (child_id, letter)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS letter_mastery (
+    child_id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    updated TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class ProgressStore:
+    """Durable per-child exchange history and letter progress in SQLite
+
+    Writes are buffered in memory and flushed in batches from the event
+    loop through a single writer thread, so a turn never waits on disk.
+    Reads use a separate connection and the (child_id, ...) indexes, and
+    merge in anything still waiting to be flushed.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 0.5, batch_size: int = 500):
+        self.path = path or os.environ.get("PROGRESS_DB_PATH", "tutor_progress.db")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-writer")
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._pending_exchanges: List[Tuple[str, str, str, str]] = []
+        self._pending_letters: Dict[Tuple[str, str], List[Any]] = {}
+        self._pending_mastery: Dict[str, Tuple[bytes, str]] = {}  # latest state per child
+        self._inflight: Tuple[list, dict, dict] = ([], {}, {})  # batch being written right now
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {'flushes': 0, 'rows_written': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Start the write-behind flush loop on the running event loop"""
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        return self
+
+    def record_exchange(self, child_id: str, user: str, assistant: str, timestamp: Optional[str] = None):
+        """Queue one exchange for writing"""
+        self._pending_exchanges.append((child_id, timestamp or datetime.now().isoformat(), user, assistant))
+        self._maybe_wake()
+
+    def record_attempt(self, child_id: str, letter: str, correct: bool):
+        """Queue one graded letter attempt for writing"""
+        key = (child_id, letter.upper())
+        pending = self._pending_letters.get(key)
+        if pending is None:
+            pending = self._pending_letters[key] = [0, 0, None]
+        pending[0] += 1
+        pending[1] += int(bool(correct))
+        pending[2] = datetime.now().isoformat()
+        self._maybe_wake()
+
+    def record_mastery(self, child_id: str, state: bytes):
+        """Queue a child's serialized MasteryModel; only the latest one per flush is written"""
+        self._pending_mastery[child_id] = (state, datetime.now().isoformat())
+        self._maybe_wake()
+
+    def _maybe_wake(self):
+        pending = len(self._pending_exchanges) + len(self._pending_letters) + len(self._pending_mastery)
+        if self._wakeup is not None and pending >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing progress store: {str(e)}")
+
+    async def flush(self):
+        """Write everything queued so far in one transaction off the event loop"""
+        if not self._pending_exchanges and not self._pending_letters and not self._pending_mastery:
+            return
+        exchanges, self._pending_exchanges = self._pending_exchanges, []
+        letters, self._pending_letters = self._pending_letters, {}
+        mastery, self._pending_mastery = self._pending_mastery, {}
+        self._inflight = (exchanges, letters, mastery)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._writer, self._write_batch, exchanges, letters, mastery)
+        except Exception:
+            self._requeue(exchanges, letters, mastery)
+            raise
+        finally:
+            self._inflight = ([], {}, {})
+
+    def _requeue(self, exchanges, letters, mastery):
+        """Put a batch that failed to write back in front of anything queued since"""
+        self._pending_exchanges = exchanges + self._pending_exchanges
+        for key, (a, c, seen) in letters.items():
+            pending = self._pending_letters.get(key)
+            if pending is None:
+                self._pending_letters[key] = [a, c, seen]
+            else:
+                pending[0] += a
+                pending[1] += c
+        for child_id, state in mastery.items():
+            self._pending_mastery.setdefault(child_id, state)
+
+    def _write_batch(self, exchanges, letters, mastery):
+        conn = self._write_conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO exchanges (child_id, timestamp, user, assistant) VALUES (?, ?, ?, ?)",
+                exchanges,
+            )
+            conn.executemany(
+                "INSERT INTO letter_progress (child_id, letter, attempts, correct, last_seen) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (child_id, letter) DO UPDATE SET "
+                "attempts = attempts + excluded.attempts, "
+                "correct = correct + excluded.correct, "
+                "last_seen = excluded.last_seen",
+                [(child_id, letter, a, c, seen) for (child_id, letter), (a, c, seen) in letters.items()],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO letter_mastery (child_id, state, updated) VALUES (?, ?, ?)",
+                [(child_id, state, updated) for child_id, (state, updated) in mastery.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(exchanges) + len(letters) + len(mastery)
+
+    def load_child(self, child_id: str, recent: int = 3) -> Dict[str, Any]:
+        """Recent exchanges (oldest first), per-letter totals and mastery state for one child"""
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT timestamp, user, assistant FROM exchanges WHERE child_id = ? ORDER BY id DESC LIMIT ?",
+                (child_id, recent),
+            ).fetchall()
+            letter_rows = self._read_conn.execute(
+                "SELECT letter, attempts, correct, last_seen FROM letter_progress WHERE child_id = ?",
+                (child_id,),
+            ).fetchall()
+            mastery_row = self._read_conn.execute(
+                "SELECT state FROM letter_mastery WHERE child_id = ?", (child_id,)).fetchone()
+
+        exchanges = [
+            {'timestamp': ts, 'user': user, 'assistant': assistant}
+            for ts, user, assistant in reversed(rows)
+        ]
+        inflight_exchanges, inflight_letters, inflight_mastery = self._inflight
+        pending = [
+            {'timestamp': ts, 'user': user, 'assistant': assistant}
+            for cid, ts, user, assistant in inflight_exchanges + self._pending_exchanges if cid == child_id
+        ]
+        exchanges = (exchanges + pending)[-recent:] if recent else []
+
+        letters = {letter: {'attempts': a, 'correct': c, 'last_seen': seen} for letter, a, c, seen in letter_rows}
+        for batch in (inflight_letters, self._pending_letters):
+            for (cid, letter), (a, c, seen) in list(batch.items()):
+                if cid != child_id:
+                    continue
+                entry = letters.setdefault(letter, {'attempts': 0, 'correct': 0, 'last_seen': seen})
+                entry['attempts'] += a
+                entry['correct'] += c
+                entry['last_seen'] = seen
+
+        mastery = mastery_row[0] if mastery_row else None
+        for batch in (inflight_mastery, self._pending_mastery):
+            if child_id in batch:
+                mastery = batch[child_id][0]
+        return {'exchanges': exchanges, 'letters': letters, 'mastery': mastery}
+
+    def letter_progress(self, child_id: str, letter: str) -> Optional[Dict[str, Any]]:
+        """Totals for a single letter, served from the primary-key index"""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT attempts, correct, last_seen FROM letter_progress WHERE child_id = ? AND letter = ?",
+                (child_id, letter.upper()),
+            ).fetchone()
+        entry = {'attempts': row[0], 'correct': row[1], 'last_seen': row[2]} if row else None
+        for batch in (self._inflight[1], self._pending_letters):
+            pending = batch.get((child_id, letter.upper()))
+            if pending is not None:
+                entry = entry or {'attempts': 0, 'correct': 0, 'last_seen': pending[2]}
+                entry['attempts'] += pending[0]
+                entry['correct'] += pending[1]
+                entry['last_seen'] = pending[2]
+        return entry
+
+    def load_mastery(self, child_ids: Optional[List[str]] = None) -> Tuple[List[str], List[bytes]]:
+        """Stored mastery states for the given children (all of them by default), for batch reports"""
+        with self._read_lock:
+            if child_ids is None:
+                rows = self._read_conn.execute("SELECT child_id, state FROM letter_mastery ORDER BY child_id").fetchall()
+            else:
+                rows = []
+                for start in range(0, len(child_ids), 500):  # stay under SQLite's bound-parameter limit
+                    chunk = child_ids[start:start + 500]
+                    rows += self._read_conn.execute(
+                        f"SELECT child_id, state FROM letter_mastery WHERE child_id IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+        states = dict(rows)
+        wanted = None if child_ids is None else set(child_ids)
+        for batch in (self._inflight[2], self._pending_mastery):
+            for child_id, (state, _) in list(batch.items()):
+                if wanted is None or child_id in wanted:
+                    states[child_id] = state
+        ids = sorted(states) if child_ids is None else [c for c in child_ids if c in states]
+        return ids, [states[c] for c in ids]
+
+    async def close(self):
+        """Flush outstanding writes and close both connections
+
+        The last batch is written on the calling thread rather than the
+        writer: close() may run at interpreter exit, when executors no
+        longer accept work.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        # Let a batch the writer already started finish first
+        self._writer.shutdown(wait=True)
+        if self._pending_exchanges or self._pending_letters or self._pending_mastery:
+            exchanges, self._pending_exchanges = self._pending_exchanges, []
+            letters, self._pending_letters = self._pending_letters, {}
+            mastery, self._pending_mastery = self._pending_mastery, {}
+            self._write_batch(exchanges, letters, mastery)
+        self._write_conn.close()
+        self._read_conn.close()
@@ -1,3 +1,9 @@
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
 PROMPT = '''
 -Role & Identity
 
@@ -12,23 +18,6 @@ Give gentle, kind corrections when a child mispronounces (“Almost! The sound i
 Celebrate successes with enthusiasm (“Yes! B is for Ball, awesome job!”).
 Adapt to the child’s recent struggles: if they made a mistake, revisit it playfully.
 
-PHONICS TEACHING GUIDELINES:
-1. Always emphasize both letter NAMES and letter SOUNDS
-2. Provide gentle pronunciation feedback and correction
-3. Use simple, age-appropriate language
-4. Be encouraging and celebrate small wins
-5. Ask the child to repeat sounds and words
-6. Connect letters to familiar words and objects
-7. Adapt difficulty based on the child's responses
-
-INTERACTION STYLE:
-- Speak warmly and enthusiastically
-- Use the child's name when you know it
-- Give specific praise for good attempts
-- Offer gentle corrections with encouragement
-- Keep sessions engaging with variety
-
-
 -Teaching Guidelines
 Each lesson includes:
 Letter name (“This is the letter B”).
@@ -66,12 +55,120 @@ If vision is off, say: “That’s okay, we can keep learning by listening and s
 -Example style:
 Child: “Teach me B”
 Tutor: “Sure! This is the letter B. B makes the /b/ sound. Like Ball and Banana. Can you say /b/ with me?”
-Would you like me to rewrite this into a version optimized for direct use as a system prompt in your LLM (concise, instruction-focused, without extra explanations), so you can plug it directly into your agent?
+
+'''
 
 
+TUTOR_INTRO = '''
+You are Youssef, a friendly and encouraging phonics tutor for young children.
 
-Remember: You have access to recent conversation memory to personalize your teaching.
+PHONICS TEACHING GUIDELINES:
+1. Always emphasize both letter NAMES and letter SOUNDS
+2. Provide gentle pronunciation feedback and correction
+3. Use simple, age-appropriate language
+4. Be encouraging and celebrate small wins
+5. Ask the child to repeat sounds and words
+6. Connect letters to familiar words and objects
+7. Adapt difficulty based on the child's responses
 
-'''
+INTERACTION STYLE:
+- Speak warmly and enthusiastically
+- Use the child's name when you know it
+- Give specific praise for good attempts
+- Offer gentle corrections with encouragement
+- Keep sessions engaging with variety
 
+Remember: You have access to recent conversation memory to personalize your teaching.
+'''
 
+SESSION_TEMPLATE = "You're working with {child_name} today to help them learn letters, sounds, and words.\n"
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "2000"))
+
+_SECTION_BREAK = re.compile(r"\n\s*\n")
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to an estimate
+    _ENCODING = None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Token count for text: exact with tiktoken installed, otherwise an estimate"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(len(_TOKEN_PIECES.findall(text)), math.ceil(len(text) / 4))
+
+
+def dedupe_sections(*texts: str) -> str:
+    """Join prompt texts, keeping only the first copy of any repeated section"""
+    seen = set()
+    sections = []
+    for text in texts:
+        for section in _SECTION_BREAK.split(text):
+            section = "\n".join(line.rstrip() for line in section.strip("\n").splitlines())
+            key = " ".join(section.split())
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            sections.append(section)
+    return "\n\n".join(sections) + "\n\n"
+
+
+# Identical for every child and every turn, so providers can cache it
+STATIC_PREFIX = dedupe_sections(TUTOR_INTRO, PROMPT)
+
+
+class PromptCompiler:
+    """Builds the tutor prompt as a byte-stable prefix plus a per-turn suffix
+
+    The prefix (persona, guidelines, then the child line) never changes
+    during a session. The suffix is assembled from memory sections that
+    MemoryManager renders once per exchange. When the prompt would exceed
+    the token budget the oldest exchanges are dropped first, then the
+    activity line, then the rest of the memory context.
+    """
+
+    def __init__(self, child_name: str, budget_tokens: Optional[int] = None):
+        self.budget_tokens = budget_tokens or DEFAULT_TOKEN_BUDGET
+        self.static_prefix = STATIC_PREFIX
+        self.instructions = self.static_prefix + SESSION_TEMPLATE.format(child_name=child_name)
+        self.instructions_tokens = count_tokens(self.instructions)
+        self.last_report: Dict[str, Any] = {}
+
+    def compile(self, memory, activity: Optional[str] = None) -> str:
+        """Return instructions + memory context + activity within the token budget"""
+        activity_section = f"\nCURRENT ACTIVITY: {activity}\n" if activity else ""
+        keep = len(memory.exchanges)
+        include_memory = True
+        while True:
+            sections = memory.get_context_sections(keep) if include_memory else []
+            if activity_section:
+                sections.append(activity_section)
+            dynamic_tokens = sum(count_tokens(section) for section in sections)
+            if self.instructions_tokens + dynamic_tokens <= self.budget_tokens:
+                break
+            if keep > 0:
+                keep -= 1
+            elif activity_section:
+                activity_section = ""
+            elif include_memory:
+                include_memory = False
+            else:
+                break
+
+        self.last_report = {
+            'static_tokens': self.instructions_tokens,
+            'dynamic_tokens': dynamic_tokens,
+            'total_tokens': self.instructions_tokens + dynamic_tokens,
+            'budget_tokens': self.budget_tokens,
+            'exchanges_kept': keep,
+            'exchanges_dropped': len(memory.exchanges) - keep,
+            'activity_dropped': bool(activity) and not activity_section,
+            'memory_dropped': not include_memory,
+            'over_budget': self.instructions_tokens + dynamic_tokens > self.budget_tokens,
+        }
+        return self.instructions + "".join(sections)
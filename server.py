@@ -1,56 +1,111 @@
-from livekit import rtc, agents, api
-from livekit.api import AccessToken, VideoGrants
-from livekit.plugins import openai
-from livekit.agents import AgentSession, Agent
-from flask import Flask, render_template, jsonify, request
-from pydub import AudioSegment
-from agent import Assistant
-import numpy as np
+from livekit import rtc, api
+from flask import Flask, Response, render_template, jsonify, request
+from agent import Assistant, PhonicsHelper
+from tts_cache import TTSCache
+from audio_bank import AudioBank
+from progress_store import ProgressStore
+from transcript import MAX_MESSAGES_PAGE, TranscriptLog, TranscriptStore
+from events import EventBroadcaster
+from sharding import DEFAULT_SESSION_ID, SessionDirectory
+from tokens import MAX_BULK_TOKENS, IssuedToken, TokenService
+from metrics import ACTIVE_SESSIONS, CONTENT_TYPE, REGISTRY, TTS_CACHE_LOOKUPS, TurnTrace
+from audio import PCMStreamDecoder, PlayoutScheduler, decode_to_pcm16, pcm_bytes
+from utterances import PRIORITY_PROMPT, PRIORITY_REPLY, Utterance, UtteranceQueue
+from tts import (ELEVENLABS_API_URL, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT, ELEVENLABS_VOICE_ID,
+                 ELEVENLABS_VOICE_SETTINGS, TTS_CHUNK_CONCURRENCY, TTSRouter, split_speakable)
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import httpx
-from livekit.api import AccessToken, VideoGrants
-import io
-
-
-class SessionManager:
-  """Manages voice agent sessions with proper room management"""
-  def __init__(self):
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import random
+import re
+import threading
+import time
+
+
+LIVEKIT_URL = os.environ.get("LIVEKIT_URL", "ws://localhost:7880")
+CONTROL_TIMEOUT = float(os.environ.get("CONTROL_TIMEOUT", "15"))  # seconds a route waits on the loop
+PLAYOUT_FRAME_MS = int(os.environ.get("PLAYOUT_FRAME_MS", "20"))  # 10 or 20 ms frames
+PLAYOUT_BUFFER_MS = int(os.environ.get("PLAYOUT_BUFFER_MS", "200"))  # audio queued ahead of playout
+TUTOR_IDENTITY_PREFIX = "tutor-"  # reserved for the tutor's own participant
+STUDENT_IDENTITY_PREFIX = "student-"
+STUDENT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Canned replies to recognized speech, matched by keyword in order
+STUDENT_REPLIES = [
+  ("hello", "Hello there! I'm so happy to hear your voice! Should we practice some letters together? Let's start with the letter A!"),
+  ("help", "Of course I can help! Let's practice letters and sounds. Can you say the letter A for me?"),
+  ("learn", "Wonderful! I love helping children learn! Let's practice the alphabet. Can you say the letter B?"),
+]
+DEFAULT_STUDENT_REPLY = "I heard you! That's great speaking! Let's practice a letter. Can you say the letter A?"
+
+
+def create_agent_audio(sample_rate: int = 16000, num_channels: int = 1):
+  """Create the audio source and local track the tutor speaks through"""
+  source = rtc.AudioSource(sample_rate=sample_rate, num_channels=num_channels)
+  track = rtc.LocalAudioTrack.create_audio_track("agent_voice", source)
+  return source, track
+
+
+class TutorSession:
+  """A single tutoring room: one child, one Assistant, one outgoing audio track"""
+  def __init__(self, session_id: str, manager: "SessionManager"):
+      self.session_id = session_id
+      self.room_name = session_id
+      self.manager = manager
       self.room = None
       self.assistant = None
       self.active = False
-      self.room_name = "phonics-room"
       self.current_token = None
-      self.event_loop = None
-      self.session_task = None
-      self.recent_messages = []  # Store recent agent messages for UI display
+      self.participant_identity = None
+      self.llm_model = None
+      self.audio_source = None
+      self.audio_track = None
+      self.playout: Optional[PlayoutScheduler] = None
+      self.utterances: Optional[UtteranceQueue] = None
+      self.tasks = set()  # Background tasks owned by this session
+      # Every tutor message: recent ones in memory for the UI, all of them in the transcript store
+      self.transcript = TranscriptLog(session_id, manager.get_transcript_store())
+      self.started_at = None
 
   def _create_room_token(self, identity: str) -> str:
-      """Create a token for joining the LiveKit room using the new API"""
+      """Create a token for the tutor to join the LiveKit room"""
       try:
-          token = (
-              AccessToken(
-                  api_key=os.environ["LIVEKIT_API_KEY"],
-                  api_secret=os.environ["LIVEKIT_API_SECRET"]
-              )
-              .with_identity(identity)
-              .with_grants(
-                  VideoGrants(
-                      room_join=True,
-                      room=self.room_name,
-                      can_publish=True,
-                      can_subscribe=True,
-                      can_publish_data=True
-                  )
-              )
-          )
-          return token.to_jwt()
+          return self.manager.tokens.issue(identity, self.room_name).token
       except Exception as e:
           print(f"Error creating room token: {str(e)}")
           raise
 
+  def _publish_event(self, event: str, data: Any):
+      """Push a state change to this session's /events subscribers"""
+      self.manager.events.publish(self.session_id, event, data)
+
+  def _publish_state(self):
+      state = {
+          'session_id': self.session_id,
+          'active': self.active,
+          'room_name': self.room_name if self.active else None,
+          'started_at': self.started_at,
+      }
+      self._publish_event('status', state)
+      self.manager.share_status(self.session_id, state)
+
+  def _spawn(self, coro):
+      """Run a coroutine as a task tied to this session's lifetime"""
+      task = asyncio.create_task(coro)
+      self.tasks.add(task)
+      task.add_done_callback(self.tasks.discard)
+      return task
+
   async def _setup_llm(self):
       """Set up the LLM component"""
       try:
-          # Set up Azure OpenAI LLM
+          # Set up Azure OpenAI LLM; the plugin is only imported once a session needs it
+          from livekit.plugins import openai
+
           self.llm_model = openai.LLM.with_azure(
               azure_deployment=os.environ.get("AZURE_DEPLOYMENT"),
               azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
@@ -68,62 +123,121 @@ class SessionManager:
   async def _setup_audio_track(self):
       """Set up the audio source and track for publishing"""
       try:
-          self.audio_source = rtc.AudioSource(sample_rate=16000, num_channels=1)
-          self.audio_track = rtc.LocalAudioTrack.create_audio_track("agent_voice", self.audio_source)
+          self.audio_source, self.audio_track = self.manager.audio_factory(sample_rate=16000, num_channels=1)
+          self.playout = PlayoutScheduler(self.audio_source, sample_rate=16000,
+                                          frame_ms=PLAYOUT_FRAME_MS,
+                                          max_buffer_ms=PLAYOUT_BUFFER_MS).start()
+          self.utterances = UtteranceQueue(self._speak_utterance, flush=self.playout.flush).start()
           await self.room.local_participant.publish_track(self.audio_track)
-          print("Audio track set up and published successfully")
+          print(f"[{self.session_id}] Audio track set up and published successfully")
       except Exception as e:
           print(f"Error setting up audio track: {str(e)}")
           raise
 
-  async def _text_to_speech_azure(self, text: str) -> bytes:
-      """Convert text to speech using Azure Cognitive Services (fallback)"""
+  def _cache_key(self, text: str) -> str:
+      """Cache and audio-bank key of text in the primary (ElevenLabs) voice"""
+      return self.manager.tts_cache.make_key(text, ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_VOICE_SETTINGS)
+
+  def _lookup_bank(self, cache_key: str):
+      """Pre-rendered PCM for a cache key from the audio bank, or None"""
+      bank = self.manager.audio_bank
+      pcm = bank.get(cache_key) if bank is not None else None
+      if pcm is not None:
+          # Pre-rendered fixed phrase: no network and no cache lookup
+          TTS_CACHE_LOOKUPS.inc(result="bank")
+      return pcm
+
+  async def _lookup_audio(self, cache_key: str):
+      """Pre-rendered or cached PCM for a cache key, or None"""
+      pcm = self._lookup_bank(cache_key)
+      if pcm is not None:
+          return pcm
+      pcm = await self.manager.tts_cache.get(cache_key)
+      TTS_CACHE_LOOKUPS.inc(result="miss" if pcm is None else "hit")
+      return pcm
+
+  async def _render_chunk(self, text: str, out: asyncio.Queue, trace: Optional[TurnTrace] = None):
+      """Put PCM blocks for text on out as they arrive, then None.
+
+      Audio in the primary voice is cached under the chunk's key; audio
+      from a fallback provider is only played.
+      """
       try:
-          print("Azure TTS not implemented yet, using console output")
-          return None
+          cache_key = self._cache_key(text)
+          pcm = await self._lookup_audio(cache_key)
+          if pcm is not None:
+              out.put_nowait(pcm)
+              return
+          decoder = PCMStreamDecoder()
+          blocks = []
+          served_by = []
+          async for chunk in self.manager.tts.stream(text, trace, served_by.append):
+              block = decoder.feed(chunk)
+              if block:
+                  blocks.append(block)
+                  out.put_nowait(block)
+          tail = decoder.flush()
+          if tail:
+              blocks.append(tail)
+              out.put_nowait(tail)
+          pcm = b"".join(blocks) or None
+          # A fallback voice is played but never stored under the primary voice's key
+          if pcm and served_by[0].cacheable:
+              await self.manager.tts_cache.put(cache_key, pcm)
       except Exception as e:
-          print(f"Error with Azure TTS: {str(e)}")
-          return None
-
-  async def _text_to_speech_elevenlabs(self, text: str) -> bytes:
-      """Convert text to speech using ElevenLabs API (returns PCM)"""
+          print(f"Error synthesizing {text!r}: {str(e)}")
+      finally:
+          out.put_nowait(None)
+
+  async def _speak_chunks(self, chunks, trace: Optional[TurnTrace] = None):
+      """Synthesize chunks concurrently (bounded) and play them strictly in order.
+
+      The first chunk streams to the room as soon as its audio arrives
+      while the next ones are synthesized behind it.
+      """
+      gate = asyncio.Semaphore(TTS_CHUNK_CONCURRENCY)
+      queues = [asyncio.Queue() for _ in chunks]
+
+      async def render(i: int, chunk: str):
+          async with gate:
+              await self._render_chunk(chunk, queues[i], trace if i == 0 else None)
+
+      tasks = [asyncio.create_task(render(i, chunk)) for i, chunk in enumerate(chunks)]
+      t0 = time.perf_counter()
+      started = False
       try:
-          api_key = os.environ.get("ELEVEN_API_KEY")
-          if not api_key:
-              print("ElevenLabs API key not found, skipping...")
-              return None
+          for queue in queues:
+              while True:
+                  block = await queue.get()
+                  if block is None:
+                      break
+                  if not started:
+                      started = True
+                      print(f" First audio after {(time.perf_counter() - t0) * 1000:.0f} ms")
+                  await self._publish_pcm(block, trace)
+          await asyncio.gather(*tasks)
+      finally:
+          for task in tasks:
+              task.cancel()
+      if not started:
+          print(" No TTS available")
+
+  def _decode_audio(self, audio_data: bytes) -> memoryview:
+      """Decode audio (WAV in-process, MP3 and others via ffmpeg) to 16 kHz mono PCM16"""
+      return pcm_bytes(decode_to_pcm16(audio_data, sample_rate=16000))
+
+  async def _publish_pcm(self, pcm: bytes, trace: Optional[TurnTrace] = None):
+      """Publish 16 kHz mono PCM16 to the room"""
+      try:
+          if not self.playout or not pcm:
+              print("Audio source or audio data is missing")
+              return
 
-          voice_id = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice
-          url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
-
-          headers = {
-              "Accept": "audio/wav",   
-              "Content-Type": "application/json",
-              "xi-api-key": api_key
-          }
-
-          data = {
-              "text": text,
-              "model_id": "eleven_monolingual_v1",
-              "voice_settings": {
-                  "stability": 0.5,
-                  "similarity_boost": 0.5
-              }
-          }
-
-          async with httpx.AsyncClient() as client:
-              response = await client.post(url, json=data, headers=headers)
-
-              if response.status_code == 200:
-                  return response.content  # WAV bytes
-              else:
-                  print(f"ElevenLabs API error: {response.status_code} - {response.text}")
-                  return None
+          # Paced in fixed frames by the playout scheduler
+          await self.playout.feed(pcm, on_first_frame=trace.first_frame if trace else None)
 
       except Exception as e:
-          print(f"Error with ElevenLabs TTS: {str(e)}")
-          return None
-
+          print(f"Error publishing audio data: {str(e)}")
 
   async def _publish_audio_data(self, audio_data: bytes):
       """Publish audio data (MP3 or WAV) to the room"""
@@ -131,55 +245,62 @@ class SessionManager:
           if not self.audio_source or not audio_data:
               print("Audio source or audio data is missing")
               return
-
-          # Decode audio (MP3 or WAV) to PCM16 to be able to sent it to the back end
-          audio = AudioSegment.from_file(io.BytesIO(audio_data), format="mp3")
-          audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-
-          raw_pcm = audio.raw_data
-          audio_array = np.frombuffer(raw_pcm, dtype=np.int16).astype(np.float32) / 32768.0
-
-          frame = rtc.AudioFrame(
-              data=audio_array.tobytes(),
-              sample_rate=16000,
-              num_channels=1,
-              samples_per_channel=len(audio_array),
-          )
-
-          await self.audio_source.capture_frame(frame)
+          await self._publish_pcm(self._decode_audio(audio_data))
 
       except Exception as e:
           print(f"Error publishing audio data: {str(e)}")
 
-  # this is for testing i did it  because i excededd the quto of my transscription model 
-  async def _say_text(self, text: str):
-      """Convert text to speech and publish it"""
-      print(f" Agent saying: {text}")
+  async def _synthesize_pcm(self, text: str) -> Optional[bytes]:
+      """Render text to PCM through the TTS providers, without the cache or playout"""
+      try:
+          chunks = [chunk async for chunk in self.manager.tts.stream(text)]
+          return b"".join(chunks) or None
+      except Exception as e:
+          print(f"Error synthesizing speech: {str(e)}")
+          return None
+
+  # this is for testing i did it  because i excededd the quto of my transscription model
+  async def _say_text(self, text: str, trace: Optional[TurnTrace] = None,
+                      priority: int = PRIORITY_PROMPT, epoch: Optional[int] = None) -> bool:
+      """Queue text to be spoken; returns once it was spoken (True) or cancelled (False)"""
+      if self.utterances is None:
+          print(f" [{self.session_id}] Not connected, cannot say: {text}")
+          return False
+      if trace is None:
+          trace = TurnTrace(self.session_id, kind="utterance")
+      return await self.utterances.put(text, priority, trace, epoch).wait()
+
+  async def _speak_utterance(self, utterance: Utterance):
+      """Convert one queued utterance to speech and publish it"""
+      text = utterance.text
+      print(f" [{self.session_id}] Agent saying: {text}")
 
-      self.recent_messages.append({
+      message = self.transcript.append({
           'text': text,
           'timestamp': datetime.now().isoformat()
       })
-      # Keep only last 10 messages
-      if len(self.recent_messages) > 10:
-          self.recent_messages = self.recent_messages[-10:]
+      self._publish_event('message', message)
 
-      audio_data = None
-
-      # Try ElevenLabs first
-      if os.environ.get("ELEVEN_API_KEY"):
-          audio_data = await self._text_to_speech_elevenlabs(text)
-
-      # Fallback to Azure if ElevenLabs fails
-      if not audio_data and os.environ.get("AZURE_SPEECH_KEY"):
-          print("Attempting Azure TTS...")
-          audio_data = await self._text_to_speech_azure(text)
-
-      if audio_data:
-          print(" Audio generated and will be played")
-          await self._publish_audio_data(audio_data)
-      else:
-          print(" No cloud TTS available")
+      if self.playout:
+          self.playout.begin_utterance()
+      try:
+          await self._speak(text, utterance.trace)
+      finally:
+          if self.playout:
+              self.playout.end_utterance()
+
+  async def _speak(self, text: str, trace: Optional[TurnTrace] = None):
+      """Play text from the audio bank or TTS cache, or synthesize, play and cache it"""
+      # Sentence-sized chunks: the first one plays while the rest are still synthesizing.
+      # Only chunks go in the TTS cache, so a long reply is stored once, as its chunks.
+      chunks = split_speakable(text) or [text]
+      if len(chunks) > 1:
+          # The bank pre-renders whole fixed phrases, some of them several sentences long
+          pcm = self._lookup_bank(self._cache_key(text))
+          if pcm is not None:
+              await self._publish_pcm(pcm, trace)
+              return
+      await self._speak_chunks(chunks, trace)
 
 
   async def _send_greeting(self, child_name: str):
@@ -187,21 +308,26 @@ class SessionManager:
       greeting = f"Hello {child_name}! I'm Youssef, your phonics tutor. Are you ready to practice some letters today?"
       await self._say_text(greeting)
 
-  async def start_session(self, child_data):
+  async def _greet_when_ready(self, child_name: str, delay: float = 1.0):
+      """Give the student a moment to join, then greet them"""
+      await asyncio.sleep(delay)
+      await self._send_greeting(child_name)
+
+  async def start(self, child_data):
       """Start a voice tutoring session with proper room connection"""
       try:
-          print(f"Starting voice session for: {child_data['name']}")
-          identity = f"tutor-{random.randint(1000, 9999)}"
+          print(f"[{self.session_id}] Starting voice session for: {child_data['name']}")
+          identity = f"{TUTOR_IDENTITY_PREFIX}{random.randint(1000, 9999)}"
           self.participant_identity = identity
           # Initialize the Assistant
-          self.assistant = Assistant(child_data)
+          self.assistant = Assistant(child_data, progress_store=self.manager.get_progress_store())
           self.current_token = self._create_room_token(identity)
-          self.room = rtc.Room()
+          self.room = self.manager.room_factory()
 
           # Set up event handlers
           self._setup_room_handlers()
           await self.room.connect(
-              url=os.environ.get("LIVEKIT_URL", "ws://localhost:7880"),
+              url=LIVEKIT_URL,
               token=self.current_token
           )
 
@@ -210,8 +336,11 @@ class SessionManager:
           await self._setup_audio_track()
           await self._setup_llm()
           self.active = True
-          await asyncio.sleep(1)
-          await self._send_greeting(child_data['name'])
+          self.started_at = datetime.now().isoformat()
+          self._publish_state()
+          self._publish_event('memory', self.assistant.get_memory_status())
+          # Greet in the background so callers are not held up by TTS latency
+          self._spawn(self._greet_when_ready(child_data['name']))
 
           print(f"Voice session started successfully for {child_data['name']}")
           return True
@@ -239,9 +368,9 @@ class SessionManager:
 
           if publication.kind == rtc.TrackKind.KIND_AUDIO:
 
-              
+
               print("Student audio track detected")
-              asyncio.create_task(self._handle_student_audio(publication))
+              self._spawn(self._handle_student_audio(publication))
 
       @self.room.on("track_subscribed")
       def on_track_subscribed(track: rtc.Track, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant):
@@ -250,56 +379,90 @@ class SessionManager:
   async def _handle_student_audio(self, publication: rtc.RemoteTrackPublication):
       """Handle incoming student audio"""
       try:
-          print("Student started speaking - simulating speech recognition...")
-
-          # Simulate speech recognition with different responses becoaus the quto problem
-          simulated_responses = [
-              "Hello",
-              "A", 
-              "B",
-              "What's that?",
-              "Can you help me?",
-              "I want to learn"
-          ]
-
-          # need to be awaited 
-          await asyncio.sleep(2)
-
-          # Pick a random response to simulate speech recognition again that for testing purposes
-          import random
-          detected_text = random.choice(simulated_responses)
-          print(f"Simulated detected speech: '{detected_text}'")
-
-          if self.assistant:
-              # Process through assistant
-              await self.assistant.on_message(detected_text)
-
-              # Generate a contextual response
-              if detected_text.upper() in ['A', 'B', 'C', 'D', 'E']:
-                  response = f"Excellent! You said the letter {detected_text.upper()}! That letter makes the sound /{detected_text.lower()}/. Can you say the sound /{detected_text.lower()}/ with me?"
-              elif "hello" in detected_text.lower():
-                  response = "Hello there! I'm so happy to hear your voice! Should we practice some letters together? Let's start with the letter A!"
-              elif "help" in detected_text.lower():
-                  response = "Of course I can help! Let's practice letters and sounds. Can you say the letter A for me?"
-              elif "learn" in detected_text.lower():
-                  response = "Wonderful! I love helping children learn! Let's practice the alphabet. Can you say the letter B?"
-              else:
-                  response = "I heard you! That's great speaking! Let's practice a letter. Can you say the letter A?"
-
-              await self._say_text(response)
+          trace = TurnTrace(self.session_id)
+          trace.mark("audio_received")
+          # Barge-in: the student is talking, so stop the tutor and any reply to their earlier speech
+          epoch = self.utterances.interrupt() if self.utterances else None
+          with trace.span("recognition"):
+              detected_text = await self._recognize_speech(publication)
+          if detected_text:
+              await self._respond_to_student(detected_text, trace, epoch)
 
       except Exception as e:
           print(f"Error handling student audio: {str(e)}")
 
-  async def stop_session(self):
-      """Stop the current session"""
+  async def _recognize_speech(self, publication: rtc.RemoteTrackPublication) -> Optional[str]:
+      """Stand-in for speech recognition on the student's track"""
+      print("Student started speaking - simulating speech recognition...")
+
+      # Simulate speech recognition with different responses becoaus the quto problem
+      simulated_responses = [
+          "Hello",
+          "A",
+          "B",
+          "What's that?",
+          "Can you help me?",
+          "I want to learn"
+      ]
+
+      # need to be awaited
+      await asyncio.sleep(2)
+
+      # Pick a random response to simulate speech recognition again that for testing purposes
+      detected_text = random.choice(simulated_responses)
+      print(f"Simulated detected speech: '{detected_text}'")
+      return detected_text
+
+  async def _respond_to_student(self, detected_text: str, trace: Optional[TurnTrace] = None,
+                                epoch: Optional[int] = None):
+      """Run one recognized utterance through the assistant and speak the reply"""
+      if not self.assistant:
+          return
+      trace = trace or TurnTrace(self.session_id)
+
+      # Process through assistant
+      with trace.span("analysis"):
+          await self.assistant.on_message(detected_text)
+      self._publish_event('memory', self.assistant.get_memory_status())
+
+      # Generate a contextual response
+      with trace.span("response_selection"):
+          response = self._select_response(detected_text)
+
+      await self._say_text(response, trace, PRIORITY_REPLY, epoch)
+
+  def _select_response(self, detected_text: str) -> str:
+      """Pick the canned tutor reply for a recognized utterance"""
+      letter_reply = PhonicsHelper.get_letter_reply(detected_text)
+      if letter_reply:
+          return letter_reply
+      for keyword, reply in STUDENT_REPLIES:
+          if keyword in detected_text.lower():
+              return reply
+      return DEFAULT_STUDENT_REPLY
+
+  async def stop(self):
+      """Stop this session and release its room"""
       try:
-          if self.session_task and not self.session_task.done():
-              self.session_task.cancel()
+          for task in list(self.tasks):
+              if not task.done():
+                  task.cancel()
+          if self.tasks:
+              await asyncio.gather(*self.tasks, return_exceptions=True)
+
+          if self.utterances:
+              await self.utterances.close()
+          if self.playout:
+              await self.playout.close()
+
+          store = self.manager.progress_store
+          if store:
+              # Persist this child's last turns before the Assistant goes away
+              await store.flush()
 
           if self.room:
               await self.room.disconnect()
-              print("Disconnected from room")
+              print(f"Disconnected from room: {self.room_name}")
 
           self.room = None
           self.assistant = None
@@ -309,84 +472,419 @@ class SessionManager:
           self.llm_model = None
           self.audio_source = None
           self.audio_track = None
-          self.session_task = None
+          self.playout = None
+          self.utterances = None
+          self.tasks.clear()
+          self._publish_state()
 
-          print("Session stopped successfully")
+          print(f"[{self.session_id}] Session stopped successfully")
           return True
 
       except Exception as e:
           print(f"Error stopping session: {str(e)}")
           return False
+
   def get_status(self):
       """Get current session status"""
       return {
+          'session_id': self.session_id,
           'active': self.active,
           'room_name': self.room_name if self.active else None,
+          'started_at': self.started_at,
+          'playout': self.playout.get_stats() if self.playout else None,
+          'utterances': self.utterances.get_stats() if self.utterances else None,
           'memory_status': self.assistant.get_memory_status() if self.assistant else None
       }
 
 
+class SessionManager:
+  """Registry of concurrent tutoring sessions keyed by session (room) id"""
+  def __init__(self, max_sessions: Optional[int] = None,
+               room_factory: Callable[[], Any] = rtc.Room,
+               audio_factory: Callable[..., Any] = create_agent_audio,
+               tts_cache: Optional[TTSCache] = None,
+               events: Optional[EventBroadcaster] = None,
+               audio_bank: Optional[AudioBank] = None,
+               tts: Optional[TTSRouter] = None,
+               tokens: Optional[TokenService] = None,
+               directory: Optional[SessionDirectory] = None):
+      self.max_sessions = max_sessions or int(os.environ.get("MAX_SESSIONS", "500"))
+      self.room_factory = room_factory
+      self.audio_factory = audio_factory
+      self.tts_cache = tts_cache or TTSCache.from_env()
+      self.events = events or EventBroadcaster()
+      self.audio_bank = audio_bank if audio_bank is not None else AudioBank.from_env()
+      self.tokens = tokens or TokenService()
+      # Set when running under supervisor.py: session status shared with the other workers
+      self.directory = directory if directory is not None else SessionDirectory.from_env()
+      self.sessions: Dict[str, TutorSession] = {}
+      # Result of each start still in progress, shared with concurrent starts of the same id
+      self.starting: Dict[str, asyncio.Future] = {}
+      self.http_client: Optional[httpx.AsyncClient] = None
+      self.progress_store: Optional[ProgressStore] = None
+      self.transcript_store: Optional[TranscriptStore] = None
+      self.tts_timeout = httpx.Timeout(
+          connect=float(os.environ.get("TTS_CONNECT_TIMEOUT", "5")),
+          read=float(os.environ.get("TTS_READ_TIMEOUT", "10")),
+          write=float(os.environ.get("TTS_WRITE_TIMEOUT", "5")),
+          pool=float(os.environ.get("TTS_POOL_TIMEOUT", "5")),
+      )
+      # Shared by every session so provider latency and failures are learned worker-wide
+      self.tts = tts or TTSRouter.from_env(self.get_http_client, self.tts_timeout)
+
+  def get_http_client(self) -> httpx.AsyncClient:
+      """Shared keep-alive client for outbound TTS calls, created on first use"""
+      if self.http_client is None or self.http_client.is_closed:
+          limits = httpx.Limits(
+              max_connections=int(os.environ.get("TTS_HTTP_MAX_CONNECTIONS", "100")),
+              max_keepalive_connections=int(os.environ.get("TTS_HTTP_MAX_KEEPALIVE", "20")),
+              keepalive_expiry=float(os.environ.get("TTS_HTTP_KEEPALIVE_EXPIRY", "30")),
+          )
+          http2 = os.environ.get("TTS_HTTP2", "0").lower() in ("1", "true", "yes")
+          if http2:
+              try:
+                  import h2  # noqa: F401  (httpx needs it for HTTP/2)
+              except ImportError:
+                  print("TTS_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+                  http2 = False
+          self.http_client = httpx.AsyncClient(limits=limits, http2=http2, timeout=self.tts_timeout)
+      return self.http_client
+
+  def get_progress_store(self) -> Optional[ProgressStore]:
+      """Per-worker progress store, opened on first use (PROGRESS_DB_PATH empty disables it)"""
+      if self.progress_store is None:
+          path = os.environ.get("PROGRESS_DB_PATH", "tutor_progress.db")
+          if not path:
+              return None
+          self.progress_store = ProgressStore(path).start()
+      return self.progress_store
+
+  def get_transcript_store(self) -> Optional[TranscriptStore]:
+      """Per-worker transcript store, opened on first use (TRANSCRIPT_DB_PATH empty disables it)"""
+      if self.transcript_store is None:
+          path = os.environ.get("TRANSCRIPT_DB_PATH", "tutor_transcripts.db")
+          if not path:
+              return None
+          self.transcript_store = TranscriptStore(path).start()
+      return self.transcript_store
+
+  def share_status(self, session_id: str, state: Dict[str, Any]):
+      """Queue a session's state for the shared directory, if there is one; never blocks the loop"""
+      if self.directory is None:
+          return
+      try:
+          self.directory.update(session_id, state if state['active'] else None)
+      except Exception as e:
+          print(f"Error sharing status for {session_id}: {str(e)}")
+
+  def shared_status(self, session_id: str) -> Optional[Dict[str, Any]]:
+      """Status of a session held by another worker, from the shared directory"""
+      if self.directory is None:
+          return None
+      try:
+          return self.directory.get(session_id)
+      except Exception as e:
+          print(f"Error reading shared status for {session_id}: {str(e)}")
+          return None
+
+  async def close_http_client(self):
+      """Close the shared TTS client and its pooled connections"""
+      if self.http_client is not None:
+          client, self.http_client = self.http_client, None
+          await client.aclose()
+
+  def get(self, session_id: str) -> Optional[TutorSession]:
+      """Return the session registered under session_id, if any"""
+      return self.sessions.get(session_id)
+
+  @property
+  def active_count(self) -> int:
+      return sum(1 for session in list(self.sessions.values()) if session.active)
+
+  async def start_session(self, session_id: str, child_data) -> bool:
+      """Create and start a session; a running or starting session with the same id is reused"""
+      pending = self.starting.get(session_id)
+      if pending is not None:
+          print(f"Session {session_id} is already starting")
+          # shield: one caller giving up must not cancel the start for the others
+          return await asyncio.shield(pending)
+      session = self.sessions.get(session_id)
+      if session and session.active:
+          print(f"Session {session_id} is already active")
+          return True
+      if session is None and len(self.sessions) >= self.max_sessions:
+          print(f"Session limit reached ({self.max_sessions}), refusing {session_id}")
+          return False
+
+      session = session or TutorSession(session_id, self)
+      self.sessions[session_id] = session
+      pending = self.starting[session_id] = asyncio.get_running_loop().create_future()
+      started = False
+      try:
+          started = await session.start(child_data)
+          if not started:
+              await session.stop()
+              self.sessions.pop(session_id, None)
+      finally:
+          del self.starting[session_id]
+          pending.set_result(started)
+      return started
+
+  async def stop_session(self, session_id: str) -> bool:
+      """Stop a session and drop it from the registry; False if this worker holds no such session"""
+      session = self.sessions.pop(session_id, None)
+      if session is None:
+          print(f"No session registered for {session_id}")
+          return False
+      stopped = await session.stop()
+      self.events.discard(session_id)
+      if not self.sessions:
+          # Last room closed: drop the pooled connections until the next session
+          await self.close_http_client()
+      return stopped
+
+  async def stop_all(self):
+      """Stop every registered session"""
+      for session_id in list(self.sessions):
+          await self.stop_session(session_id)
+      await self.close_http_client()
+
+  async def shutdown(self):
+      """Stop every session and close the worker-wide resources"""
+      await self.stop_all()
+      if self.progress_store is not None:
+          store, self.progress_store = self.progress_store, None
+          await store.close()
+      if self.transcript_store is not None:
+          transcripts, self.transcript_store = self.transcript_store, None
+          await transcripts.close()
+      if self.directory is not None:
+          directory, self.directory = self.directory, None
+          directory.close()
+
+  def get_status(self, session_id: str):
+      """Get status for one session"""
+      session = self.sessions.get(session_id)
+      if session is None:
+          shared = self.shared_status(session_id)
+          if shared is not None:
+              return {**shared, 'memory_status': None}
+          return {'session_id': session_id, 'active': False, 'room_name': None, 'memory_status': None}
+      return session.get_status()
+
+  def get_messages(self, session_id: str, after: Optional[int] = None,
+                   limit: int = MAX_MESSAGES_PAGE) -> Dict[str, Any]:
+      """Messages after a cursor (or the latest ones), with the cursor for the next call.
+
+      Stopped sessions are still served from the transcript store.
+      """
+      limit = max(1, min(limit, MAX_MESSAGES_PAGE))
+      session = self.sessions.get(session_id)
+      transcript = session.transcript if session else None
+      if after is None:
+          messages = transcript.recent(min(limit, 10)) if transcript else []
+          cursor = transcript.last_seq if transcript else 0
+      else:
+          if transcript is not None:
+              messages = transcript.after(after, limit)
+          else:
+              # Read-only here: opening the store needs the event loop, and control routes may run off it
+              store = self.transcript_store
+              messages = store.read(session_id, after, limit) if store else []
+          cursor = messages[-1]['seq'] if messages else after
+      return {'messages': messages, 'cursor': cursor}
+
+  def list_sessions(self):
+      """Summarize every registered session"""
+      return {
+          'active_sessions': self.active_count,
+          'max_sessions': self.max_sessions,
+          'worker': self.directory.worker if self.directory is not None else None,
+          'tts_cache': self.tts_cache.get_stats(),
+          'tts_providers': self.tts.get_stats(),
+          'events': self.events.get_stats(),
+          'tokens': self.tokens.get_stats(),
+          'audio_bank': self.audio_bank.get_stats() if self.audio_bank is not None else None,
+          'sessions': [
+              {'session_id': s.session_id, 'active': s.active, 'started_at': s.started_at}
+              for s in list(self.sessions.values())
+          ]
+      }
+
+
 app = Flask(__name__)
 session_manager = SessionManager()
+ACTIVE_SESSIONS.set_function(lambda: session_manager.active_count)
 SAMPLE_CHILD_DATA = {
   'name': 'Emma',
   'age': 6,
   'level': 'beginner'
 }
 
-def run_async(coro):
-  """Helper to run async functions in Flask"""
-  try:
-      if hasattr(session_manager, 'event_loop') and session_manager.event_loop and not session_manager.event_loop.is_closed():
-          loop = session_manager.event_loop
-      else:
-          loop = asyncio.new_event_loop()
-          session_manager.event_loop = loop
-          asyncio.set_event_loop(loop)
+class BackgroundLoop:
+  """A long-lived asyncio loop on its own thread that Flask routes submit work to"""
+  def __init__(self, name: str = "tutor-event-loop"):
+      self.name = name
+      self.loop = None
+      self.thread = None
+      self._lock = threading.Lock()
+
+  def start(self):
+      """Start the loop thread if it is not running yet"""
+      with self._lock:
+          if self.thread and self.thread.is_alive():
+              return self.loop
+          self.loop = asyncio.new_event_loop()
+          ready = threading.Event()
+
+          def run_loop():
+              asyncio.set_event_loop(self.loop)
+              self.loop.call_soon(ready.set)
+              self.loop.run_forever()
+
+          self.thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+          self.thread.start()
+          ready.wait()
+          return self.loop
+
+  def submit(self, coro) -> concurrent.futures.Future:
+      """Schedule a coroutine on the loop without waiting for it"""
+      return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+  def run(self, coro, timeout: Optional[float] = CONTROL_TIMEOUT, cancel_on_timeout: bool = True):
+      """Run a coroutine on the loop and wait up to timeout seconds for its result"""
+      future = self.submit(coro)
+      try:
+          return future.result(timeout)
+      except concurrent.futures.TimeoutError:
+          if cancel_on_timeout:
+              future.cancel()
+          raise
+
+  def stop(self, timeout: float = 5.0):
+      """Stop the loop and join its thread"""
+      if not self.loop or not self.thread:
+          return
+      self.loop.call_soon_threadsafe(self.loop.stop)
+      self.thread.join(timeout)
+      self.loop = None
+      self.thread = None
 
-      return loop.run_until_complete(coro)
-  except Exception as e:
-      print(f"Error in run_async: {str(e)}")
-      return None
-
-# Fixed token creation function - add this before the Flask routes
-def create_room_token(identity: str, room_name: str) -> str:
-  """Create a token for joining the LiveKit room using the new API"""
-  token = (
-      AccessToken(
-          api_key=os.environ["LIVEKIT_API_KEY"],
-          api_secret=os.environ["LIVEKIT_API_SECRET"]
-      )
-      .with_identity(identity)
-      .with_name(identity)
-      .with_grants(
-          VideoGrants(
-              room_join=True,
-              room=room_name,
-              can_publish=True,
-              can_subscribe=True,
-              can_publish_data=True
-          )
-      )
-  )
-  return token.to_jwt()
+
+background_loop = BackgroundLoop()
+
+def _shutdown():
+  """Stop every session and the loop thread on interpreter exit"""
+  if background_loop.thread and background_loop.thread.is_alive():
+      try:
+          background_loop.run(session_manager.shutdown(), timeout=CONTROL_TIMEOUT)
+      except Exception as e:
+          print(f"Error during shutdown: {str(e)}")
+      background_loop.stop()
+
+# Run before concurrent.futures stops accepting work at exit: stopping a session flushes the
+# progress and transcript stores through their writer threads and reads the TTS disk cache.
+# Plain atexit handlers run after that, so every pending write would fail.
+if hasattr(threading, '_register_atexit'):
+  threading._register_atexit(_shutdown)
+else:
+  atexit.register(_shutdown)
+
+def _request_session_id() -> str:
+  """Read the session id from the JSON body or query string"""
+  body = request.get_json(silent=True) or {}
+  return str(body.get('session_id') or request.args.get('session_id') or DEFAULT_SESSION_ID)
+
+def _request_child_data() -> Dict[str, Any]:
+  """Read child details from the JSON body, falling back to the sample child"""
+  body = request.get_json(silent=True) or {}
+  child = body.get('child') or {}
+  return {**SAMPLE_CHILD_DATA, **child}
+
+def token_response(issued: IssuedToken) -> Dict[str, Any]:
+  return {'identity': issued.identity, 'room': issued.room, 'token': issued.token,
+          'expires_at': int(issued.expires_at)}
+
+def token_participants(body: Dict[str, Any], default_room: str) -> List[Tuple[str, str, Optional[str]]]:
+  """(identity, room, name) for each entry of a bulk token request; raises ValueError if malformed"""
+  participants = body.get('participants')
+  if not isinstance(participants, list) or not participants:
+      raise ValueError("participants must be a non-empty list")
+  if len(participants) > MAX_BULK_TOKENS:
+      raise ValueError(f"At most {MAX_BULK_TOKENS} participants per request")
+  parsed = []
+  for participant in participants:
+      if isinstance(participant, str) and participant:
+          parsed.append((participant, default_room, None))
+      elif isinstance(participant, dict) and participant.get('identity'):
+          parsed.append((str(participant['identity']),
+                         str(participant.get('session_id') or default_room),
+                         participant.get('name')))
+      else:
+          raise ValueError("each participant must be an identity or an object with an identity")
+  reserved = [identity for identity, _, _ in parsed if identity.startswith(TUTOR_IDENTITY_PREFIX)]
+  if reserved:
+      raise ValueError(f"Identities starting with '{TUTOR_IDENTITY_PREFIX}' are reserved: {', '.join(reserved)}")
+  return parsed
+
+def student_identity(body: Dict[str, Any]) -> str:
+  """The page's participant identity, built from its stable student_id; raises ValueError if malformed
+
+  The identity is always STUDENT_IDENTITY_PREFIX plus the id, so a client
+  can neither take the tutor's identity nor fill the token cache with a
+  fresh random identity per request.
+  """
+  student_id = body.get('student_id')
+  if not isinstance(student_id, str) or not STUDENT_ID_PATTERN.fullmatch(student_id):
+      raise ValueError("student_id must be 1-64 letters, digits, '-' or '_'")
+  return STUDENT_IDENTITY_PREFIX + student_id
+
+def unknown_session(session_id: str) -> Dict[str, Any]:
+  """Error body for a session this worker does not hold, naming the worker that does, if any"""
+  shared = session_manager.shared_status(session_id)
+  if shared is not None and shared.get('active'):
+      return {'status': 'error', 'session_id': session_id, 'worker': shared['worker'],
+              'message': f"Session is running on worker {shared['worker']}"}
+  return {'status': 'error', 'session_id': session_id, 'message': 'No such session'}
+
+def unknown_rooms(participants: List[Tuple[str, str, Optional[str]]]) -> List[str]:
+  """Rooms in a token request that no worker is running a session for"""
+  unknown = []
+  for room in dict.fromkeys(room for _, room, _ in participants):
+      session = session_manager.get(room)
+      if session is not None and session.active:
+          continue
+      shared = session_manager.shared_status(room)
+      if shared is None or not shared.get('active'):
+          unknown.append(room)
+  return unknown
 
 @app.route('/')
 def index():
   """Main page with control buttons"""
-  return render_template('index.html', 
-                         session_active=session_manager.active,
+  session = session_manager.get(DEFAULT_SESSION_ID)
+  return render_template('index.html',
+                         session_active=bool(session and session.active),
                          child_name=SAMPLE_CHILD_DATA['name'])
 
 @app.route('/start_session', methods=['POST'])
 def start_session():
   """Start the voice tutoring session"""
   try:
-      success = run_async(session_manager.start_session(SAMPLE_CHILD_DATA))
+      session_id = _request_session_id()
+      child_data = _request_child_data()
+      try:
+          # A slow room connect keeps going in the background; the client can poll /status
+          success = background_loop.run(session_manager.start_session(session_id, child_data),
+                                        cancel_on_timeout=False)
+      except concurrent.futures.TimeoutError:
+          return jsonify({'status': 'pending', 'session_id': session_id,
+                          'message': 'Session is still starting, check /status'}), 202
       if success:
-          return jsonify({'status': 'success', 'message': f'Session started for {SAMPLE_CHILD_DATA["name"]}'})
+          return jsonify({'status': 'success', 'session_id': session_id,
+                          'message': f'Session started for {child_data["name"]}'})
       else:
-          return jsonify({'status': 'error', 'message': 'Failed to start session'}), 500
+          return jsonify({'status': 'error', 'session_id': session_id, 'message': 'Failed to start session'}), 500
   except Exception as e:
       print(f"Error in start_session route: {str(e)}")
       return jsonify({'status': 'error', 'message': f'Error starting session: {str(e)}'}), 500
@@ -395,34 +893,111 @@ def start_session():
 def stop_session():
   """Stop the voice tutoring session"""
   try:
-      success = run_async(session_manager.stop_session())
+      session_id = _request_session_id()
+      if session_manager.get(session_id) is None:
+          return jsonify(unknown_session(session_id)), 404
+      try:
+          # Cancelling a half-finished stop would leave the room joined; let it finish in the background
+          success = background_loop.run(session_manager.stop_session(session_id), cancel_on_timeout=False)
+      except concurrent.futures.TimeoutError:
+          return jsonify({'status': 'pending', 'session_id': session_id,
+                          'message': 'Session is still stopping, check /status'}), 202
       if success:
-          return jsonify({'status': 'success', 'message': 'Session stopped successfully'})
+          return jsonify({'status': 'success', 'session_id': session_id, 'message': 'Session stopped successfully'})
       else:
-          return jsonify({'status': 'error', 'message': 'Failed to stop session'}), 500
+          return jsonify({'status': 'error', 'session_id': session_id, 'message': 'Failed to stop session'}), 500
   except Exception as e:
       print(f"Error in stop_session route: {str(e)}")
       return jsonify({'status': 'error', 'message': f'Error stopping session: {str(e)}'}), 500
 
+@app.route('/get_token', methods=['POST'])
+def get_token():
+  """Token for the browser to join a session's LiveKit room"""
+  body = request.get_json(silent=True) or {}
+  try:
+      identity = student_identity(body)
+  except ValueError as e:
+      return jsonify({'status': 'error', 'message': str(e)}), 400
+  room = _request_session_id()
+  # Only rooms with a running session, as for /get_tokens
+  if unknown_rooms([(identity, room, None)]):
+      return jsonify({'status': 'error', 'message': f'No active session: {room}'}), 404
+  try:
+      issued = session_manager.tokens.issue(identity, room, name=body.get('name'))
+      return jsonify({'status': 'success', 'ws_url': LIVEKIT_URL, **token_response(issued)})
+  except Exception as e:
+      print(f"Error in get_token route: {str(e)}")
+      return jsonify({'status': 'error', 'message': f'Error creating token: {str(e)}'}), 500
+
+@app.route('/get_tokens', methods=['POST'])
+def get_tokens():
+  """Tokens for a whole classroom in one request"""
+  try:
+      body = request.get_json(silent=True) or {}
+      participants = token_participants(body, _request_session_id())
+  except ValueError as e:
+      return jsonify({'status': 'error', 'message': str(e)}), 400
+  # Only rooms with a running session, so the route cannot mint tokens for arbitrary rooms
+  unknown = unknown_rooms(participants)
+  if unknown:
+      return jsonify({'status': 'error', 'message': f'No active session: {", ".join(unknown)}'}), 404
+  try:
+      issued = session_manager.tokens.issue_many(participants)
+      return jsonify({'status': 'success', 'ws_url': LIVEKIT_URL, 'tokens': [token_response(t) for t in issued]})
+  except Exception as e:
+      print(f"Error in get_tokens route: {str(e)}")
+      return jsonify({'status': 'error', 'message': f'Error creating tokens: {str(e)}'}), 500
+
 @app.route('/status')
 def status():
   """Get current session status"""
+  session_id = _request_session_id()
+  session = session_manager.get(session_id)
+  if session is None:
+      shared = session_manager.shared_status(session_id)
+      if shared is not None:
+          # Held by another worker: answer from the shared directory
+          return jsonify({'session_id': session_id, 'active': shared['active'], 'room_name': session_id,
+                          'worker': shared['worker'], 'recent_messages': [], 'playout': None})
   return jsonify({
-      'active': session_manager.active, 
-      'room_name': session_manager.room_name,
-      'recent_messages': session_manager.recent_messages[-5:] if session_manager.recent_messages else []
+      'session_id': session_id,
+      'active': bool(session and session.active),
+      'room_name': session_id,
+      'recent_messages': session.transcript.recent(5) if session else [],
+      'playout': session.playout.get_stats() if session and session.playout else None
   })
 
 @app.route('/messages')
 def get_messages():
-  """Get recent agent messages"""
-  return jsonify({
-      'messages': session_manager.recent_messages[-10:] if session_manager.recent_messages else []
-  })
+  """Recent agent messages, or only those after ?after=<cursor>"""
+  try:
+      after = request.args.get('after', type=int)
+      limit = request.args.get('limit', default=MAX_MESSAGES_PAGE, type=int)
+      return jsonify(session_manager.get_messages(_request_session_id(), after, limit))
+  except Exception as e:
+      print(f"Error in messages route: {str(e)}")
+      return jsonify({'status': 'error', 'message': f'Error reading messages: {str(e)}'}), 500
+
+@app.route('/sessions')
+def list_sessions():
+  """List every session held by this process"""
+  return jsonify(session_manager.list_sessions())
+
+@app.route('/events')
+def events():
+  """Server-Sent Events stream of one session's status, messages and memory"""
+  session_id = _request_session_id()
+  stream = session_manager.events.stream(session_id, request.headers.get('Last-Event-ID'))
+  if stream is None:
+      return jsonify({'status': 'error', 'message': 'Too many event subscribers, poll /status instead'}), 503
+  return Response(stream, mimetype='text/event-stream',
+                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+  """Turn latency histograms and TTS counters in Prometheus text format"""
+  return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
   print("Starting LiveKit Session Control Server...")
   app.run(host="0.0.0.0", port=5000, debug=False, use_reloader=False)
-
-
-
@@ -0,0 +1,154 @@
+import bisect
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+
+DEFAULT_SESSION_ID = "phonics-room"
+HASH_RING_REPLICAS = int(os.environ.get("HASH_RING_REPLICAS", "160"))  # virtual nodes per worker
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    worker INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_by_worker ON sessions (worker);
+"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of session (room) ids onto workers
+
+    Each worker owns `replicas` points on a 64-bit ring and a key belongs
+    to the first point at or after its hash. The mapping depends only on
+    the key and the worker names, so every process computes the same
+    owner, and adding or removing one worker moves only about 1/N of the
+    sessions.
+    """
+
+    def __init__(self, nodes: Sequence[str], replicas: int = HASH_RING_REPLICAS):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self.nodes = list(nodes)
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        i = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[i if i < len(self._owners) else 0]
+
+
+class SessionDirectory:
+    """Where each live session runs and its last status, shared by all workers on a host
+
+    A small SQLite table in WAL mode: each worker writes its own rows when
+    a session starts or stops (a handful of writes per session), and any
+    worker can read any row. That lets the control API answer /status for
+    a session held by a different process. Workers queue their writes with
+    update(), which never touches SQLite on the caller's thread: a single
+    writer thread applies the latest status per session in one transaction.
+    """
+
+    def __init__(self, path: Optional[str] = None, worker: Optional[int] = None):
+        self.path = path or os.environ.get("SESSION_DIRECTORY_PATH", "tutor_sessions.db")
+        self.worker = int(os.environ.get("WORKER_INDEX", "0")) if worker is None else worker
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Optional[str]] = {}  # session id -> status JSON, None to remove
+        self._pending_lock = threading.Lock()
+        self._writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["SessionDirectory"]:
+        """The shared directory when SESSION_DIRECTORY_PATH is set (the supervisor sets it)"""
+        path = os.environ.get("SESSION_DIRECTORY_PATH", "")
+        return cls(path) if path else None
+
+    def update(self, session_id: str, status: Optional[Dict[str, Any]]):
+        """Queue a publish (or a remove, for None) for the writer thread; returns at once"""
+        with self._pending_lock:
+            schedule = not self._pending
+            self._pending[session_id] = None if status is None else json.dumps(status)
+            if schedule and self._writer is None:
+                self._writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="session-directory")
+        if not schedule:
+            return  # the flush already queued will pick this one up
+        try:
+            self._writer.submit(self._flush_logged)
+        except RuntimeError:
+            # Executors refuse work at interpreter exit; write on this thread instead
+            self._flush_logged()
+
+    def flush(self):
+        """Write every queued update in one transaction"""
+        with self._pending_lock:
+            updates, self._pending = self._pending, {}
+        if not updates:
+            return
+        now, pid = time.time(), os.getpid()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for session_id, status in updates.items():
+                    if status is None:
+                        self._conn.execute("DELETE FROM sessions WHERE session_id = ? AND worker = ?",
+                                           (session_id, self.worker))
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO sessions (session_id, worker, pid, status, updated) "
+                            "VALUES (?, ?, ?, ?, ?)", (session_id, self.worker, pid, status, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error writing session directory: {str(e)}")
+
+    def purge_worker(self, worker: int) -> int:
+        """Forget every session a worker held, e.g. after it died; returns how many"""
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE worker = ?", (worker,)).rowcount
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """{'worker', 'pid', 'updated', **status} for a session, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT worker, pid, status, updated FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[2]), 'worker': row[0], 'pid': row[1], 'updated': row[3]}
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, worker, status FROM sessions ORDER BY session_id").fetchall()
+        return [{**json.loads(status), 'session_id': session_id, 'worker': worker}
+                for session_id, worker, status in rows]
+
+    def close(self):
+        """Write anything still queued, then close the connection"""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+        self._flush_logged()
+        with self._lock:
+            self._conn.close()
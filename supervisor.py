@@ -0,0 +1,248 @@
+"""
+Supervisor mode: one session-control worker per core behind a routing front end.
+
+    python supervisor.py                          # a worker per core, front end on :8000
+    python supervisor.py --workers 32 --port 8000 --pin-cpus
+
+Each worker is `uvicorn asgi:app` on its own local port (PORT + 1 + index)
+with its own event loop, so audio decode and phonics scoring for
+different rooms run on different cores. The front end hashes every
+request's session id onto a consistent-hash ring of the workers, so all
+requests for a room reach the process that holds it. Workers publish
+session status to a shared SQLite directory (SESSION_DIRECTORY_PATH),
+and any worker answers /status for any session from it. A worker that
+exits is restarted on the same port and keeps its share of the ring.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from sharding import DEFAULT_SESSION_ID, HashRing, SessionDirectory
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESTART_BACKOFF = float(os.environ.get("WORKER_RESTART_BACKOFF", "1"))  # seconds, doubled per quick crash
+MAX_RESTART_BACKOFF = 30.0
+# Hop-by-hop headers are per connection and must not be forwarded
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'upgrade', 'te', 'trailer',
+               'proxy-authorization', 'proxy-authenticate', 'host', 'content-length'}
+
+
+class Worker:
+    """One `uvicorn asgi:app` process and the port it listens on"""
+
+    def __init__(self, index: int, port: int, cpu: Optional[int] = None):
+        self.index = index
+        self.port = port
+        self.cpu = cpu
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self, directory_path: str):
+        env = {
+            **os.environ,
+            'WORKER_INDEX': str(self.index),
+            'PORT': str(self.port),
+            'SESSION_DIRECTORY_PATH': directory_path,
+        }
+        # One process per core already; keep NumPy from starting a thread per core in each
+        for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            env.setdefault(var, '1')
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--no-access-log"],
+            cwd=REPO_DIR, env=env,
+        )
+        if self.cpu is not None and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(self.process.pid, {self.cpu})
+            except OSError as e:
+                print(f"Could not pin worker {self.index} to CPU {self.cpu}: {str(e)}")
+        self.started_at = time.monotonic()
+        print(f"Started worker {self.index} (pid {self.process.pid}) on port {self.port}")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self, timeout: float = 10.0):
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def get_stats(self):
+        return {'index': self.index, 'port': self.port, 'alive': self.alive, 'restarts': self.restarts,
+                'pid': self.process.pid if self.process else None, 'cpu': self.cpu}
+
+
+class Supervisor:
+    """Starts the workers, keeps them running and picks the worker for each session id"""
+
+    def __init__(self, workers: int, port: int, pin_cpus: bool = False, directory_path: Optional[str] = None):
+        cpus = sorted(os.sched_getaffinity(0)) if pin_cpus and hasattr(os, 'sched_getaffinity') else None
+        self.workers = [Worker(i, port + 1 + i, cpus[i % len(cpus)] if cpus else None) for i in range(workers)]
+        self.ring = HashRing([str(w.index) for w in self.workers])
+        self.directory_path = os.path.abspath(
+            directory_path or os.environ.get("SESSION_DIRECTORY_PATH") or "tutor_sessions.db")
+        self.directory = SessionDirectory(self.directory_path, worker=-1)
+        self.client: Optional[httpx.AsyncClient] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    def worker_for(self, session_id: str) -> Worker:
+        return self.workers[int(self.ring.node_for(session_id))]
+
+    async def start(self):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=20 * len(self.workers))
+        self.client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30.0, read=None))
+        for worker in self.workers:
+            # Rows left by a previous run describe sessions that no longer exist
+            self.directory.purge_worker(worker.index)
+            worker.start(self.directory_path)
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        """Restart workers that exit, backing off while one keeps crashing"""
+        while not self.stopping:
+            await asyncio.sleep(0.5)
+            for worker in self.workers:
+                if worker.alive or self.stopping:
+                    continue
+                if time.monotonic() - worker.started_at < worker.backoff:
+                    continue
+                print(f"Worker {worker.index} exited with code {worker.process.returncode}, restarting")
+                # Its sessions went with it
+                self.directory.purge_worker(worker.index)
+                quick_crash = time.monotonic() - worker.started_at < MAX_RESTART_BACKOFF
+                worker.backoff = min(worker.backoff * 2, MAX_RESTART_BACKOFF) if quick_crash else RESTART_BACKOFF
+                worker.restarts += 1
+                worker.start(self.directory_path)
+
+    async def stop(self):
+        self.stopping = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._monitor
+        if self.client is not None:
+            # Drops relayed /events streams first; a worker waits for its open connections before exiting
+            await self.client.aclose()
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in self.workers))
+        for worker in self.workers:
+            self.directory.purge_worker(worker.index)
+        self.directory.close()
+
+
+supervisor: Optional[Supervisor] = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await supervisor.start()
+    yield
+    await supervisor.stop()
+
+
+app = FastAPI(title="Phonics Tutor Supervisor", lifespan=lifespan)
+
+
+def _session_id(request: Request, body: bytes) -> str:
+    """Session id from the JSON body or query string, as the workers read it"""
+    if body:
+        try:
+            parsed = json.loads(body)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict) and parsed.get('session_id'):
+            return str(parsed['session_id'])
+    return request.query_params.get('session_id') or DEFAULT_SESSION_ID
+
+
+async def _forward(request: Request, worker: Worker, body: bytes) -> Response:
+    """Relay one request to a worker and stream its response back"""
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS]
+    upstream = supervisor.client.build_request(request.method, worker.url + request.url.path,
+                                               params=request.query_params, headers=headers, content=body)
+    try:
+        response = await supervisor.client.send(upstream, stream=True)
+    except httpx.TransportError as e:
+        print(f"Error reaching worker {worker.index}: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'Worker {worker.index} is unavailable'},
+                            status_code=503)
+    headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+    return StreamingResponse(response.aiter_raw(), status_code=response.status_code, headers=headers,
+                             background=BackgroundTask(response.aclose))
+
+
+@app.get('/sessions')
+async def list_sessions():
+    """Every worker's /sessions, plus the shared directory of live sessions"""
+    async def fetch(worker: Worker):
+        try:
+            response = await supervisor.client.get(worker.url + '/sessions', timeout=5.0)
+            return response.json()
+        except Exception as e:
+            return {'error': str(e)}
+
+    per_worker = await asyncio.gather(*(fetch(worker) for worker in supervisor.workers))
+    return {
+        'active_sessions': sum(w.get('active_sessions', 0) for w in per_worker),
+        'workers': [{**worker.get_stats(), 'sessions': stats} for worker, stats in zip(supervisor.workers, per_worker)],
+        'directory': supervisor.directory.list(),
+    }
+
+
+@app.get('/metrics')
+async def metrics(request: Request):
+    """One worker's metrics (?worker=N, default 0); scrape each worker's port for all of them"""
+    try:
+        worker = supervisor.workers[int(request.query_params.get('worker', '0'))]
+    except (ValueError, IndexError):
+        return JSONResponse({'status': 'error', 'message': 'Unknown worker'}, status_code=400)
+    return await _forward(request, worker, b"")
+
+
+@app.api_route('/{path:path}', methods=['GET', 'POST'])
+async def route(request: Request, path: str):
+    """Send the request to the worker that owns its session id"""
+    body = await request.body()
+    return await _forward(request, supervisor.worker_for(_session_id(request, body)), body)
+
+
+def main(argv: Optional[List[str]] = None):
+    global supervisor
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run one session-control worker per core behind a router")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--pin-cpus", action="store_true", help="pin each worker to one CPU")
+    args = parser.parse_args(argv)
+
+    supervisor = Supervisor(args.workers, args.port, pin_cpus=args.pin_cpus)
+    print(f"Starting supervisor with {args.workers} workers on port {args.port}...")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Script preamble: sessions of server.py's manager join a stub room instead of LiveKit
+STUB_ROOMS = textwrap.dedent("""
+    import asyncio
+    import time
+    import loadtest
+    import server
+
+    server.session_manager.room_factory = loadtest.StubRoom
+    server.session_manager.audio_factory = loadtest.stub_audio_factory
+    server.TutorSession._greet_when_ready = lambda self, name: asyncio.sleep(0)
+""")
+
+
+def run_script(script, tmp_path, **env):
+    """Run script in a fresh interpreter in the repo, with its stores under tmp_path; fails on errors"""
+    env = {
+        **os.environ,
+        'LIVEKIT_API_KEY': "test",
+        'LIVEKIT_API_SECRET': "test-secret-test-secret-test-secret",
+        'PROGRESS_DB_PATH': str(tmp_path / "progress.db"),
+        'TRANSCRIPT_DB_PATH': str(tmp_path / "transcripts.db"),
+        'AUDIO_BANK_PATH': "",
+        'TTS_CACHE_DIR': "",
+        **env,
+    }
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Error stopping session" not in result.stdout, result.stdout
+    return result
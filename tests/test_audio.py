@@ -0,0 +1,24 @@
+from audio import PCMStreamDecoder
+
+
+def test_stream_decoder_yields_whole_samples_in_order():
+    decoder = PCMStreamDecoder(sample_rate=16000, min_ms=10)  # 320 bytes per block at least
+    pcm = bytes(range(256)) * 8
+    blocks = []
+    for start in range(0, len(pcm), 77):  # odd-sized network chunks split samples
+        block = decoder.feed(pcm[start:start + 77])
+        if block is not None:
+            assert len(block) >= decoder.min_bytes
+            blocks.append(block)
+    tail = decoder.flush()
+    if tail:
+        blocks.append(tail)
+    assert all(len(block) % 2 == 0 for block in blocks)
+    assert b"".join(blocks) == pcm
+
+
+def test_stream_decoder_drops_a_trailing_half_sample():
+    decoder = PCMStreamDecoder(min_ms=10)
+    assert decoder.feed(b"\x01\x02\x03") is None
+    assert decoder.flush() == b"\x01\x02"
+    assert decoder.flush() is None
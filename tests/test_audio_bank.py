@@ -0,0 +1,32 @@
+import hashlib
+
+import pytest
+
+from audio_bank import ALIGNMENT, AudioBank, write_pack
+
+
+def key(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def test_write_pack_then_get_round_trips(tmp_path):
+    path = str(tmp_path / "tutor.bank")
+    entries = {key(f"phrase {i}"): bytes([i]) * (2 * i + 3) for i in range(20)}
+    write_pack(path, entries)
+
+    bank = AudioBank(path)
+    assert len(bank) == 20
+    for k, pcm in entries.items():
+        view = bank.get(k)
+        assert isinstance(view, memoryview)  # zero-copy slice of the mapped file
+        assert bytes(view) == pcm
+    assert bank.get(key("never rendered")) is None
+    assert bank.get_stats()['hits'] == 20 and bank.get_stats()['misses'] == 1
+    assert all(int(offset) % ALIGNMENT == 0 for offset in bank._index['offset'])
+
+
+def test_rejects_a_file_that_is_not_a_pack(tmp_path):
+    path = tmp_path / "other.bank"
+    path.write_bytes(b"not a bank" * 10)
+    with pytest.raises(ValueError):
+        AudioBank(str(path))
@@ -0,0 +1,131 @@
+import textwrap
+
+from conftest import STUB_ROOMS, run_script
+
+# A stop that outlives CONTROL_TIMEOUT is answered with 202 and still completes
+SLOW_STOP = STUB_ROOMS + textwrap.dedent("""
+    stopped = []
+    original_stop = server.TutorSession.stop
+
+    async def slow_stop(self):
+        await asyncio.sleep(1.0)
+        result = await original_stop(self)
+        stopped.append(self.session_id)
+        return result
+
+    server.TutorSession.stop = slow_stop
+""")
+
+FLASK_STOP = SLOW_STOP + textwrap.dedent("""
+    client = server.app.test_client()
+    assert client.post('/start_session', json={'session_id': 'slow'}).status_code == 200
+    response = client.post('/stop_session', json={'session_id': 'slow'})
+    assert response.status_code == 202, response.get_json()
+    assert response.get_json()['status'] == 'pending'
+    time.sleep(1.5)
+    assert stopped == ['slow'], stopped
+""")
+
+ASGI_STOP = SLOW_STOP + textwrap.dedent("""
+    from fastapi.testclient import TestClient
+    import asgi
+
+    with TestClient(asgi.app) as client:
+        assert client.post('/start_session', json={'session_id': 'slow'}).status_code == 200
+        response = client.post('/stop_session', json={'session_id': 'slow'})
+        assert response.status_code == 202, response.json()
+        assert response.json()['status'] == 'pending'
+        time.sleep(1.5)
+        assert stopped == ['slow'], stopped
+""")
+
+# Concurrent starts of one id start the room once; a stop of an unknown id is a 404
+START_ONCE = STUB_ROOMS + textwrap.dedent("""
+    starts = []
+    original_start = server.TutorSession.start
+
+    async def slow_start(self, child_data):
+        starts.append(self.session_id)
+        await asyncio.sleep(0.2)
+        return await original_start(self, child_data)
+
+    server.TutorSession.start = slow_start
+
+    async def start_twice():
+        manager = server.session_manager
+        return await asyncio.gather(*(manager.start_session('twice', {'name': 'Ann'}) for _ in range(3)))
+
+    assert server.background_loop.run(start_twice()) == [True, True, True]
+    assert starts == ['twice'], starts
+    assert not server.session_manager.starting
+
+    client = server.app.test_client()
+    assert client.post('/stop_session', json={'session_id': 'nobody'}).status_code == 404
+    assert not server.background_loop.run(server.session_manager.stop_session('nobody'))
+    assert client.post('/stop_session', json={'session_id': 'twice'}).status_code == 200
+    assert client.post('/stop_session', json={'session_id': 'twice'}).status_code == 404
+""")
+
+# Bulk tokens only for rooms with a running session, and only up to MAX_BULK_TOKENS
+BULK_TOKENS = STUB_ROOMS + textwrap.dedent("""
+    from tokens import MAX_BULK_TOKENS
+
+    client = server.app.test_client()
+    response = client.post('/get_tokens', json={'session_id': 'class-3a', 'participants': ['emma']})
+    assert response.status_code == 404, response.get_json()
+    assert client.post('/start_session', json={'session_id': 'class-3a'}).status_code == 200
+    response = client.post('/get_tokens', json={'session_id': 'class-3a', 'participants': ['emma', 'omar']})
+    assert response.status_code == 200, response.get_json()
+    assert len(response.get_json()['tokens']) == 2
+    mixed = ['emma', {'identity': 'omar', 'session_id': 'class-3b'}]
+    assert client.post('/get_tokens', json={'session_id': 'class-3a', 'participants': mixed}).status_code == 404
+    crowd = [f"child-{i}" for i in range(MAX_BULK_TOKENS + 1)]
+    assert client.post('/get_tokens', json={'session_id': 'class-3a', 'participants': crowd}).status_code == 400
+""")
+
+# A page token is for a running session only, under an identity the server builds
+PAGE_TOKEN = STUB_ROOMS + textwrap.dedent("""
+    client = server.app.test_client()
+    response = client.post('/get_token', json={'session_id': 'room-1', 'student_id': 'k3x9'})
+    assert response.status_code == 404, response.get_json()
+    assert client.post('/start_session', json={'session_id': 'room-1'}).status_code == 200
+    response = client.post('/get_token', json={'session_id': 'room-1', 'student_id': 'k3x9', 'identity': 'tutor-1'})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['identity'] == 'student-k3x9'
+    assert response.get_json()['room'] == 'room-1'
+    again = client.post('/get_token', json={'session_id': 'room-1', 'student_id': 'k3x9'}).get_json()
+    assert again['token'] == response.get_json()['token']
+    for bad in ({}, {'student_id': ''}, {'student_id': 'a b'}, {'student_id': 7}):
+        assert client.post('/get_token', json={'session_id': 'room-1', **bad}).status_code == 400, bad
+    tutor = {'session_id': 'room-1', 'participants': ['emma', 'tutor-1234']}
+    assert client.post('/get_tokens', json=tutor).status_code == 400
+
+    from fastapi.testclient import TestClient
+    import asgi
+
+    asgi_client = TestClient(asgi.app)
+    assert asgi_client.post('/get_token', json={'session_id': 'room-2', 'student_id': 'k3x9'}).status_code == 404
+    assert asgi_client.post('/get_token', json={'session_id': 'room-1'}).status_code == 400
+    response = asgi_client.post('/get_token', json={'session_id': 'room-1', 'student_id': 'k3x9'})
+    assert response.json()['token'] == again['token'], response.json()
+""")
+
+
+def test_flask_stop_past_timeout_finishes_in_background(tmp_path):
+    run_script(FLASK_STOP, tmp_path, CONTROL_TIMEOUT="0.3")
+
+
+def test_asgi_stop_past_timeout_finishes_in_background(tmp_path):
+    run_script(ASGI_STOP, tmp_path, CONTROL_TIMEOUT="0.3")
+
+
+def test_concurrent_starts_share_one_start_and_unknown_stops_are_404(tmp_path):
+    run_script(START_ONCE, tmp_path)
+
+
+def test_bulk_tokens_need_a_running_session(tmp_path):
+    run_script(BULK_TOKENS, tmp_path)
+
+
+def test_page_token_needs_a_running_session_and_a_student_id(tmp_path):
+    run_script(PAGE_TOKEN, tmp_path)
@@ -0,0 +1,36 @@
+import gc
+
+from events import EventBroadcaster
+
+
+def test_unknown_session_channel_is_dropped_with_its_last_subscriber():
+    events = EventBroadcaster()
+    stream = events.stream('no-such-room', keepalive=0.01)
+    assert next(stream).startswith('retry:')
+    assert events.get_stats()['channels'] == 1
+    stream.close()
+    assert events.get_stats() == {'channels': 0, 'subscribers': 0, 'threaded_subscribers': 0}
+
+
+def test_live_session_channel_outlives_subscribers_until_discarded():
+    events = EventBroadcaster()
+    events.publish('room', 'status', {'state': 'running'})
+    stream = events.stream('room', keepalive=0.01)
+    next(stream)
+    assert 'event: status' in next(stream)
+    stream.close()
+    assert events.get_stats()['channels'] == 1
+    events.discard('room')
+    assert events.get_stats()['channels'] == 0
+
+
+def test_subscriber_cap_counts_streams_that_never_started():
+    events = EventBroadcaster(max_subscribers=2, max_threaded_subscribers=1)
+    first = events.stream('room')
+    assert events.stream('room') is None  # threaded cap
+    second = events.stream_async('room')
+    assert second is not None
+    assert events.stream_async('room') is None  # overall cap
+    del first
+    gc.collect()
+    assert events.stream('room') is not None
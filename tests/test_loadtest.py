@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+from conftest import REPO_DIR
+
+
+def test_small_load_run_keeps_every_session_up(tmp_path):
+    env = {**os.environ, 'PROGRESS_DB_PATH': str(tmp_path / "progress.db"),
+           'TRANSCRIPT_DB_PATH': str(tmp_path / "transcripts.db")}
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "loadtest.py"), "--sessions", "3", "--duration", "2",
+         "--think", "0.2", "--tts-latency-ms", "20", "--tts-jitter-ms", "0", "--audio-ms-per-char", "2"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+    sessions, active, turns = result.stdout.splitlines()[-1].split()[:3]
+    assert (sessions, active) == ("3", "3")
+    assert int(turns) > 0
@@ -0,0 +1,42 @@
+import numpy as np
+
+import mastery
+from mastery import LETTERS, MasteryModel, next_letter_report, rank_next_letters
+
+
+def test_update_moves_probability_with_the_evidence():
+    model = MasteryModel()
+    up = model.update("b", True)
+    assert up > mastery.P_INIT and model.probability("B") == np.float32(up)
+    down = model.update("B", False)
+    assert down < up
+    for _ in range(20):
+        model.update("B", True)
+    assert model.mastered("B") and not model.mastered("C")
+
+
+def test_round_trips_through_bytes():
+    model = MasteryModel()
+    model.update("Q", True)
+    restored = MasteryModel.from_bytes(model.to_bytes())
+    assert len(model.to_bytes()) == 104
+    assert np.array_equal(restored.p, model.p)
+
+
+def test_rank_prefers_uncertain_letters_and_breaks_ties_alphabetically():
+    p = np.full((2, 26), mastery.P_INIT, dtype=np.float32)
+    p[0, LETTERS.index("M")] = 0.5
+    p[0, LETTERS.index("A")] = 0.99  # mastered, goes last
+    ranked = rank_next_letters(p, top_k=3)
+    assert ranked.shape == (2, 3)
+    assert [LETTERS[i] for i in ranked[0]] == ["M", "B", "C"]
+    assert [LETTERS[i] for i in ranked[1]] == ["A", "B", "C"]
+    assert LETTERS[np.argsort(-mastery.score_next_letters(p)[0], kind='stable')[-1]] == "A"
+
+
+def test_mastered_letters_come_back_weakest_first():
+    p = np.full((1, 26), 0.99, dtype=np.float32)
+    p[0, LETTERS.index("K")] = 0.96
+    assert MasteryModel(p[0]).next_letters(1) == ["K"]
+    report = next_letter_report(["child-1"], p, top_k=2)
+    assert report == {"child-1": [("K", 0.96), ("A", 0.99)]}
@@ -0,0 +1,38 @@
+from metrics import FIRST_AUDIO_SECONDS, TURN_STAGE_SECONDS, Registry, TurnTrace
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("test_latency_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        latency.observe(value, stage="tts")
+    text = registry.render()
+    assert 'test_latency_seconds_bucket{stage="tts",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="tts",le="1.0"} 3' in text
+    assert 'test_latency_seconds_bucket{stage="tts",le="+Inf"} 4' in text
+    assert 'test_latency_seconds_count{stage="tts"} 4' in text
+    assert "# TYPE test_latency_seconds histogram" in text
+
+
+def test_registry_rejects_duplicate_names():
+    registry = Registry()
+    registry.counter("test_total", "Test counter")
+    try:
+        registry.counter("test_total", "Again")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("duplicate metric was registered")
+
+
+def test_turn_trace_records_stages_and_first_frame_once():
+    stages = TURN_STAGE_SECONDS.count(stage="test_stage")
+    first_audio = FIRST_AUDIO_SECONDS.count(kind="test")
+    trace = TurnTrace("room", kind="test")
+    with trace.span("test_stage"):
+        pass
+    trace.first_frame()
+    trace.first_frame()
+    assert TURN_STAGE_SECONDS.count(stage="test_stage") == stages + 1
+    assert FIRST_AUDIO_SECONDS.count(kind="test") == first_audio + 1
+    assert set(trace.summary()) == {"test_stage_done", "first_frame"}
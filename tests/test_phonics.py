@@ -0,0 +1,26 @@
+import asyncio
+
+from agent import Assistant, PhonicsHelper
+
+
+def test_letter_name_is_a_direct_match():
+    assert PhonicsHelper.check_pronunciation('A', "A")
+    assert PhonicsHelper.check_pronunciation('b', " b ")
+    assert not PhonicsHelper.check_pronunciation('B', "A")
+
+
+def test_single_letter_attempt_raises_mastery():
+    assistant = Assistant({'name': 'Ann'})
+    before = assistant.memory.mastery.probability('A')
+    feedback = asyncio.run(assistant._analyze_phonics_response("A"))
+    assert feedback == PhonicsHelper.FEEDBACK_CORRECT.format(letter='A')
+    assert assistant.memory.mastery.probability('A') > before
+
+
+def test_transcript_sharing_no_bigram_gets_no_matches():
+    from phonics_scoring import PronunciationScorer
+
+    scorer = PronunciationScorer([('A', f"ah{chr(97 + i)}", 'sound') for i in range(20)], shortlist=4)
+    assert scorer._shortlist(["xyz"]).size == 0
+    assert scorer.rank("xyz") == []
+    assert [m.text for m in scorer.rank("ahk", top_k=1)] == ["ahk"]
@@ -0,0 +1,41 @@
+import asyncio
+
+from progress_store import ProgressStore
+
+
+def test_pending_writes_are_visible_before_and_after_flush(tmp_path):
+    async def scenario():
+        store = ProgressStore(str(tmp_path / "progress.db"))
+        for i in range(4):
+            store.record_exchange("ann", f"say {i}", f"reply {i}")
+        store.record_attempt("ann", "b", True)
+        store.record_attempt("ann", "B", False)
+        store.record_attempt("omar", "B", True)
+
+        pending = store.load_child("ann")
+        await store.flush()
+        flushed = store.load_child("ann")
+        await store.close()
+        return pending, flushed
+
+    pending, flushed = asyncio.run(scenario())
+    for history in (pending, flushed):
+        assert [e['user'] for e in history['exchanges']] == ["say 1", "say 2", "say 3"]
+        assert history['letters']['B']['attempts'] == 2
+        assert history['letters']['B']['correct'] == 1
+
+
+def test_close_persists_for_the_next_process(tmp_path):
+    path = str(tmp_path / "progress.db")
+
+    async def write():
+        store = ProgressStore(path).start()
+        store.record_exchange("ann", "buh", "Great job!")
+        store.record_attempt("ann", "B", True)
+        await store.close()
+
+    asyncio.run(write())
+    reader = ProgressStore(path)
+    assert reader.letter_progress("ann", "b")['correct'] == 1
+    assert reader.load_child("ann")['exchanges'][0]['assistant'] == "Great job!"
+    asyncio.run(reader.close())
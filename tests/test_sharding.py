@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from sharding import HashRing, SessionDirectory
+
+
+def test_hash_ring_is_deterministic_and_spreads_keys():
+    nodes = [f"worker-{i}" for i in range(4)]
+    keys = [f"room-{i}" for i in range(4000)]
+    ring = HashRing(nodes)
+    owners = [ring.node_for(key) for key in keys]
+    assert owners == [HashRing(list(reversed(nodes))).node_for(key) for key in keys]
+    counts = {node: owners.count(node) for node in nodes}
+    assert min(counts.values()) > 0.7 * len(keys) / len(nodes)
+
+
+def test_removing_a_node_moves_only_its_keys():
+    nodes = [f"worker-{i}" for i in range(5)]
+    keys = [f"room-{i}" for i in range(5000)]
+    before = HashRing(nodes)
+    after = HashRing(nodes[:-1])
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    assert all(before.node_for(key) == "worker-4" for key in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.3  # about 1/N
+
+
+def test_hash_ring_needs_a_node():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_update_is_written_by_the_writer_thread(tmp_path):
+    directory = SessionDirectory(str(tmp_path / "sessions.db"), worker=3)
+    writers = []
+    flush = directory.flush
+    directory.flush = lambda: (writers.append(threading.current_thread().name), flush())
+    directory.update("room-1", {'active': True, 'room_name': "room-1"})
+    directory._writer.shutdown(wait=True)
+    assert writers and writers[0].startswith("session-directory")
+    assert directory.get("room-1")['worker'] == 3
+
+
+def test_close_writes_queued_updates(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    directory = SessionDirectory(path, worker=0)
+    directory.update("room-1", {'active': True})
+    directory.update("room-2", {'active': True})
+    directory.update("room-1", None)
+    directory.close()
+    reader = SessionDirectory(path, worker=1)
+    assert [row['session_id'] for row in reader.list()] == ["room-2"]
+    reader.close()
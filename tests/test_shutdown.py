@@ -0,0 +1,36 @@
+import sqlite3
+
+from conftest import STUB_ROOMS, run_script
+
+# Starts a session on the Flask server's background loop, records a turn and
+# exits without stopping anything, as a killed dev server or `python server.py` does
+EXIT_WITH_ACTIVE_SESSION = STUB_ROOMS + """
+assert server.background_loop.run(server.session_manager.start_session("exit-test", {"name": "Ann", "id": "ann"}))
+session = server.session_manager.get("exit-test")
+session.assistant.memory.add_exchange("hello", "hi Ann")
+server.background_loop.run(session._say_text("Hi Ann, let's practise the letter A"))
+"""
+
+
+def run_and_exit(tmp_path):
+    result = run_script(EXIT_WITH_ACTIVE_SESSION, tmp_path, TTS_PROVIDERS="elevenlabs", ELEVEN_API_KEY="")
+    assert "Error during shutdown" not in result.stdout, result.stdout
+    return result
+
+
+def count_rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_exit_with_active_session_flushes_progress(tmp_path):
+    run_and_exit(tmp_path)
+    assert count_rows(tmp_path / "progress.db", "exchanges") == 1
+
+
+def test_exit_with_active_session_flushes_transcript(tmp_path):
+    run_and_exit(tmp_path)
+    assert count_rows(tmp_path / "transcripts.db", "messages") == 1
@@ -0,0 +1,49 @@
+import tokens
+from tokens import TokenGrants, TokenService
+
+
+def service(**kwargs):
+    return TokenService(api_key="devkey", api_secret="s" * 32, **kwargs)
+
+
+def test_cached_token_is_reused_until_the_refresh_margin(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(tokens.time, "time", lambda: clock[0])
+    tokens_ = service(ttl=3600, refresh_margin=600)
+
+    first = tokens_.issue("student-1", "room-a")
+    assert tokens_.issue("student-1", "room-a") is first
+    assert tokens_.stats == {'hits': 1, 'minted': 1}
+
+    clock[0] = first.expires_at - 601
+    assert tokens_.issue("student-1", "room-a") is first
+    clock[0] = first.expires_at - 600
+    refreshed = tokens_.issue("student-1", "room-a")
+    assert refreshed is not first and refreshed.expires_at == clock[0] + 3600
+    assert tokens_.stats['minted'] == 2
+
+
+def test_identity_room_and_grants_get_separate_tokens():
+    tokens_ = service()
+    base = tokens_.issue("student-1", "room-a")
+    others = [
+        tokens_.issue("student-2", "room-a"),
+        tokens_.issue("student-1", "room-b"),
+        tokens_.issue("student-1", "room-a", TokenGrants(can_publish=False)),
+        tokens_.issue("student-1", "room-a", name="Ada"),
+    ]
+    assert len({base.token, *(t.token for t in others)}) == 5
+    assert [(t.identity, t.room) for t in others[:2]] == [("student-2", "room-a"), ("student-1", "room-b")]
+    assert tokens_.stats == {'hits': 0, 'minted': 5}
+
+
+def test_cache_is_bounded_lru():
+    tokens_ = service(max_entries=2)
+    a = tokens_.issue("a", "room")
+    tokens_.issue("b", "room")
+    assert tokens_.issue("a", "room") is a  # refreshes a's recency
+    tokens_.issue("c", "room")  # evicts b
+    assert tokens_.get_stats()['cached'] == 2
+    assert tokens_.issue("a", "room") is a
+    tokens_.issue("b", "room")
+    assert tokens_.stats['minted'] == 4
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import tts
+from tts import CircuitBreaker, TTSError, TTSProvider, TTSRouter, split_speakable
+
+
+class FakeProvider(TTSProvider):
+    """Sends `chunks` after `delay` seconds, or raises `error` instead"""
+
+    def __init__(self, name, delay=0.0, chunks=(b"\x00\x00",), error=None):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.chunks = chunks
+        self.error = error
+        self.cancelled = False
+
+    def available(self):
+        return True
+
+    async def stream(self, text, trace=None):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        for chunk in self.chunks:
+            yield chunk
+
+
+def collect(router, text="Hello"):
+    async def run():
+        return [chunk async for chunk in router.stream(text)]
+    return asyncio.run(run())
+
+
+def test_breaker_opens_then_lets_one_trial_through(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(tts.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failures=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.acquire()
+
+    clock[0] += 30
+    assert breaker.ready()
+    assert breaker.acquire() and breaker.state == "half_open"
+    assert not breaker.acquire()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.ready()
+
+    clock[0] += 30
+    assert breaker.acquire()
+    breaker.release()  # abandoned trial: the next request may try again at once
+    assert breaker.state == "open" and breaker.ready()
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_slow_provider_is_hedged_and_the_loser_cancelled():
+    slow = FakeProvider("slow", delay=2.0, chunks=(b"slow",))
+    fast = FakeProvider("fast", chunks=(b"fa", b"st"))
+    slow.latencies.extend([0.01] * tts.MIN_LATENCY_SAMPLES)  # hedge after TTS_HEDGE_MIN_MS
+    router = TTSRouter([slow, fast])
+
+    assert collect(router) == [b"fa", b"st"]
+    assert slow.cancelled
+    assert fast.stats['hedges'] == 1 and fast.stats['wins'] == 1
+    assert slow.stats['wins'] == 0 and slow.breaker.state == "closed"
+    assert slow.stats['abandoned'] == 1
+    assert list(slow.latencies) == [0.01] * tts.MIN_LATENCY_SAMPLES  # losing is not a latency sample
+
+
+def test_failure_before_audio_fails_over_and_counts_against_the_breaker():
+    broken = FakeProvider("broken", error=TTSError("HTTP 500"))
+    backup = FakeProvider("backup", chunks=(b"ok",))
+    router = TTSRouter([broken, backup])
+
+    assert collect(router) == [b"ok"]
+    assert broken.stats['failures'] == 1 and broken.breaker.failures == 1
+    assert router.ranked()[0] is backup  # the failure lowered its score
+
+
+def test_providers_must_implement_the_interface():
+    class Incomplete(TTSProvider):
+        def available(self):
+            return True
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_failure_mid_stream_raises():
+    class Truncated(FakeProvider):
+        async def stream(self, text, trace=None):
+            yield b"half"
+            raise TTSError("connection reset")
+
+    with pytest.raises(TTSError):
+        collect(TTSRouter([Truncated("truncated")]))
+
+
+def test_split_speakable_keeps_short_sentences_whole():
+    assert split_speakable("Great job!  Now say the sound of B. Ready?") == [
+        "Great job!", "Now say the sound of B.", "Ready?"]
+    assert split_speakable("   ") == []
+
+
+def test_split_speakable_packs_long_sentences_by_clause_then_word():
+    text = "First we look at the letter, then we say its sound, and then we find a word with it."
+    chunks = split_speakable(text, max_words=8)
+    assert chunks == ["First we look at the letter,", "then we say its sound,",
+                      "and then we find a word with it."]
+    long_clause = " ".join(f"w{i}" for i in range(7))
+    assert split_speakable(long_clause, max_words=3) == ["w0 w1 w2", "w3 w4 w5", "w6"]
+    assert all(len(c.split()) <= 8 for c in chunks)
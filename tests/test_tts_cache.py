@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+from tts_cache import TTSCache
+
+
+def test_disk_tier_evicts_least_recently_used_past_its_cap(tmp_path):
+    cache = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=3000)
+    keys = [TTSCache.make_key(f"phrase {i}", "voice", "model", {}) for i in range(3)]
+
+    async def run():
+        for i, key in enumerate(keys[:2]):
+            await cache.put(key, b"\x01" * 1000)
+            os.utime(cache._disk_path(key), (i, i))  # keys[0] is the older file
+        assert await cache.get(keys[0]) is not None  # a hit makes keys[0] the newest
+        await cache.put(keys[2], b"\x02" * 1500)
+
+    asyncio.run(run())
+    assert os.path.exists(cache._disk_path(keys[0]))
+    assert not os.path.exists(cache._disk_path(keys[1]))
+    assert os.path.exists(cache._disk_path(keys[2]))
+    stats = cache.get_stats()
+    assert stats['disk_evictions'] == 1 and stats['disk_bytes'] == 2500
+
+
+def test_disk_total_counts_files_already_there(tmp_path):
+    first = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path))
+    asyncio.run(first.put("a" * 64, b"\x00" * 800))
+    second = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1000)
+    asyncio.run(second.put("b" * 64, b"\x00" * 800))
+    assert second.get_stats()['disk_bytes'] <= 900
+    assert len(list(tmp_path.glob("*/*.pcm"))) == 1
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from livekit.api import AccessToken, VideoGrants
+
+
+TOKEN_TTL = int(os.environ.get("LIVEKIT_TOKEN_TTL", "21600"))  # seconds a room token is valid (6 h)
+TOKEN_REFRESH_MARGIN = int(os.environ.get("LIVEKIT_TOKEN_REFRESH_MARGIN", "600"))  # reissue this long before expiry
+MAX_CACHED_TOKENS = int(os.environ.get("MAX_CACHED_TOKENS", "20000"))
+MAX_BULK_TOKENS = int(os.environ.get("MAX_BULK_TOKENS", "100"))  # per /get_tokens request
+
+
+class TokenGrants(NamedTuple):
+    can_publish: bool = True
+    can_subscribe: bool = True
+    can_publish_data: bool = True
+
+
+PARTICIPANT_GRANTS = TokenGrants()
+
+
+class IssuedToken(NamedTuple):
+    identity: str
+    room: str
+    token: str
+    expires_at: float  # unix time
+
+
+class TokenService:
+    """Mints LiveKit room tokens and reuses them until shortly before they expire
+
+    Tokens are cached per (identity, name, room, grants), so a child who
+    reloads the page, or a class that logs in together, costs one JWT
+    signature per participant per TTL rather than one per request. A
+    repeat request gets the same token back, not a fresh one, until it is
+    within refresh_margin of expiry; a token is never shared between
+    identities, rooms or grant sets. The cache is a bounded LRU and is
+    safe to use from Flask threads and the event loop at once.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None,
+                 ttl: int = TOKEN_TTL, refresh_margin: int = TOKEN_REFRESH_MARGIN,
+                 max_entries: int = MAX_CACHED_TOKENS):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, IssuedToken]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'minted': 0}
+
+    def _credentials(self) -> Tuple[str, str]:
+        """LiveKit API key and secret, read from the environment once"""
+        if self.api_key is None or self.api_secret is None:
+            self.api_key = os.environ["LIVEKIT_API_KEY"]
+            self.api_secret = os.environ["LIVEKIT_API_SECRET"]
+        return self.api_key, self.api_secret
+
+    def _mint(self, identity: str, name: str, room: str, grants: TokenGrants) -> IssuedToken:
+        api_key, api_secret = self._credentials()
+        # Taken before signing, so the cached expiry is never later than the token's own
+        expires_at = time.time() + self.ttl
+        token = (
+            AccessToken(api_key=api_key, api_secret=api_secret)
+            .with_identity(identity)
+            .with_name(name)
+            .with_ttl(timedelta(seconds=self.ttl))
+            .with_grants(VideoGrants(room_join=True, room=room, **grants._asdict()))
+            .to_jwt()
+        )
+        return IssuedToken(identity, room, token, expires_at)
+
+    def issue(self, identity: str, room: str, grants: TokenGrants = PARTICIPANT_GRANTS,
+              name: Optional[str] = None) -> IssuedToken:
+        """A token for identity to join room, from the cache while it has enough life left"""
+        name = name or identity
+        key = (identity, name, room, grants)
+        now = time.time()
+        with self._lock:
+            issued = self._cache.get(key)
+            if issued is not None and issued.expires_at - self.refresh_margin > now:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return issued
+        issued = self._mint(identity, name, room, grants)
+        with self._lock:
+            self._cache[key] = issued
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self.stats['minted'] += 1
+        return issued
+
+    def issue_many(self, participants: Iterable[Tuple[str, str, Optional[str]]],
+                   grants: TokenGrants = PARTICIPANT_GRANTS) -> List[IssuedToken]:
+        """Tokens for (identity, room, name) triples, e.g. a whole classroom at once"""
+        return [self.issue(identity, room, grants, name) for identity, room, name in participants]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, 'cached': len(self._cache)}
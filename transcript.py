@@ -0,0 +1,198 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+
+TRANSCRIPT_LIVE_SIZE = int(os.environ.get("TRANSCRIPT_LIVE_SIZE", "50"))  # messages kept in memory per session
+MAX_MESSAGES_PAGE = 200  # most messages one /messages call returns
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class TranscriptStore:
+    """Append-only log of every tutor message, per session, in SQLite
+
+    Built like ProgressStore: appends are buffered and written in batches
+    by one writer thread, so speaking never waits on disk. Rows are keyed
+    by (session_id, seq), so a cursor read is one index range scan over
+    just the new rows. Reads merge in whatever is still waiting to be
+    flushed.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 1.0, batch_size: int = 500):
+        self.path = path or os.environ.get("TRANSCRIPT_DB_PATH", "tutor_transcripts.db")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-writer")
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._pending: List[Tuple[str, int, str, str]] = []
+        self._inflight: List[Tuple[str, int, str, str]] = []  # batch being written right now
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {'flushes': 0, 'rows_written': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Start the write-behind flush loop on the running event loop"""
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        return self
+
+    def append(self, session_id: str, entry: Dict[str, Any]):
+        """Queue one message ({'seq', 'timestamp', 'text'}) for writing"""
+        self._pending.append((session_id, entry['seq'], entry['timestamp'], entry['text']))
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing transcripts: {str(e)}")
+
+    async def flush(self):
+        """Write everything queued so far in one transaction off the event loop"""
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        self._inflight = rows
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._writer, self._write_batch, rows)
+        except Exception:
+            # Keep the batch for the next flush rather than dropping it
+            self._pending = rows + self._pending
+            raise
+        finally:
+            self._inflight = []
+
+    def _write_batch(self, rows):
+        conn = self._write_conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages (session_id, seq, timestamp, text) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(rows)
+
+    def _unflushed(self, session_id: str) -> List[Tuple[str, int, str, str]]:
+        return [row for row in self._inflight + self._pending if row[0] == session_id]
+
+    def last_seq(self, session_id: str) -> int:
+        """Highest sequence number logged for a session, so a restarted session continues it"""
+        with self._read_lock:
+            (seq,) = self._read_conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return max([seq] + [row[1] for row in self._unflushed(session_id)])
+
+    def read(self, session_id: str, after: int = 0, limit: int = MAX_MESSAGES_PAGE) -> List[Dict[str, Any]]:
+        """Messages with seq > after, oldest first"""
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT seq, timestamp, text FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (session_id, after, limit),
+            ).fetchall()
+        entries = [{'seq': seq, 'timestamp': ts, 'text': text} for seq, ts, text in rows]
+        if len(entries) < limit:
+            last = entries[-1]['seq'] if entries else after
+            entries += [{'seq': seq, 'timestamp': ts, 'text': text}
+                        for _, seq, ts, text in self._unflushed(session_id) if seq > last][:limit - len(entries)]
+        return entries
+
+    async def close(self):
+        """Flush outstanding writes and close both connections
+
+        As in ProgressStore, the last batch is written on the calling
+        thread, since close() may run after executors stopped taking work.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self._writer.shutdown(wait=True)
+        if self._pending:
+            rows, self._pending = self._pending, []
+            self._write_batch(rows)
+        self._write_conn.close()
+        self._read_conn.close()
+
+
+class TranscriptLog:
+    """One session's messages: a bounded ring for the live view over the full store
+
+    Sequence numbers are contiguous, so the entries after a cursor that is
+    still inside the ring are found by arithmetic rather than a scan, and
+    only older cursors go to the store.
+    """
+
+    def __init__(self, session_id: str, store: Optional[TranscriptStore] = None,
+                 live_size: int = TRANSCRIPT_LIVE_SIZE):
+        self.session_id = session_id
+        self.store = store
+        self._ring: "deque[Dict[str, Any]]" = deque(maxlen=live_size)
+        self.last_seq = store.last_seq(session_id) if store is not None else 0
+
+    def append(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Log one message ({'text', 'timestamp'}); returns it with its seq"""
+        self.last_seq += 1
+        entry = {'seq': self.last_seq, **message}
+        self._ring.append(entry)
+        if self.store is not None:
+            self.store.append(self.session_id, entry)
+        return entry
+
+    def recent(self, count: int) -> List[Dict[str, Any]]:
+        """The last count messages, oldest first"""
+        start = max(0, len(self._ring) - count)
+        return list(islice(self._ring, start, None))
+
+    def after(self, cursor: int, limit: int = MAX_MESSAGES_PAGE) -> List[Dict[str, Any]]:
+        """Messages with seq > cursor, oldest first"""
+        if cursor >= self.last_seq:
+            return []
+        oldest = self._ring[0]['seq'] if self._ring else self.last_seq + 1
+        if cursor >= oldest - 1 or self.store is None:
+            start = max(0, cursor - oldest + 1)
+            return list(islice(self._ring, start, start + limit))
+        entries = self.store.read(self.session_id, cursor, limit)
+        if len(entries) < limit:
+            last = entries[-1]['seq'] if entries else cursor
+            if last >= oldest - 1:
+                start = last - oldest + 1
+                entries += list(islice(self._ring, start, start + limit - len(entries)))
+        return entries
@@ -0,0 +1,442 @@
+"""
+Text-to-speech providers behind one router.
+
+Every provider streams raw 16 kHz mono PCM16. The router ranks the
+providers by recent first-byte latency and error rate and sends the
+request to the best one. If no audio has arrived by that provider's p95
+first-byte time, it also sends the request to the next provider (a
+hedge) and plays whichever answers first. A provider that fails
+repeatedly has its circuit breaker opened: it is skipped for a cooldown,
+then given a single trial request.
+
+    TTS_PROVIDERS=elevenlabs,azure,local   # candidates, in order of preference
+"""
+import abc
+import asyncio
+import contextlib
+import os
+import re
+import shutil
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+import httpx
+
+from audio import decode_to_pcm16, pcm_bytes
+from metrics import TTS_BREAKER_OPEN, TTS_ERRORS, TTS_FIRST_BYTE_SECONDS, TTS_HEDGES, TurnTrace
+
+
+ELEVENLABS_API_URL = os.environ.get("ELEVENLABS_API_URL", "https://api.elevenlabs.io").rstrip("/")
+ELEVENLABS_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice
+ELEVENLABS_MODEL_ID = "eleven_monolingual_v1"
+ELEVENLABS_OUTPUT_FORMAT = "pcm_16000"  # raw PCM16 so chunks can be played as they arrive
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5
+}
+
+AZURE_SPEECH_REGION = os.environ.get("AZURE_SPEECH_REGION", "eastus")
+AZURE_SPEECH_VOICE = os.environ.get("AZURE_SPEECH_VOICE", "en-US-AnaNeural")  # child voice
+AZURE_OUTPUT_FORMAT = "raw-16khz-16bit-mono-pcm"
+
+TTS_PROVIDERS = os.environ.get("TTS_PROVIDERS", "elevenlabs,azure,local")
+TTS_HEDGE_PERCENTILE = float(os.environ.get("TTS_HEDGE_PERCENTILE", "95"))
+TTS_HEDGE_DEFAULT_MS = float(os.environ.get("TTS_HEDGE_DEFAULT_MS", "800"))  # until a provider has samples
+TTS_HEDGE_MIN_MS = float(os.environ.get("TTS_HEDGE_MIN_MS", "150"))
+TTS_HEDGE_MAX_MS = float(os.environ.get("TTS_HEDGE_MAX_MS", "2000"))
+TTS_MAX_HEDGES = int(os.environ.get("TTS_MAX_HEDGES", "1"))  # extra providers raced per request
+TTS_BREAKER_FAILURES = int(os.environ.get("TTS_BREAKER_FAILURES", "3"))  # consecutive failures to open
+TTS_BREAKER_COOLDOWN = float(os.environ.get("TTS_BREAKER_COOLDOWN", "30"))  # seconds before a trial request
+TTS_CHUNK_WORDS = int(os.environ.get("TTS_CHUNK_WORDS", "10"))  # longest chunk a reply is split into
+TTS_CHUNK_CONCURRENCY = int(os.environ.get("TTS_CHUNK_CONCURRENCY", "3"))  # chunks synthesized at once
+TTS_LATENCY_WINDOW = 200  # first-byte samples kept per provider
+MIN_LATENCY_SAMPLES = 5  # below this the default deadline is used
+
+_DONE = object()
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+
+
+def split_speakable(text: str, max_words: int = TTS_CHUNK_WORDS) -> List[str]:
+    """Split a reply into sentence-sized chunks of at most max_words, for pipelined synthesis.
+
+    Sentences are kept whole when they fit; longer ones are packed clause
+    by clause, and only a single clause longer than max_words is cut
+    between words.
+    """
+    chunks = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if not sentence:
+            continue
+        if len(sentence.split()) <= max_words:
+            chunks.append(sentence)
+            continue
+        current: List[str] = []
+        for clause in _CLAUSE_END.split(sentence):
+            words = clause.split()
+            if current and len(current) + len(words) > max_words:
+                chunks.append(" ".join(current))
+                current = []
+            while len(words) > max_words:
+                chunks.append(" ".join(words[:max_words]))
+                words = words[max_words:]
+            current.extend(words)
+        if current:
+            chunks.append(" ".join(current))
+    return chunks
+
+
+class TTSError(Exception):
+    """A provider failed to produce audio"""
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half-open trial after a cooldown"""
+
+    def __init__(self, failures: int = TTS_BREAKER_FAILURES, cooldown: float = TTS_BREAKER_COOLDOWN):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def ready(self) -> bool:
+        """Whether a request could be sent now (without claiming the half-open trial)"""
+        if self.state == "closed":
+            return True
+        return self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown
+
+    def acquire(self) -> bool:
+        """Claim permission to send a request; only one trial is let through while half-open"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The request was abandoned without an outcome; let the next one be the trial"""
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.cooldown
+
+
+class TTSProvider(abc.ABC):
+    """A TTS backend, with the latency and error history the router ranks it by"""
+    name = ""
+    last_resort = False  # only used when every other provider is unavailable
+    # Whether its audio may be cached: cache keys are built from the ElevenLabs voice settings,
+    # so audio from any other voice would be replayed in place of the real one
+    cacheable = False
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latencies: "deque[float]" = deque(maxlen=TTS_LATENCY_WINDOW)
+        self.success_rate = 1.0  # exponentially weighted
+        self.stats = {'requests': 0, 'failures': 0, 'wins': 0, 'hedges': 0, 'abandoned': 0}
+
+    @abc.abstractmethod
+    def available(self) -> bool:
+        """Whether the provider is configured on this host"""
+
+    @abc.abstractmethod
+    def stream(self, text: str, trace: Optional[TurnTrace] = None) -> AsyncIterator[bytes]:
+        """Raw 16 kHz mono PCM16 for text, as it is synthesized; raises TTSError on failure"""
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """First-byte latency percentile in seconds, once there are enough samples"""
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for first audio before racing the next provider"""
+        p = self.percentile(TTS_HEDGE_PERCENTILE)
+        delay = p if p is not None else TTS_HEDGE_DEFAULT_MS / 1000
+        return min(max(delay, TTS_HEDGE_MIN_MS / 1000), TTS_HEDGE_MAX_MS / 1000)
+
+    def score(self) -> float:
+        """Expected seconds to first audio, inflated by the recent error rate; lower is better"""
+        return self.hedge_delay() / max(self.success_rate, 0.05)
+
+    def record_first_byte(self, seconds: float):
+        self.latencies.append(seconds)
+        self.success_rate = 0.9 * self.success_rate + 0.1
+        self.breaker.record_success()
+        TTS_FIRST_BYTE_SECONDS.observe(seconds, provider=self.name)
+        TTS_BREAKER_OPEN.set(0, provider=self.name)
+
+    def record_abandoned(self):
+        """Lost a hedge race and was cancelled before its first audio.
+
+        Only counted: the time it had run is not a first-byte latency, so
+        it stays out of the samples the hedge delay is computed from.
+        """
+        self.stats['abandoned'] += 1
+        self.breaker.release()
+
+    def record_failure(self, error: Exception):
+        self.success_rate *= 0.9
+        self.stats['failures'] += 1
+        self.breaker.record_failure()
+        TTS_ERRORS.inc(provider=self.name)
+        TTS_BREAKER_OPEN.set(1 if self.breaker.state == "open" else 0, provider=self.name)
+        print(f"Error with {self.name} TTS: {str(error)}")
+
+    def get_stats(self) -> Dict[str, object]:
+        p95 = self.percentile(95)
+        return {
+            **self.stats,
+            'breaker': self.breaker.state,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'success_rate': round(self.success_rate, 3),
+        }
+
+
+class ElevenLabsProvider(TTSProvider):
+    """ElevenLabs streaming API, asked for raw PCM16 directly"""
+    name = "elevenlabs"
+    cacheable = True
+
+    def __init__(self, client_factory: Callable[[], httpx.AsyncClient], timeout: Optional[httpx.Timeout] = None):
+        super().__init__()
+        self.client_factory = client_factory
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return bool(os.environ.get("ELEVEN_API_KEY"))
+
+    async def stream(self, text: str, trace: Optional[TurnTrace] = None) -> AsyncIterator[bytes]:
+        url = f"{ELEVENLABS_API_URL}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}/stream"
+        headers = {"Content-Type": "application/json", "xi-api-key": os.environ.get("ELEVEN_API_KEY", "")}
+        data = {"text": text, "model_id": ELEVENLABS_MODEL_ID, "voice_settings": ELEVENLABS_VOICE_SETTINGS}
+        async with self.client_factory().stream("POST", url, params={"output_format": ELEVENLABS_OUTPUT_FORMAT},
+                                                json=data, headers=headers, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise TTSError(f"API error {response.status_code} - {body[:200]!r}")
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+
+class AzureProvider(TTSProvider):
+    """Azure Speech REST API (AZURE_SPEECH_KEY / AZURE_SPEECH_REGION), raw PCM16 output"""
+    name = "azure"
+
+    def __init__(self, client_factory: Callable[[], httpx.AsyncClient], timeout: Optional[httpx.Timeout] = None):
+        super().__init__()
+        self.client_factory = client_factory
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return bool(os.environ.get("AZURE_SPEECH_KEY"))
+
+    async def stream(self, text: str, trace: Optional[TurnTrace] = None) -> AsyncIterator[bytes]:
+        url = os.environ.get("AZURE_SPEECH_URL") or \
+            f"https://{AZURE_SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+        headers = {
+            "Ocp-Apim-Subscription-Key": os.environ.get("AZURE_SPEECH_KEY", ""),
+            "Content-Type": "application/ssml+xml",
+            "X-Microsoft-OutputFormat": AZURE_OUTPUT_FORMAT,
+            "User-Agent": "phonics-tutor",
+        }
+        ssml = (f"<speak version='1.0' xml:lang='en-US'><voice name='{AZURE_SPEECH_VOICE}'>"
+                f"{escape(text)}</voice></speak>")
+        async with self.client_factory().stream("POST", url, content=ssml.encode("utf-8"),
+                                                headers=headers, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise TTSError(f"API error {response.status_code} - {body[:200]!r}")
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+
+class LocalProvider(TTSProvider):
+    """Offline speech from espeak-ng (or espeak) on this host: robotic, but needs no network"""
+    name = "local"
+    last_resort = True
+
+    def __init__(self, binary: Optional[str] = None):
+        super().__init__()
+        self.binary = binary or shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self) -> bool:
+        return self.binary is not None
+
+    async def stream(self, text: str, trace: Optional[TurnTrace] = None) -> AsyncIterator[bytes]:
+        process = await asyncio.create_subprocess_exec(
+            self.binary, "--stdout", "-s", "140",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            wav, _ = await process.communicate(text.encode("utf-8"))
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if process.returncode != 0 or not wav:
+            raise TTSError(f"{os.path.basename(self.binary)} exited with {process.returncode}")
+        with trace.span("decode") if trace else contextlib.nullcontext():
+            pcm = bytes(pcm_bytes(decode_to_pcm16(wav)))
+        yield pcm
+
+
+class _Attempt:
+    """One provider's request in flight, pumping its chunks into a queue"""
+
+    def __init__(self, provider: TTSProvider, text: str, trace: Optional[TurnTrace] = None):
+        self.provider = provider
+        self.started_at = time.perf_counter()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=32)
+        self.task = asyncio.ensure_future(self._pump(text, trace))
+        self.first = asyncio.ensure_future(self.queue.get())
+
+    async def _pump(self, text: str, trace: Optional[TurnTrace]):
+        try:
+            async for chunk in self.provider.stream(text, trace):
+                if chunk:
+                    await self.queue.put(chunk)
+            await self.queue.put(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.queue.put(e)
+
+    def cancel(self):
+        self.first.cancel()
+        self.task.cancel()
+
+
+class TTSRouter:
+    """Sends each utterance to the best-scoring provider, hedging to the next when it is slow"""
+
+    def __init__(self, providers: List[TTSProvider], max_hedges: int = TTS_MAX_HEDGES):
+        self.providers = providers
+        self.max_hedges = max_hedges
+
+    @classmethod
+    def from_env(cls, client_factory: Callable[[], httpx.AsyncClient],
+                 timeout: Optional[httpx.Timeout] = None) -> "TTSRouter":
+        """The providers named in TTS_PROVIDERS, in that order of preference"""
+        factories = {
+            'elevenlabs': lambda: ElevenLabsProvider(client_factory, timeout),
+            'azure': lambda: AzureProvider(client_factory, timeout),
+            'local': LocalProvider,
+        }
+        providers = []
+        for name in TTS_PROVIDERS.split(","):
+            name = name.strip().lower()
+            if name in factories:
+                providers.append(factories[name]())
+            elif name:
+                print(f"Unknown TTS provider {name!r} in TTS_PROVIDERS, ignoring")
+        return cls(providers)
+
+    def ranked(self) -> List[TTSProvider]:
+        """Usable providers, best first: configured order breaks ties until there is latency data"""
+        usable = [(i, p) for i, p in enumerate(self.providers) if p.available() and p.breaker.ready()]
+        usable.sort(key=lambda item: (item[1].last_resort, item[1].score(), item[0]))
+        return [p for _, p in usable]
+
+    async def stream(self, text: str, trace: Optional[TurnTrace] = None,
+                     on_provider: Optional[Callable[[TTSProvider], None]] = None) -> AsyncIterator[bytes]:
+        """PCM16 chunks for text from whichever provider answers first.
+
+        on_provider is called with that provider before its first chunk is
+        yielded. Yields nothing when every provider is unavailable or fails
+        before any audio; raises TTSError if the chosen provider fails
+        mid-stream.
+        """
+        candidates = self.ranked()
+        if trace:
+            trace.mark("tts_request")
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        first_chunk = None
+        hedges = 0
+        deadline = 0.0
+
+        def launch() -> bool:
+            nonlocal deadline
+            while candidates:
+                provider = candidates.pop(0)
+                if provider.breaker.acquire():
+                    provider.stats['requests'] += 1
+                    attempts.append(_Attempt(provider, text, trace))
+                    deadline = time.perf_counter() + provider.hedge_delay()
+                    return True
+            return False
+
+        try:
+            launch()
+            while winner is None and attempts:
+                can_hedge = bool(candidates) and hedges < self.max_hedges
+                timeout = max(0.0, deadline - time.perf_counter()) if can_hedge else None
+                done, _ = await asyncio.wait([a.first for a in attempts], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The first audio is later than this provider's p95: race the next one
+                    if launch():
+                        hedges += 1
+                        attempts[-1].provider.stats['hedges'] += 1
+                        TTS_HEDGES.inc(provider=attempts[-1].provider.name)
+                    continue
+                for attempt in list(attempts):
+                    if attempt.first not in done:
+                        continue
+                    item = attempt.first.result()
+                    if isinstance(item, bytes):
+                        winner, first_chunk = attempt, item
+                        break
+                    attempts.remove(attempt)
+                    attempt.provider.record_failure(item if isinstance(item, Exception) else TTSError("no audio"))
+                    if not attempts:
+                        launch()  # failed before the deadline: fail over at once
+            if winner is None:
+                if not self.providers or not any(p.available() for p in self.providers):
+                    print("No TTS provider configured")
+                return
+
+            elapsed = time.perf_counter() - winner.started_at
+            winner.provider.record_first_byte(elapsed)
+            winner.provider.stats['wins'] += 1
+            if trace:
+                trace.mark("tts_first_byte")
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+                    attempt.provider.record_abandoned()
+            attempts = [winner]
+            if on_provider is not None:
+                on_provider(winner.provider)
+
+            yield first_chunk
+            while True:
+                item = await winner.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    winner.provider.record_failure(item)
+                    raise TTSError(f"{winner.provider.name} failed mid-stream: {str(item)}")
+                yield item
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if winner is None:
+                for attempt in attempts:
+                    attempt.provider.breaker.release()
+
+    def get_stats(self) -> Dict[str, Dict[str, object]]:
+        return {p.name: {**p.get_stats(), 'available': p.available()} for p in self.providers}
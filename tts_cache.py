@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+DISK_LOW_WATER = 0.9  # an over-full disk tier is trimmed to this fraction of its cap
+
+
+class TTSCache:
+    """Content-addressed cache of decoded TTS audio (PCM16 mono)
+
+    Entries are keyed by a hash of everything that changes the rendered
+    audio: the text, voice, model and voice settings. Lookups hit a
+    bounded in-memory LRU first and then an on-disk store, so a repeated
+    utterance skips both the HTTP round trip and the decode. The disk
+    store is bounded too: a hit refreshes the file's mtime, and once the
+    files pass max_disk_bytes the least recently used are deleted.
+    """
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # counted on the first write
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "TTSCache":
+        """Build a cache from TTS_CACHE_MEMORY_MB, TTS_CACHE_DIR (empty disables disk) and TTS_CACHE_DISK_MB"""
+        memory_mb = float(os.environ.get("TTS_CACHE_MEMORY_MB", "64"))
+        disk_dir = os.environ.get("TTS_CACHE_DIR", ".tts_cache") or None
+        disk_mb = float(os.environ.get("TTS_CACHE_DISK_MB", "1024"))
+        return cls(max_memory_bytes=int(memory_mb * 1024 * 1024), disk_dir=disk_dir,
+                   max_disk_bytes=int(disk_mb * 1024 * 1024))
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: Dict[str, Any]) -> str:
+        """Stable key for one rendering of text"""
+        payload = json.dumps([text, voice_id, model_id, voice_settings], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pcm")
+
+    def _remember(self, key: str, pcm: bytes):
+        """Insert into the memory tier, evicting least recently used entries"""
+        if len(pcm) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._entries[key] = pcm
+            self._memory_bytes += len(pcm)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        """Memory-tier lookup; never touches the disk"""
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+            return pcm
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                pcm = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # recently used: evicted last
+        except OSError:
+            pass
+        return pcm
+
+    def _scan_disk(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every entry on disk"""
+        entries = []
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.pcm'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another worker sharing the directory
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        """Delete the least recently used files until the disk tier is under DISK_LOW_WATER of its cap"""
+        entries = sorted(self._scan_disk())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * DISK_LOW_WATER
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.stats['disk_evictions'] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    def _write_disk(self, key: str, pcm: bytes):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pcm)
+        os.replace(tmp_path, path)
+        with self._disk_lock:
+            # A running total between scans; other workers' writes show up at the next scan
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_bytes += len(pcm)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Look up decoded PCM, promoting disk hits into memory"""
+        pcm = self.get_memory(key)
+        if pcm is not None:
+            return pcm
+        if self.disk_dir:
+            pcm = await asyncio.to_thread(self._read_disk, key)
+            if pcm is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(key, pcm)
+                return pcm
+        self.stats['misses'] += 1
+        return None
+
+    async def put(self, key: str, pcm: bytes):
+        """Store decoded PCM in both tiers"""
+        if not pcm:
+            return
+        self._remember(key, pcm)
+        self.stats['stores'] += 1
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, pcm)
+            except OSError as e:
+                print(f"Error writing TTS cache entry: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current memory usage"""
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'memory_bytes': self._memory_bytes,
+            'max_memory_bytes': self.max_memory_bytes,
+            'disk_dir': self.disk_dir,
+            'disk_bytes': self._disk_bytes,
+            'max_disk_bytes': self.max_disk_bytes,
+        }
@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable, List, Optional
+
+from metrics import UTTERANCES_CANCELLED, TurnTrace
+
+
+PRIORITY_REPLY = 0  # answers to something the student just said
+PRIORITY_PROMPT = 1  # greetings and other unprompted speech
+
+
+class Utterance:
+    """One piece of tutor speech waiting in, or played from, an UtteranceQueue"""
+
+    def __init__(self, text: str, priority: int, epoch: int, trace: Optional[TurnTrace] = None):
+        self.text = text
+        self.priority = priority
+        self.epoch = epoch
+        self.trace = trace
+        self.done: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+
+    def finish(self, spoken: bool):
+        if not self.done.done():
+            self.done.set_result(spoken)
+
+    async def wait(self) -> bool:
+        """True once the utterance was spoken, False if it was cancelled or dropped"""
+        return await asyncio.shield(self.done)
+
+
+class UtteranceQueue:
+    """Speaks a session's utterances one at a time, highest priority first
+
+    A single worker task plays each utterance through `speak` (TTS and
+    playout), so two replies can never overlap. interrupt() is the
+    barge-in: it cancels the utterance being spoken, which aborts its TTS
+    request mid-stream, drops everything still queued, and flushes the
+    audio already buffered for playout. Every interrupt starts a new
+    epoch; an utterance produced for an older epoch (a reply to speech
+    the student has since talked over) is discarded instead of played.
+    """
+
+    def __init__(self, speak: Callable[[Utterance], Awaitable[None]], flush: Optional[Callable[[], int]] = None):
+        self.speak = speak
+        self.flush = flush
+        self.epoch = 0
+        self._heap: List[tuple] = []
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+        self.current: Optional[Utterance] = None
+        self.stats = {'spoken': 0, 'interrupted': 0, 'dropped': 0}
+
+    def start(self):
+        """Start the worker task on the running loop"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return self
+
+    def put(self, text: str, priority: int = PRIORITY_PROMPT, trace: Optional[TurnTrace] = None,
+            epoch: Optional[int] = None) -> Utterance:
+        """Queue text to be spoken; epoch is the one the caller's turn started in"""
+        utterance = Utterance(text, priority, self.epoch if epoch is None else epoch, trace)
+        if utterance.epoch < self.epoch:
+            self._drop(utterance, "stale")
+            return utterance
+        heapq.heappush(self._heap, (priority, next(self._order), utterance))
+        self._wakeup.set()
+        return utterance
+
+    def interrupt(self) -> int:
+        """Barge-in: stop speaking, drop the queue and buffered audio; returns the new epoch"""
+        self.epoch += 1
+        while self._heap:
+            self._drop(heapq.heappop(self._heap)[2], "queued")
+        if self._current is not None and not self._current.done():
+            self._current.cancel()
+            self.stats['interrupted'] += 1
+            UTTERANCES_CANCELLED.inc(state="speaking")
+        if self.flush is not None:
+            self.flush()
+        return self.epoch
+
+    def _drop(self, utterance: Utterance, state: str):
+        self.stats['dropped'] += 1
+        UTTERANCES_CANCELLED.inc(state=state)
+        utterance.finish(False)
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            utterance = heapq.heappop(self._heap)[2]
+            if utterance.epoch < self.epoch:
+                self._drop(utterance, "stale")
+                continue
+            self.current = utterance
+            self._current = asyncio.create_task(self.speak(utterance))
+            try:
+                # wait() rather than await: cancelling the utterance must not stop the worker
+                await asyncio.wait([self._current])
+                if self._current.cancelled():
+                    utterance.finish(False)
+                elif self._current.exception() is not None:
+                    print(f"Error speaking utterance: {str(self._current.exception())}")
+                    utterance.finish(False)
+                else:
+                    self.stats['spoken'] += 1
+                    utterance.finish(True)
+            finally:
+                self.current = None
+                self._current = None
+
+    async def close(self):
+        """Stop the worker and cancel anything queued or being spoken"""
+        self.epoch += 1
+        pending = [item[2] for item in self._heap]
+        self._heap.clear()
+        if self.current is not None:
+            pending.append(self.current)
+        for task in (self._current, self._worker):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        for utterance in pending:
+            utterance.finish(False)
+        self._worker = None
+
+    def get_stats(self):
+        return {**self.stats, 'queued': len(self._heap), 'speaking': self.current is not None}